@@ -0,0 +1,208 @@
+"""
+The abstract syntax tree (AST) of a Jack class.
+The CompilationEngine builds the tree while it parses a class, with the
+    variables already resolved into (segment, index) by the symbol tables.
+The optimization passes (see Passes) rewrite the tree, and the
+    CodeGenerator lowers it into VM code.
+Notes:
+    The nodes use __slots__, and their children are the slot values which are
+        nodes or lists of nodes (so that rewrite() can walk any tree).
+    Jack has no operator precedence: (a + b * c) is Binary('*', Binary('+', a, b), c).
+    The address of an array element, a[i], is the expression (i + a).
+    The statements and subroutines keep their (line, column) in the source
+        in pos, which is not a child (see position).
+"""
+
+# %% import libs
+
+from typing import Callable, List, Optional, Tuple, Union
+
+from MyTypes import SegmentType
+
+# %% base class
+
+class Node:
+    __slots__ = ("pos",)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(repr(getattr(self, name)) for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+# %% expressions
+
+class IntConst(Node):
+    __slots__ = ("value",)
+
+    def __init__(self, value: int):
+        self.value = value  # a 16-bit word (0..65535)
+
+
+class StrConst(Node):
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class KeywordConst(Node):
+    __slots__ = ("keyword",)
+
+    def __init__(self, keyword: str):
+        self.keyword = keyword  # true, false, null, this
+
+
+class Var(Node):
+    __slots__ = ("name", "segment", "index")
+
+    def __init__(self, name: str, segment: SegmentType, index: int):
+        self.name = name
+        self.segment = segment
+        self.index = index
+
+
+class ArrayRef(Node):
+    __slots__ = ("address",)
+
+    def __init__(self, address: Node):
+        self.address = address  # (subscript + array)
+
+
+class Call(Node):
+    __slots__ = ("name", "args")
+
+    def __init__(self, name: str, args: List[Node]):
+        self.name = name  # Xxx.yyy
+        self.args = args  # including the object of a method call
+
+
+class Unary(Node):
+    __slots__ = ("op", "operand")
+
+    def __init__(self, op: str, operand: Node):
+        self.op = op
+        self.operand = operand
+
+
+class Binary(Node):
+    __slots__ = ("op", "lhs", "rhs")
+
+    def __init__(self, op: str, lhs: Node, rhs: Node):
+        self.op = op
+        self.lhs = lhs
+        self.rhs = rhs
+
+# %% statements
+
+class Let(Node):
+    __slots__ = ("name", "segment", "index", "value")
+
+    def __init__(self, name: str, segment: SegmentType, index: int, value: Node):
+        # the variable is not a child node: it is assigned, not read
+        self.name = name
+        self.segment = segment
+        self.index = index
+        self.value = value
+
+
+class LetArray(Node):
+    __slots__ = ("address", "value")
+
+    def __init__(self, address: Node, value: Node):
+        self.address = address  # (subscript + array)
+        self.value = value
+
+
+class If(Node):
+    __slots__ = ("cond", "then", "orelse")
+
+    def __init__(self, cond: Node, then: List[Node], orelse: Optional[List[Node]]):
+        self.cond = cond
+        self.then = then
+        self.orelse = orelse  # None without an else clause
+
+
+class While(Node):
+    __slots__ = ("cond", "body")
+
+    def __init__(self, cond: Node, body: List[Node]):
+        self.cond = cond
+        self.body = body
+
+
+class Do(Node):
+    __slots__ = ("call",)
+
+    def __init__(self, call: Call):
+        self.call = call
+
+
+class Return(Node):
+    __slots__ = ("value",)
+
+    def __init__(self, value: Optional[Node]):
+        self.value = value  # None in a void subroutine
+
+# %% declarations
+
+class Subroutine(Node):
+    __slots__ = ("kind", "name", "n_vars", "body")
+
+    def __init__(self, kind: str, name: str, n_vars: int, body: List[Node]):
+        self.kind = kind  # constructor, function, method
+        self.name = name
+        self.n_vars = n_vars
+        self.body = body
+
+
+class Class(Node):
+    __slots__ = ("name", "n_fields", "subroutines")
+
+    def __init__(self, name: str, n_fields: int, subroutines: List[Subroutine]):
+        self.name = name
+        self.n_fields = n_fields
+        self.subroutines = subroutines
+
+def position(node: Node) -> Optional[Tuple[int, int]]:
+    '''Returns the (line, column) of a node in the source, if known.'''
+    return getattr(node, "pos", None)
+
+# %% tree rewriting
+
+Rewriter = Callable[[Node], Union[Node, List[Node], None]]
+
+
+def rewrite(node: Node, func: Rewriter) -> Union[Node, List[Node], None]:
+    '''Rewrites a tree bottom-up: the children of a node are rewritten first,
+    then the node is replaced by func(node).
+    In a list of nodes (e.g. statements), func may return a list of nodes
+        (spliced into the list) or None (the node is dropped).'''
+    for name in node.__slots__:
+        child = getattr(node, name)
+        if isinstance(child, Node):
+            setattr(node, name, rewrite(child, func))
+        elif isinstance(child, list):
+            setattr(node, name, rewrite_list(child, func))
+    return func(node)
+
+
+def rewrite_list(nodes: List[Node], func: Rewriter) -> List[Node]:
+    result = []
+    for node in nodes:
+        node = rewrite(node, func)
+        if isinstance(node, list):
+            result.extend(node)
+        elif node is not None:
+            result.append(node)
+    return result
+
+
+def walk(node: Node):
+    '''Yields the nodes of a tree (pre-order).'''
+    yield node
+    for name in node.__slots__:
+        child = getattr(node, name)
+        if isinstance(child, Node):
+            yield from walk(child)
+        elif isinstance(child, list):
+            for item in child:
+                yield from walk(item)
@@ -0,0 +1,138 @@
+"""
+Benchmarks the single-pass scanner of JackTokenizer against the previous
+multi-pass tokenizer (kept below as the reference implementation).
+Usage: python BenchTokenizer.py [jack file(s)] [--lines N] [--repeat R]
+"""
+
+# %% import libs
+
+from pathlib import Path
+from itertools import chain
+
+import re
+import time
+import random
+import argparse
+import tempfile
+
+from JackTokenizer import JackTokenizer, get_tokens
+
+# %% reference implementation (multi-pass tokenizer)
+
+PATT_STR = r"\"[^\"\n]+\""
+PATT_STR_CONST = '^' + PATT_STR + '$'
+PATT_IDENTIFIER = r"^[a-zA-Z_]\w*$"
+
+
+def process_line(line: str):
+    line = re.sub("//.*$", "", line)
+    line = line.strip()
+    return re.findall(r'\S*".*"\S*|\S+', line)
+
+
+def split_into_tokens(block: str):
+    parts = re.split('('+PATT_STR+')', block)
+    patt = '([' + re.escape("".join(JackTokenizer.symbols)) + '])'
+    tokens = [[part] if '"' in part else re.split(patt, part) for part in parts]
+    return [*chain(*tokens)]
+
+
+def process_code_block(block: str):
+    if block in JackTokenizer.keywords \
+        or block in JackTokenizer.symbols \
+        or block.isdigit() \
+        or re.match(PATT_STR_CONST, block) \
+        or re.match(PATT_IDENTIFIER, block):
+        return [block]
+    else:
+        return split_into_tokens(block)
+
+
+def get_tokens_multi_pass(jack_file_path):
+    with open(jack_file_path, 'r') as f:
+        codes = f.read()
+    codes = re.sub(r"/\*.*?\*/", " ", codes, flags=re.DOTALL)
+    lines = [process_line(line) for line in codes.split("\n")]
+    code_blocks = [*chain(*lines)]
+    tokens = [process_code_block(block) for block in code_blocks]
+    return [tkn for tkn in chain(*tokens) if tkn]
+
+# %% synthetic inputs
+
+SYNTHETIC_LINES = [
+    "        let x = (x + 1) * (y - 2) / 3;  // arithmetic",
+    "        let a[i] = a[i-1] + a[i-2];",
+    "        do Output.printString(\"Hello, World\");",
+    "        if ((x < 0) & ~(y > 100)) { let z = -z; }",
+    "        /* a block comment */ while (i < 16) { let i = i + 1; }",
+    "        do Screen.drawRectangle(x, y, x + size, y + size);",
+]
+
+
+def make_synthetic_source(n_lines: int, seed: int=0) -> str:
+    rng = random.Random(seed)
+    body = [rng.choice(SYNTHETIC_LINES) for _ in range(n_lines - 6)]
+    return "\n".join([
+        "class Synthetic {",
+        "    function void run() {",
+        "        var int x, y, z, i, size;",
+        "        var Array a;",
+        *body,
+        "        return;",
+        "    }",
+        "}",
+        "// a trailing comment",
+        "/* and a trailing block comment */",
+    ])
+
+# %% benchmarking
+
+def best_of(func, arg, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench(label: str, jack_files, repeat: int):
+    t_multi = sum(best_of(get_tokens_multi_pass, f, repeat) for f in jack_files)
+    t_single = sum(best_of(get_tokens, f, repeat) for f in jack_files)
+    print(f"{label:<30}{t_multi*1e3:>12.2f}{t_single*1e3:>12.2f}{t_multi/t_single:>10.2f}x")
+
+# %% main function
+
+def _main(jack_files, n_lines: int, repeat: int):
+
+    print(f"{'input':<30}{'multi (ms)':>12}{'single (ms)':>12}{'speedup':>11}")
+    print("-"*65)
+
+    if jack_files:
+        # both implementations must agree on the token stream
+        for jack_file in jack_files:
+            assert get_tokens(jack_file) == get_tokens_multi_pass(jack_file), \
+                f"token mismatch in [{jack_file}]"
+        bench(f"{len(jack_files)} jack file(s)", jack_files, repeat)
+
+    with tempfile.TemporaryDirectory() as d:
+        synthetic = Path(d) / "Synthetic.jack"
+        synthetic.write_text(make_synthetic_source(n_lines))
+        # (the synthetic source ends in comments)
+        assert get_tokens(synthetic) == get_tokens_multi_pass(synthetic), "token mismatch in the synthetic source"
+        bench(f"synthetic ({n_lines} lines)", [synthetic], repeat)
+
+# %% calling the main function
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("src", nargs="?", help="Jack source file(s)",
+                        default=Path(__file__).parent.parent / "OS")
+    parser.add_argument("--lines", help="Lines of synthetic input", type=int, default=100_000)
+    parser.add_argument("--repeat", help="Timing repetitions", type=int, default=3)
+    options = parser.parse_args()
+
+    src = Path(options.src)
+    jack_files = sorted(src.glob("*.jack")) if src.is_dir() else [src]
+    _main(jack_files, options.lines, options.repeat)
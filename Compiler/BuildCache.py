@@ -0,0 +1,161 @@
+"""
+This module provides an on-disk build cache for the compiler.
+A .jack file is not re-compiled when its outputs (.vm, and .xml or .vm.map if asked)
+    are still valid, i.e. when the cache key of the file is unchanged.
+The cache key combines
+    1. a content hash of the .jack source;
+    2. the compiler version (a hash of the compiler's own sources); and
+    3. the option set affecting the outputs (e.g. --xml).
+The cached outputs are kept as blobs named by their cache key, so that
+    deleted or modified outputs can be restored without compiling.
+An in-memory build (see jcc) reads and stores the blobs only (load, store_outputs):
+    no output is written next to the sources.
+Invalidation: an entry is stale as soon as its key changes;
+    --clear-cache drops the whole cache.
+Eviction: blobs are evicted in least-recently-used order beyond max_entries,
+    and index entries of deleted .jack files are dropped.
+"""
+
+# %% import libs
+
+from pathlib import Path
+from typing import Dict, Optional
+
+import json
+import time
+import shutil
+import hashlib
+
+# %% constants
+
+CACHE_DIR_NAME = ".jackcache"
+MAX_ENTRIES = 1024  # max number of cached builds (blob sets) kept on disk
+
+
+def compiler_version() -> str:
+    '''Returns a digest of the compiler's sources.'''
+    h = hashlib.sha256()
+    for py_file in sorted(Path(__file__).parent.glob("*.py")):
+        h.update(py_file.name.encode())
+        h.update(py_file.read_bytes())
+    return h.hexdigest()
+
+
+def file_digest(file_path: Path) -> str:
+    return hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+# %% class definition
+
+class BuildCache:
+
+    def __init__(self, src_dir: Path, options: dict, max_entries: int=MAX_ENTRIES) -> None:
+        '''Opens (or creates) the build cache of the given source folder.
+        options: {option name: value}, the options affecting the outputs.
+        '''
+        self.cache_dir = src_dir / CACHE_DIR_NAME
+        self.blob_dir = self.cache_dir / "blobs"
+        self.index_path = self.cache_dir / "index.json"
+        self.max_entries = max_entries
+        self.suffixes = [".vm"] + ([".xml"] if options.get("xml") else []) \
+            + ([".vm.map"] if options.get("map") else [])
+        self.salt = json.dumps({"version": compiler_version(), **options}, sort_keys=True)
+        self.hits = 0
+        self.misses = 0
+        # index: {"files": {jack file name: {"key": key, "digests": {suffix: digest}}},
+        #         "blobs": {key: last used time}}
+        try:
+            self.index = json.loads(self.index_path.read_text())
+        except (OSError, ValueError):
+            self.index = {"files": {}, "blobs": {}}
+
+    def key_of(self, jack_file: Path) -> str:
+        '''Returns the cache key of a .jack file.'''
+        h = hashlib.sha256(self.salt.encode())
+        h.update(jack_file.read_bytes())
+        return h.hexdigest()
+
+    def lookup(self, jack_file: Path) -> bool:
+        '''Checks whether the outputs of a .jack file are still valid.
+        Outputs that are missing or modified are restored from the cache.'''
+        key = self.key_of(jack_file)
+        entry = self.index["files"].get(jack_file.name)
+        blobs = [self.blob_dir / f"{key}{suffix}" for suffix in self.suffixes]
+        if entry is None or entry["key"] != key:
+            # a cached build from another version of the file (or options)
+            if not all(blob.exists() for blob in blobs):
+                self.misses += 1
+                return False
+            entry = {"key": key, "digests": {}}
+        for suffix, blob in zip(self.suffixes, blobs):
+            output = jack_file.with_suffix(suffix)
+            digest = entry["digests"].get(suffix)
+            if digest is None or not output.exists() or file_digest(output) != digest:
+                if not blob.exists():
+                    self.misses += 1
+                    return False
+                shutil.copyfile(blob, output)
+                entry["digests"][suffix] = file_digest(output)
+        self.index["files"][jack_file.name] = entry
+        self.index["blobs"][key] = time.time()
+        self.hits += 1
+        return True
+
+    def load(self, jack_file: Path) -> Optional[Dict[str, Path]]:
+        '''Returns the cached outputs {suffix: blob} of a .jack file,
+        or None if they are not all cached (the outputs are not restored).'''
+        key = self.key_of(jack_file)
+        blobs = {suffix: self.blob_dir / f"{key}{suffix}" for suffix in self.suffixes}
+        if not all(blob.exists() for blob in blobs.values()):
+            self.misses += 1
+            return None
+        self.index["blobs"][key] = time.time()
+        self.hits += 1
+        return blobs
+
+    def store_outputs(self, jack_file: Path, outputs: Dict[str, str]) -> None:
+        '''Caches the outputs {suffix: text} of a .jack file compiled in memory.'''
+        key = self.key_of(jack_file)
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        for suffix in self.suffixes:
+            with open(self.blob_dir / f"{key}{suffix}", "w") as f:
+                f.write(outputs[suffix])
+        self.index["blobs"][key] = time.time()
+
+    def store(self, jack_file: Path) -> None:
+        '''Caches the freshly compiled outputs of a .jack file.'''
+        key = self.key_of(jack_file)
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        digests = {}
+        for suffix in self.suffixes:
+            output = jack_file.with_suffix(suffix)
+            shutil.copyfile(output, self.blob_dir / f"{key}{suffix}")
+            digests[suffix] = file_digest(output)
+        self.index["files"][jack_file.name] = {"key": key, "digests": digests}
+        self.index["blobs"][key] = time.time()
+
+    def evict(self) -> None:
+        '''Drops entries of deleted .jack files and least-recently-used blobs.'''
+        src_dir = self.cache_dir.parent
+        files = self.index["files"]
+        for name in [name for name in files if not (src_dir / name).exists()]:
+            del files[name]
+        blobs = self.index["blobs"]
+        lru = sorted(blobs, key=blobs.get)
+        for key in lru[:max(0, len(lru) - self.max_entries)]:
+            for blob in self.blob_dir.glob(f"{key}.*"):
+                blob.unlink()
+            del blobs[key]
+
+    def close(self) -> None:
+        '''Evicts stale entries, saves the index, and reports the hits and misses.'''
+        self.evict()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.index, indent=1))
+        tmp_path.replace(self.index_path)
+        print(f"Build cache: {self.hits} hit(s), {self.misses} miss(es)")
+
+    @staticmethod
+    def clear(src_dir: Path) -> None:
+        '''Drops the whole build cache of the given source folder.'''
+        shutil.rmtree(src_dir / CACHE_DIR_NAME, ignore_errors=True)
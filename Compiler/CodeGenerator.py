@@ -0,0 +1,251 @@
+"""
+The code generator lowers the AST of a class (see AST) into VM code,
+    written through a VMWriter.
+Without optimize, the VM code is the same as the one of the book's
+    single-pass compiler; with optimize (after the passes, see Passes):
+    1. the multiplications by powers of two become additions;
+    2. an if statement jumps over its then-branch with a single if-goto on
+       the negated condition;
+    3. a while loop is rotated: its test is at the bottom, and jumps back to
+       the body while the condition holds (the while statements with a true
+       condition are lowered without a test).
+    2. and 3. only apply to the boolean conditions (see Folding.is_boolean):
+    an if statement takes any nonzero condition as true, but a while loop
+    only goes on while its condition is -1 (the code of the book), so
+    ~cond and cond are not the branches of the other conditions.
+    The comparisons followed by an if-goto are then fused into a single
+    compare-and-branch by the VMTranslator (e.g. "lt; not; if-goto" is D;JGE).
+"""
+
+# %% import libs
+
+from MyTypes import SegmentType
+from VMWriter import VMWriter
+from AST import Node, IntConst, StrConst, KeywordConst, Var, ArrayRef, Call, \
+    Unary, Binary, Let, LetArray, If, While, Do, Return, Subroutine, Class, position
+from Folding import MAX_SHIFT, TRUE, signed, constant_value, is_boolean, is_pure, \
+    fold_node, power_of_two
+
+# %% constants
+
+SCRATCH_TEMP = 1  # temp slot used by the code replacing a multiplication
+
+# %% class definition
+
+class CodeGenerator:
+
+    def __init__(self, vm_writer: VMWriter, optimize: bool=False):
+        self.vm_writer = vm_writer
+        self.optimize = optimize
+        self.cls_name = ""   # name of this class
+        self.n_if = 0        # counter of if statement (per subroutine)
+        self.n_while = 0     # counter of while statement (per class)
+
+    def write_class(self, cls: Class) -> None:
+        '''Writes the VM code of a class.'''
+        self.cls_name = cls.name
+        for sub in cls.subroutines:
+            self.write_subroutine(sub, cls.n_fields)
+
+    def write_subroutine(self, sub: Subroutine, n_fields: int) -> None:
+        # write the subroutine declaration
+        self.vm_writer.set_position(position(sub))
+        self.vm_writer.write_function(self.cls_name + '.' + sub.name, sub.n_vars)
+        # if the subroutine is a ctor, then allocate memory
+        if sub.kind == "constructor":
+            self.vm_writer.write_push(SegmentType.CONSTANT, n_fields)
+            # arrange a memory block to store the new object's fields
+            self.vm_writer.write_call("Memory.alloc", 1)
+            # returns its base address to the caller
+            self.vm_writer.write_pop(SegmentType.POINTER, 0)  # pop to this
+        elif sub.kind == "method":
+            # in a method, pop the first arg to this
+            self.vm_writer.write_push(SegmentType.ARGUMENT, 0)
+            self.vm_writer.write_pop(SegmentType.POINTER, 0)
+        self.write_statements(sub.body)
+        # reset the n_if counter
+        self.n_if = 0
+
+    # %% statements
+
+    def write_statements(self, stmts) -> None:
+        for stmt in stmts:
+            self.vm_writer.set_position(position(stmt))
+            if isinstance(stmt, Let):
+                self.write_expression(stmt.value)
+                self.vm_writer.write_pop(stmt.segment, stmt.index)
+            elif isinstance(stmt, LetArray):
+                self.write_let_array(stmt)
+            elif isinstance(stmt, If):
+                self.write_if(stmt)
+            elif isinstance(stmt, While):
+                self.write_while(stmt)
+            elif isinstance(stmt, Do):
+                self.write_expression(stmt.call)
+                # pop the return value to temp 0 (ignoring the return value)
+                self.vm_writer.write_pop(SegmentType.TEMP, 0)
+            elif isinstance(stmt, Return):
+                if stmt.value is not None:
+                    self.write_expression(stmt.value)
+                else:  # return from a void function
+                    self.vm_writer.write_push(SegmentType.CONSTANT, 0)
+                self.vm_writer.write_return()
+            else:
+                raise TypeError(f"Not a statement: {stmt}")
+
+    def write_block(self, stmts, owner: Node) -> None:
+        # the statements nested in owner; the code after them is owner's again
+        self.write_statements(stmts)
+        self.vm_writer.set_position(position(owner))
+
+    def write_let_array(self, stmt: LetArray) -> None:
+        # calc (varName + expression)
+        self.write_expression(stmt.address)
+        self.write_expression(stmt.value)
+        # save the value of the rhs expression
+        self.vm_writer.write_pop(SegmentType.TEMP, 0)
+        # assign value of the rhs expression to array
+        self.vm_writer.write_pop(SegmentType.POINTER, 1)  # that = varName + expression
+        self.vm_writer.write_push(SegmentType.TEMP, 0)    # put value of rhs at the stack's top
+        self.vm_writer.write_pop(SegmentType.THAT, 0)     # *(varName+expression) = rhs's value
+
+    def write_if(self, stmt: If) -> None:
+        n_if = self.n_if
+        self.n_if += 1
+        if self.optimize and is_boolean(stmt.cond):
+            self.write_if_not(stmt, n_if)
+            return
+        self.write_expression(stmt.cond)
+        # write if-goto IF_TRUE; goto IF_FALSE
+        self.vm_writer.write_if(f"IF_TRUE{n_if}")
+        self.vm_writer.write_goto(f"IF_FALSE{n_if}")
+        self.vm_writer.write_label(f"IF_TRUE{n_if}")
+        self.write_block(stmt.then, stmt)
+        # write goto IF_END
+        if stmt.orelse is not None:
+            self.vm_writer.write_goto(f"IF_END{n_if}")
+        # write label IF_FALSE
+        self.vm_writer.write_label(f"IF_FALSE{n_if}")
+        if stmt.orelse is not None:
+            self.write_block(stmt.orelse, stmt)
+            # write label IF_END
+            self.vm_writer.write_label(f"IF_END{n_if}")
+
+    def write_if_not(self, stmt: If, n_if: int) -> None:
+        # write (~cond); if-goto IF_FALSE
+        self.write_expression(fold_node(Unary('~', stmt.cond)))
+        self.vm_writer.write_if(f"IF_FALSE{n_if}")
+        self.write_block(stmt.then, stmt)
+        if stmt.orelse:
+            self.vm_writer.write_goto(f"IF_END{n_if}")
+        self.vm_writer.write_label(f"IF_FALSE{n_if}")
+        if stmt.orelse:
+            self.write_block(stmt.orelse, stmt)
+            self.vm_writer.write_label(f"IF_END{n_if}")
+
+    def write_while(self, stmt: While) -> None:
+        n_while = self.n_while
+        self.n_while += 1
+        if self.optimize and is_boolean(stmt.cond):
+            self.write_rotated_while(stmt, n_while)
+            return
+        # write label WHILE_EXP
+        self.vm_writer.write_label(f"WHILE_EXP{n_while}")
+        # write not; if-goto WHILE_END
+        self.write_expression(stmt.cond)
+        self.vm_writer.write_arithmetic("not")
+        self.vm_writer.write_if(f"WHILE_END{n_while}")
+        self.write_block(stmt.body, stmt)
+        # write goto WHILE_EXP
+        self.vm_writer.write_goto(f"WHILE_EXP{n_while}")
+        # write label WHILE_END
+        self.vm_writer.write_label(f"WHILE_END{n_while}")
+
+    def write_rotated_while(self, stmt: While, n_while: int) -> None:
+        if constant_value(stmt.cond) == TRUE:
+            # while (true): no test
+            self.vm_writer.write_label(f"WHILE_EXP{n_while}")
+            self.write_block(stmt.body, stmt)
+            self.vm_writer.write_goto(f"WHILE_EXP{n_while}")
+            return
+        # goto WHILE_EXP; label WHILE_LOOP; body; label WHILE_EXP; cond; if-goto WHILE_LOOP
+        self.vm_writer.write_goto(f"WHILE_EXP{n_while}")
+        self.vm_writer.write_label(f"WHILE_LOOP{n_while}")
+        self.write_block(stmt.body, stmt)
+        self.vm_writer.write_label(f"WHILE_EXP{n_while}")
+        self.write_expression(stmt.cond)
+        self.vm_writer.write_if(f"WHILE_LOOP{n_while}")
+
+    # %% expressions
+
+    def write_expression(self, expr: Node) -> None:
+        if isinstance(expr, IntConst):
+            # output "push c"
+            self.vm_writer.write_constant(expr.value)
+        elif isinstance(expr, Var):
+            self.vm_writer.write_push(expr.segment, expr.index)
+        elif isinstance(expr, Binary):
+            self.write_binary(expr)
+        elif isinstance(expr, Unary):
+            self.write_expression(expr.operand)
+            self.vm_writer.write_arithmetic(VMWriter.al_uop2cmd[expr.op])
+        elif isinstance(expr, ArrayRef):
+            self.write_expression(expr.address)
+            self.vm_writer.write_pop(SegmentType.POINTER, 1)  # that = varName + expression
+            # put *(that+0) at the stack's top
+            self.vm_writer.write_push(SegmentType.THAT, 0)
+        elif isinstance(expr, Call):
+            for arg in expr.args:
+                self.write_expression(arg)
+            # write "call f n"
+            self.vm_writer.write_call(expr.name, len(expr.args))
+        elif isinstance(expr, KeywordConst):
+            if expr.keyword == "true":
+                self.vm_writer.write_push(SegmentType.CONSTANT, 0)
+                self.vm_writer.write_arithmetic("not")
+            elif expr.keyword == "this":
+                self.vm_writer.write_push(SegmentType.POINTER, 0)
+            else:  # null, false
+                self.vm_writer.write_push(SegmentType.CONSTANT, 0)
+        elif isinstance(expr, StrConst):
+            # construct a String object
+            self.vm_writer.write_push(SegmentType.CONSTANT, len(expr.text))
+            self.vm_writer.write_call("String.new", 1)
+            for c in expr.text:
+                self.vm_writer.write_push(SegmentType.CONSTANT, ord(c))
+                self.vm_writer.write_call("String.appendChar", 2)
+        else:
+            raise TypeError(f"Not an expression: {expr}")
+
+    def write_binary(self, expr: Binary) -> None:
+        op = expr.op
+        if self.optimize and op == '*':
+            # x * 2^k: k doublings
+            for x, c in ((expr.lhs, expr.rhs), (expr.rhs, expr.lhs)):
+                value = constant_value(c)
+                k = power_of_two(value) if value is not None else None
+                if k is not None and k <= MAX_SHIFT:
+                    self.write_doublings(x, k)
+                    if signed(value) < 0:
+                        self.vm_writer.write_arithmetic("neg")
+                    return
+        self.write_expression(expr.lhs)
+        self.write_expression(expr.rhs)
+        # output op
+        if op in VMWriter.al_op2cmd.keys():
+            self.vm_writer.write_arithmetic(VMWriter.al_op2cmd[op])
+        else:  # {'*','/'}
+            self.vm_writer.write_call(VMWriter.al_op2func[op], 2)
+
+    def write_doublings(self, x: Node, k: int) -> None:
+        self.write_expression(x)
+        if is_pure(x):
+            # x + x
+            self.write_expression(x)
+            self.vm_writer.write_arithmetic("add")
+            k -= 1
+        for _ in range(k):
+            self.vm_writer.write_pop(SegmentType.TEMP, SCRATCH_TEMP)
+            self.vm_writer.write_push(SegmentType.TEMP, SCRATCH_TEMP)
+            self.vm_writer.write_push(SegmentType.TEMP, SCRATCH_TEMP)
+            self.vm_writer.write_arithmetic("add")
@@ -1,6 +1,9 @@
 """
 The compilation engine gets its input from a JackTokenizer 
 and emits its output to an output file.
+The engine parses a class into an AST (see AST), runs the optimization
+    passes over it (with optimize, see Passes), and lowers it into VM code
+    (see CodeGenerator).
 """
 
 # %% import libs
@@ -8,13 +11,16 @@ and emits its output to an output file.
 from pathlib import Path
 from collections import defaultdict
 
-import xml.etree.ElementTree as ET
-
-from utils import pretty_print, update_parent
+from utils import grammar_rule
 from MyTypes import TokenType, VarKind, UsageType, SegmentType
 from JackTokenizer import JackTokenizer
 from SymbolTable import SymbolTable
 from VMWriter import VMWriter
+from ParseTree import ParseTreeListener, XmlTreeBuilder
+from CodeGenerator import CodeGenerator
+from Passes import run_passes, PIPELINE, CONST_STATICS_PIPELINE
+from AST import IntConst, StrConst, KeywordConst, Var, ArrayRef, Call, Unary, Binary, \
+    Let, LetArray, If, While, Do, Return, Subroutine, Class
 
 # %% VarKind Translation
 
@@ -36,31 +42,38 @@ VAR_KIND_TO_SEG = {
 
 class CompilationEngine:
 
-    def __init__(self, jack_file_path: Path):
+    def __init__(self, jack_file_path: Path, streaming: bool=False,
+                 listener: ParseTreeListener=None, vm_writer: VMWriter=None,
+                 optimize: bool=False, const_statics: bool=False):
         '''Creates a new compilation engine.
         Note: The next routine called must by compile_class().
               Assume that: 1 Jack file contains only 1 class.
+              In streaming mode, the source is tokenized lazily.
+              A parse tree is only built by an attached listener.
+              By default, the VM code is written to Xxx.vm.
+              With optimize, the AST goes through the optimization passes;
+              with const_statics too, the constant statics set by the
+              class's init are propagated first (see Passes.const_statics).
         '''
         self.jack_file_path = jack_file_path
-        self.tknzr = JackTokenizer(self.jack_file_path)
-        self.root = None                     # root for the element tree
-        self.parent = None                   # the current parent node
+        self.tknzr = JackTokenizer(self.jack_file_path, streaming)
+        self.listener = listener             # parse tree listener (optional)
         self.tbl_class = SymbolTable()       # class-level symbol table
         self.tbl_subroutine = SymbolTable()  # subroutine-level symbol table
-        self.vm_writer = VMWriter(self.jack_file_path.with_suffix(".vm"))
+        self.vm_writer = vm_writer or VMWriter(self.jack_file_path.with_suffix(".vm"))
         self.cls_name = ""                   # name of this class
-        self.n_while = 0                     # counter of while statement
-        # init a function level static variables
-        CompilationEngine.compile_if.n_if = 0
-        CompilationEngine.compile_while.n_while = 0
+        self.optimize = optimize             # run the optimization passes
+        self.const_statics = const_statics   # run const-statics first
+        self.code_generator = CodeGenerator(self.vm_writer, optimize)
     
-    def compile_class(self):
-        '''Compiles a complete class.'''
+    def compile_class(self) -> Class:
+        '''Compiles a complete class.
+        Returns the AST of the class.'''
         # grammar: 'class' className '{' classVarDec* subroutineDec* '}'
         # reset class-level symbol table
         self.tbl_class.reset()
-        assert self.root is None
-        self.parent = self.root = ET.Element("class")
+        if self.listener is not None:
+            self.listener.enter("class")
         self.tknzr.advance()
         # expecting 'class'
         self.__add_keyword({"class"})
@@ -74,14 +87,23 @@ class CompilationEngine:
                 break
             self.compile_class_var_dec()
         # expecting subrountineDec*
+        subroutines = []
         while self.tknzr.token_type() != TokenType.SYMBOL:
             if self.tknzr.keyword() not in {"constructor", "function", "method"}:
                 break
-            self.compile_subroutine()
+            subroutines.append(self.compile_subroutine())
         # expecting '}'
         self.__add_symbol({'}'}, advance=False)
+        if self.listener is not None:
+            self.listener.exit()
+        # optimize and write the VM code
+        cls = Class(self.cls_name, self.tbl_class.var_count(VarKind.FIELD), subroutines)
+        if self.optimize:
+            run_passes(cls, CONST_STATICS_PIPELINE if self.const_statics else PIPELINE)
+        self.code_generator.write_class(cls)
+        return cls
 
-    @update_parent("classVarDec")
+    @grammar_rule("classVarDec")
     def compile_class_var_dec(self):
         '''Compiles a static variable declaration, or a field declaration.'''
         # grammar: ('static'|'field') type varName (',' varName)* ';'
@@ -108,12 +130,13 @@ class CompilationEngine:
         # expecting ';'
         self.__add_symbol({';'})
 
-    @update_parent("subroutineDec")
+    @grammar_rule("subroutineDec")
     def compile_subroutine(self):
         '''Compiles a complete method, function, or ctor.'''
         # grammar: ('constructor'|'function'|'method') ('void'|type) subroutineName
         #          '(' parameterList ')' subroutineBody
         # expecting keyword 'constructor' or 'method', or 'function'
+        pos = self.tknzr.position()
         keyword = self.__add_keyword({"constructor", "method", "function"})
         # reset subroutine-level symbol table
         self.tbl_subroutine.reset(keyword=="method")
@@ -131,16 +154,19 @@ class CompilationEngine:
         # expecting ')'
         self.__add_symbol({')'})
         # expecting subrountineBody
-        self.compile_subroutine_body(keyword, sub_name)
+        sub = self.compile_subroutine_body(keyword, sub_name)
+        sub.pos = pos
+        return sub
 
-    @update_parent("parameterList")
+    @grammar_rule("parameterList")
     def compile_parameter_list(self):
         '''Compiles a (possibly empty) parameter list.
         Does not handle the enclosing parentheses tokens ( and ).'''
         # grammar: ((type varName) (',' type varName)*)?
         # empty parameter list
         if self.tknzr.token_type() == TokenType.SYMBOL:
-            self.parent.text = " "
+            if self.listener is not None:
+                self.listener.empty()
             return
         # non-empty parameter list
         while True:
@@ -158,7 +184,7 @@ class CompilationEngine:
             else:
                 break
 
-    @update_parent("subroutineBody")
+    @grammar_rule("subroutineBody")
     def compile_subroutine_body(self, keyword, sub_name):
         '''Compiles a subroutine's body.'''
         # grammar: '{' varDec* statements '}'
@@ -169,34 +195,14 @@ class CompilationEngine:
             if self.tknzr.keyword() != "var":
                 break
             self.compile_var_dec()
-        # write the subroutine declaration
-        self.vm_writer.write_function(
-            self.cls_name + '.' + sub_name,             # function name
-            self.tbl_subroutine.var_count(VarKind.VAR)  # number of local variables
-        )
-        # if the subroutine is a ctor, then allocate memory
-        if keyword == "constructor":
-            n_fields = self.tbl_class.var_count(VarKind.FIELD)
-            self.vm_writer.write_push(SegmentType.CONSTANT, n_fields)
-            # arrange a memory block to store the new object's fields
-            self.vm_writer.write_call("Memory.alloc", 1)
-            # returns its base address to the caller
-            self.vm_writer.write_pop(SegmentType.POINTER, 0)  # pop to this
-        elif keyword == "method":
-            # in a method, pop the first arg to this
-            self.vm_writer.write_push(SegmentType.ARGUMENT, 0)
-            self.vm_writer.write_pop(SegmentType.POINTER, 0)
-        else:  # function
-            pass
+        n_vars = self.tbl_subroutine.var_count(VarKind.VAR)  # number of local variables
         # expecting statements
-        self.compile_statements()
+        body = self.compile_statements()
         # expecting '}'
         self.__add_symbol({'}'})
-        # reset n_if and n_while counters
-        CompilationEngine.compile_if.n_if = 0
-        CompilationEngine.compile_if.n_while = 0
+        return Subroutine(keyword, sub_name, n_vars, body)
 
-    @update_parent("varDec")
+    @grammar_rule("varDec")
     def compile_var_dec(self):
         '''Compiles a var declaration.'''
         # grammar: 'var' type varName (',' varName)* ';'
@@ -223,33 +229,36 @@ class CompilationEngine:
         # expecting ';'
         self.__add_symbol({';'})
 
-    @update_parent("statements")
+    @grammar_rule("statements")
     def compile_statements(self):
         '''Compiles a sequence of statements.
         Does not handle the enclosing curly bracket tokens { and }.'''
         # grammar: statement*
         # statement: let, if, while, do, return
-        any_statement = False
+        stmts = []
         while self.tknzr.token_type() != TokenType.SYMBOL:
             # expecting a statement
             keyword = self.tknzr.keyword()
+            pos = self.tknzr.position()
             if keyword == "let":
-                self.compile_let()
+                stmt = self.compile_let()
             elif keyword == "if":
-                self.compile_if()
+                stmt = self.compile_if()
             elif keyword == "while":
-                self.compile_while()
+                stmt = self.compile_while()
             elif keyword == "do":
-                self.compile_do()
+                stmt = self.compile_do()
             elif keyword == "return":
-                self.compile_return()
+                stmt = self.compile_return()
             else:
-                raise Exception(f"Unrecognized keyword: [{keyword}]")
-            any_statement = True
-        if not any_statement:
-            self.parent.text = " "
+                raise Exception(f"Unrecognized keyword: [{keyword}] at {self.tknzr.location()}")
+            stmt.pos = pos
+            stmts.append(stmt)
+        if not stmts and self.listener is not None:
+            self.listener.empty()
+        return stmts
 
-    @update_parent("letStatement")
+    @grammar_rule("letStatement")
     def compile_let(self):
         '''Compiles a let statement.'''
         # grammar: 'let' varName ('['expression']')? '=' expression ';'
@@ -264,151 +273,115 @@ class CompilationEngine:
         if is_array_assignment:
             # expecting ('['expression']')?
             self.__add_symbol({'['})
-            self.compile_expression()
+            subscript = self.compile_expression()
             self.__add_symbol({']'})
-            # put the value of varName at the stack's top
-            self.vm_writer.write_push(VAR_KIND_TO_SEG[var_prop.kind], var_prop.index)
             # calc (varName + expression)
-            self.vm_writer.write_arithmetic("add")
+            address = Binary('+', subscript, self.__var(var_name, var_prop))
             # expecting '='
             self.__add_symbol({'='})
             # expecting an expression
-            self.compile_expression()
-            # save the value of the rhs expression
-            self.vm_writer.write_pop(SegmentType.TEMP, 0)
-            # assign value of the rhs expression to array
-            self.vm_writer.write_pop(SegmentType.POINTER, 1)  # that = varName + expression
-            self.vm_writer.write_push(SegmentType.TEMP, 0)    # put value of rhs at the stack's top
-            self.vm_writer.write_pop(SegmentType.THAT, 0)     # *(varName+expression) = rhs's value
+            stmt = LetArray(address, self.compile_expression())
         else:  # variable assignment
             # expecting '='
             self.__add_symbol({'='})
             # expecting an expression
-            self.compile_expression()
+            value = self.compile_expression()
             # assign value of the rhs expression to the variable varName
-            self.vm_writer.write_pop(VAR_KIND_TO_SEG[var_prop.kind], var_prop.index)
+            stmt = Let(var_name, VAR_KIND_TO_SEG[var_prop.kind], var_prop.index, value)
         # expecting ';'
         self.__add_symbol({';'})
+        return stmt
 
-    @update_parent("ifStatement")
+    @grammar_rule("ifStatement")
     def compile_if(self):
         '''Compiles an if statement, possibly with a trailing else clause.'''
         # grammar: 'if' '(' expression ')' '{' statements '}' 
         #         ('else' '{' statements '}')?
-        n_if = CompilationEngine.compile_if.n_if
-        CompilationEngine.compile_if.n_if += 1
         # expecting 'if'
         self.__add_keyword({'if'})
         # expecting '('
         self.__add_symbol({'('})
         # expecting an expression
-        self.compile_expression()
+        cond = self.compile_expression()
         # expecting ')'
         self.__add_symbol({')'})
-        # write if-goto IF_TRUE; goto IF_FALSE
-        self.vm_writer.write_if(f"IF_TRUE{n_if}")
-        self.vm_writer.write_goto(f"IF_FALSE{n_if}")
-        self.vm_writer.write_label(f"IF_TRUE{n_if}")
         # expecting '{'
         self.__add_symbol({'{'})
         # expecting statements
-        self.compile_statements()
+        then = self.compile_statements()
         # expecting '}'
         self.__add_symbol({'}'})
-        # check whether we have a else block or not
-        has_else = self.tknzr.token_type() == TokenType.KEYWORD and \
-            self.tknzr.keyword() == "else"
-        # write goto IF_END
-        if has_else:
-            self.vm_writer.write_goto(f"IF_END{n_if}")
-        # write label IF_FALSE
-        self.vm_writer.write_label(f"IF_FALSE{n_if}")
         # check whether we have an 'else' clause
-        if has_else:
+        orelse = None
+        if self.tknzr.token_type() == TokenType.KEYWORD and \
+            self.tknzr.keyword() == "else":
             # ('else' '{' statements '}')?
             self.__add_keyword({"else"})
             self.__add_symbol({'{'})
-            self.compile_statements()
+            orelse = self.compile_statements()
             self.__add_symbol({'}'})
-            # write label IF_END
-            self.vm_writer.write_label(f"IF_END{n_if}")
+        return If(cond, then, orelse)
 
-    @update_parent("whileStatement")
+    @grammar_rule("whileStatement")
     def compile_while(self):
         '''Compiles a while statement.'''
         # grammar: 'while' '(' expression ')' '{' statements '}'
-        n_while = CompilationEngine.compile_while.n_while
-        CompilationEngine.compile_while.n_while += 1
         # expecting 'while'
         self.__add_keyword({'while'})
-        # write label WHILE_EXP
-        self.vm_writer.write_label(f"WHILE_EXP{n_while}")
         # expecting '('
         self.__add_symbol({'('})
         # expecting an expression
-        self.compile_expression()
+        cond = self.compile_expression()
         # expecting ')'
         self.__add_symbol({')'})
-        # write not; if-goto WHILE_END
-        self.vm_writer.write_arithmetic("not")
-        self.vm_writer.write_if(f"WHILE_END{n_while}")
         # expecting '{'
         self.__add_symbol({'{'})
         # expecting statements
-        self.compile_statements()
-        # write goto WHILE_EXP
-        self.vm_writer.write_goto(f"WHILE_EXP{n_while}")
+        body = self.compile_statements()
         # expecting '}'
         self.__add_symbol({'}'})
-        # write label WHILE_END
-        self.vm_writer.write_label(f"WHILE_END{n_while}")
+        return While(cond, body)
 
-    @update_parent("doStatement")
+    @grammar_rule("doStatement")
     def compile_do(self):
         '''Compiles a do statement.'''
         # grammar: 'do' subroutineCall ';'
         # expecting 'do'
         self.__add_keyword({"do"})
         # expecting subroutineCall
-        self.__compile_subroutine_call()
+        call = self.__compile_subroutine_call()
         # expecting ';'
         self.__add_symbol({';'})
-        # pop the return value to temp 0 (ignoring the return value)
-        self.vm_writer.write_pop(SegmentType.TEMP, 0)
+        return Do(call)
 
-    @update_parent("returnStatement")
+    @grammar_rule("returnStatement")
     def compile_return(self):
         '''Compiles a return statement.'''
         # grammar: 'return' expression? ';'
         # expecting 'return'
         self.__add_keyword({"return"})
+        value = None  # return from a void function
         if self.tknzr.token_type() != TokenType.SYMBOL \
             or self.tknzr.symbol() != ';':
             # expecting an expression
-            self.compile_expression()
-        else:  # return from a void function
-            self.vm_writer.write_push(SegmentType.CONSTANT, 0)
-        # write return
-        self.vm_writer.write_return()
+            value = self.compile_expression()
         # expecting ';'
         self.__add_symbol({';'})
+        return Return(value)
 
-    @update_parent("expression")
+    @grammar_rule("expression")
     def compile_expression(self):
         '''Compiles an expression.'''
         # grammar: term (op term)*
-        self.compile_term()
+        expr = self.compile_term()
         while self.tknzr.token_type() == TokenType.SYMBOL \
             and self.tknzr.symbol() in {'+','-','*','/','&','|','<','>','='}:
             op = self.__add_symbol()
-            self.compile_term()
-            # output op
-            if op in VMWriter.al_op2cmd.keys():
-                self.vm_writer.write_arithmetic(VMWriter.al_op2cmd[op])
-            else:  # {'*','/'}
-                self.vm_writer.write_call(VMWriter.al_op2func[op], 2)
+            # no operator precedence: evaluated from left to right
+            expr = Binary(op, expr, self.compile_term())
+        return expr
     
-    @update_parent("term")
+    @grammar_rule("term")
     def compile_term(self):
         '''Compiles a term.
         If the current token is an identifier, the routine must resolve it
@@ -421,34 +394,21 @@ class CompilationEngine:
         #          '(' expression ')' | (unaryOp term) 
         if self.tknzr.token_type() == TokenType.INT_CONST:
             # integer
-            elem = ET.SubElement(self.parent, "integerConstant")
             val = self.tknzr.int_val()
-            elem.text = str(val)
+            if self.listener is not None:
+                self.listener.terminal("integerConstant", str(val))
             self.tknzr.advance()
-            # output "push c"
-            self.vm_writer.write_push(SegmentType.CONSTANT, val)
+            return IntConst(val)
         elif self.tknzr.token_type() == TokenType.STRING_CONST:
             # string
             txt = self.tknzr.string_val()
-            elem = ET.SubElement(self.parent, "stringConstant")
-            elem.text = txt
+            if self.listener is not None:
+                self.listener.terminal("stringConstant", txt)
             self.tknzr.advance()
-            # construct a String object
-            self.vm_writer.write_push(SegmentType.CONSTANT, len(txt))
-            self.vm_writer.write_call("String.new", 1)
-            for c in txt:
-                self.vm_writer.write_push(SegmentType.CONSTANT, ord(c))
-                self.vm_writer.write_call("String.appendChar", 2)
+            return StrConst(txt)
         elif self.tknzr.token_type() == TokenType.KEYWORD:
             # keyword
-            keyword = self.__add_keyword({"true","false","null","this"})
-            if keyword == "true":
-                self.vm_writer.write_push(SegmentType.CONSTANT, 0)
-                self.vm_writer.write_arithmetic("not")
-            elif keyword == "null" or keyword == "false":
-                self.vm_writer.write_push(SegmentType.CONSTANT, 0)
-            else:  # this
-                self.vm_writer.write_push(SegmentType.POINTER, 0)
+            return KeywordConst(self.__add_keyword({"true","false","null","this"}))
         elif self.tknzr.token_type() == TokenType.IDENTIFIER:
             # varName | varName '[' expression ']' | subroutineCall
             if self.tknzr.token_lookahead() == '[':
@@ -456,60 +416,51 @@ class CompilationEngine:
                 var_name = self.__add_identifier_var()
                 var_prop = self.__look_up_in_symbol_table(var_name)
                 self.__add_symbol({'['})
-                self.compile_expression()
+                subscript = self.compile_expression()
                 self.__add_symbol({']'})
-                # put the value of varName at the stack's top
-                self.vm_writer.write_push(VAR_KIND_TO_SEG[var_prop.kind], var_prop.index)
-                # calc (varName + expression)
-                self.vm_writer.write_arithmetic("add")
-                # that = varName + expression
-                self.vm_writer.write_pop(SegmentType.POINTER, 1)  # that = varName + expression
-                # put *(that+0) at the stack's top
-                self.vm_writer.write_push(SegmentType.THAT, 0)
+                # *(varName + expression)
+                return ArrayRef(Binary('+', subscript, self.__var(var_name, var_prop)))
             elif self.tknzr.token_lookahead() in {'(', '.'}:
                 # subroutineCall
-                self.__compile_subroutine_call()
+                return self.__compile_subroutine_call()
             else:
                 # varName
                 var_name = self.__add_identifier_var()
-                var_prop = self.__look_up_in_symbol_table(var_name)
-                self.vm_writer.write_push(VAR_KIND_TO_SEG[var_prop.kind], var_prop.index)
+                return self.__var(var_name, self.__look_up_in_symbol_table(var_name))
         else:
             # '(' expression ')' | (unaryOp term) 
             if self.tknzr.symbol() == '(':
                 # '(' expression ')'
                 self.__add_symbol({'('})
-                self.compile_expression()
+                expr = self.compile_expression()
                 self.__add_symbol({')'})
+                return expr
             else:
                 # (unaryOp term) 
                 uop = self.__add_symbol({'-','~'})
-                self.compile_term()
-                # output op
-                self.vm_writer.write_arithmetic(VMWriter.al_uop2cmd[uop])
+                return Unary(uop, self.compile_term())
 
-    @update_parent("expressionList")
-    def compile_expression_list(self) -> int:
+    @grammar_rule("expressionList")
+    def compile_expression_list(self) -> list:
         '''Compiles a (possibly empty) comma-separated list of expressions.
-        Returns the number of expressions in the list.'''
+        Returns the list of expressions.'''
         # grammar: (expression (',' expression)* )?
-        n_expr = 0
+        exprs = []
         while self.tknzr.token_type() != TokenType.SYMBOL or \
             self.tknzr.symbol() != ')':
-            self.compile_expression(); n_expr += 1
+            exprs.append(self.compile_expression())
             if self.tknzr.token_type() == TokenType.SYMBOL and \
                 self.tknzr.symbol() == ',':
                 self.__add_symbol()
-        if not n_expr:
-            self.parent.text = " "
-        return n_expr
+        if not exprs and self.listener is not None:
+            self.listener.empty()
+        return exprs
     
     def write_to_xml(self):
         '''Writes the program structure to xml.'''
-        if self.root is not None:
+        if isinstance(self.listener, XmlTreeBuilder):
             xml_file_path = self.jack_file_path.with_suffix(".xml")
-            pretty_print(self.root)
-            ET.ElementTree(self.root).write(xml_file_path)
+            self.listener.write(xml_file_path)
             print(f"XML file written to [{xml_file_path}]")
 
     def close(self, write_xml=False):
@@ -528,46 +479,48 @@ class CompilationEngine:
                 # varName.xxx (a method)
                 var_name = self.__add_identifier_var()
                 var_prop = self.__look_up_in_symbol_table(var_name)
-                self.vm_writer.write_push(VAR_KIND_TO_SEG[var_prop.kind], var_prop.index)  # push varName
-                has_this = True
-                cls_name = self.__look_up_in_symbol_table(var_name).vtype
+                args = [self.__var(var_name, var_prop)]  # push varName
+                cls_name = var_prop.vtype
             except:
                 # className.xxx (a function)
-                has_this = False
+                args = []
                 cls_name = self.__add_identifier_cls()
             self.__add_symbol({'.'})
             cls_name += '.'
         else:  # subroutineName(...) (a method)
             cls_name = self.cls_name + '.'  # name of this class
-            self.vm_writer.write_push(SegmentType.POINTER, 0)  # push this
-            has_this = True
+            args = [KeywordConst("this")]  # push this
         # expecting subroutineName '(' expressionList ')'
         sub_name = self.__add_identifier_sub()
         func_name = cls_name + sub_name
         self.__add_symbol({'('})
-        n_args = self.compile_expression_list()
+        args += self.compile_expression_list()
         self.__add_symbol({')'})
-        # write "call f n"
-        self.vm_writer.write_call(func_name, n_args + (1 if has_this else 0))
+        return Call(func_name, args)
     
     def __add_keyword(self, allow=JackTokenizer.keywords, advance=True):
         keyword = self.tknzr.keyword()
-        assert keyword in allow, f"keyword [{keyword}] is not in {allow}"
-        elem = ET.SubElement(self.parent, "keyword")
-        elem.text = keyword
+        assert keyword in allow, \
+            f"keyword [{keyword}] is not in {allow} at {self.tknzr.location()}"
+        if self.listener is not None:
+            self.listener.terminal("keyword", keyword)
         if advance:
             self.tknzr.advance()
         return keyword
     
     def __add_symbol(self, allow=JackTokenizer.symbols, advance=True):
         symbol = self.tknzr.symbol()
-        assert symbol in allow, f"symbol [{symbol}] is not in {allow}"
-        elem = ET.SubElement(self.parent, "symbol")
-        elem.text = symbol
+        assert symbol in allow, \
+            f"symbol [{symbol}] is not in {allow} at {self.tknzr.location()}"
+        if self.listener is not None:
+            self.listener.terminal("symbol", symbol)
         if advance: 
             self.tknzr.advance()
         return symbol
     
+    def __var(self, name, var_prop):
+        return Var(name, VAR_KIND_TO_SEG[var_prop.kind], var_prop.index)
+
     def __get_identifier(self):
         return self.tknzr.identifier()
 
@@ -577,7 +530,7 @@ class CompilationEngine:
         elif self.tbl_class.contains(name):
             return self.tbl_class.get(name)
         else:
-            raise NameError(f"Undefined Variable: {name}")
+            raise NameError(f"Undefined Variable: {name} at {self.tknzr.location()}")
 
     def __add_identifier(self, usage, lookup, category, advance):
         # read the identifier
@@ -587,21 +540,9 @@ class CompilationEngine:
         if lookup:
             var_prop = self.__look_up_in_symbol_table(identifier)
             category, index = var_prop.kind.name, var_prop.index
-        # add identifier to the element tree
-        elem = ET.SubElement(self.parent, "identifier")
-        # name
-        sub_elem = ET.SubElement(elem, "name")
-        sub_elem.text = identifier
-        # category
-        sub_elem = ET.SubElement(elem, "category")
-        sub_elem.text = category
-        # index
-        if index >= 0:
-            sub_elem = ET.SubElement(elem, "index")
-            sub_elem.text = str(index)
-        # usage
-        sub_elem = ET.SubElement(elem, "usage")
-        sub_elem.text = usage.name
+        # add identifier to the parse tree
+        if self.listener is not None:
+            self.listener.identifier(identifier, category, index, usage.name)
         if advance:
             self.tknzr.advance()
         return identifier
@@ -0,0 +1,138 @@
+"""
+Constant folding and algebraic simplification of Jack expressions.
+The Jack ints are 16-bit two's complement words: the values are kept here
+    as unsigned words (0..65535), and the folded results wrap around like the
+    Hack ALU (and the OS's Math.multiply) does. The comparisons are folded
+    like the translated code runs them: by the sign of the 16-bit x - y,
+    which is not the exact order when x and y are more than 32767 apart.
+Jack has no operator precedence: an expression is evaluated from left to
+    right, so only the (already folded) left operand and the next term are
+    ever combined.
+fold_node() is the rewriter of the "fold" pass (see Passes).
+"""
+
+# %% import libs
+
+from typing import Optional
+
+from AST import Node, IntConst, KeywordConst, Var, Unary, Binary
+
+# %% constants
+
+WORD = 0xFFFF
+TRUE = 0xFFFF  # true is -1 (all bits set)
+MAX_SHIFT = 8  # max number of doublings replacing a multiplication
+
+# %% 16-bit arithmetic
+
+def signed(value: int) -> int:
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def fold_unary(uop: str, x: int) -> int:
+    '''Folds (uop x), for constant x.'''
+    if uop == '-':
+        return -x & WORD
+    return ~x & WORD  # '~'
+
+
+def fold_binary(op: str, x: int, y: int) -> Optional[int]:
+    '''Folds (x op y), for constant x and y.
+    Returns None when the operation must be left to the run time, i.e. a
+        division by zero (Sys.error), or by/of -32768 (Math.abs overflows).'''
+    if op == '+':
+        return (x + y) & WORD
+    if op == '-':
+        return (x - y) & WORD
+    if op == '*':
+        return (x * y) & WORD
+    if op == '/':
+        if y == 0 or x == 0x8000 or y == 0x8000:
+            return None
+        q = abs(signed(x)) // abs(signed(y))
+        return -q & WORD if (signed(x) < 0) != (signed(y) < 0) else q
+    if op == '&':
+        return x & y
+    if op == '|':
+        return x | y
+    if op == '=':
+        return TRUE if x == y else 0
+    if op == '<':
+        return TRUE if (x - y) & 0x8000 else 0
+    if op == '>':
+        d = (x - y) & WORD
+        return TRUE if d and not d & 0x8000 else 0
+    raise ValueError(f"Unknown operator: [{op}]")
+
+
+def power_of_two(value: int) -> Optional[int]:
+    '''Returns k if value is 2^k or -2^k (k >= 1, as a signed word), else None.'''
+    magnitude = abs(signed(value))
+    if magnitude < 2 or magnitude & (magnitude - 1):
+        return None
+    return magnitude.bit_length() - 1
+
+# %% folding of AST nodes
+
+def constant_value(node: Node) -> Optional[int]:
+    '''Returns the value of a constant expression node (as a 16-bit word), or None.'''
+    if isinstance(node, IntConst):
+        return node.value
+    if isinstance(node, KeywordConst) and node.keyword != "this":
+        return TRUE if node.keyword == "true" else 0
+    return None
+
+
+def is_boolean(node: Node) -> bool:
+    '''Checks whether an expression is always true (-1) or false (0):
+    a comparison, a boolean constant, or ~, & and | of booleans.'''
+    if isinstance(node, Binary):
+        if node.op in {'<', '>', '='}:
+            return True
+        return node.op in {'&', '|'} and is_boolean(node.lhs) and is_boolean(node.rhs)
+    if isinstance(node, Unary):
+        return node.op == '~' and is_boolean(node.operand)
+    return constant_value(node) in (0, TRUE)
+
+
+def is_pure(node: Node) -> bool:
+    '''Checks whether an expression can be dropped or evaluated twice.'''
+    return isinstance(node, (Var, IntConst, KeywordConst))
+
+
+def fold_node(node: Node) -> Node:
+    '''Folds a node whose operands are already folded.'''
+    if isinstance(node, Unary):
+        x = constant_value(node.operand)
+        if x is not None:
+            return IntConst(fold_unary(node.op, x))
+        if isinstance(node.operand, Unary) and node.operand.op == node.op:
+            # ~~x = --x = x
+            return node.operand.operand
+        return node
+    if not isinstance(node, Binary):
+        return node
+    op, x, y = node.op, constant_value(node.lhs), constant_value(node.rhs)
+    if x is not None and y is not None:
+        value = fold_binary(op, x, y)
+        return node if value is None else IntConst(value)
+    if y is not None:
+        return simplify(op, node.lhs, y) or node
+    if x is not None:
+        if op == '-' and x == 0:
+            return fold_node(Unary('-', node.rhs))
+        if op in {'+', '*', '&', '|'}:  # commutative
+            return simplify(op, node.rhs, x) or node
+    return node
+
+
+def simplify(op: str, x: Node, c: int) -> Optional[Node]:
+    '''Simplifies (x op c) for a constant c (or returns None).'''
+    if (op in {'+', '-', '|'} and c == 0) or (op == '*' and c == 1) \
+            or (op == '&' and c == TRUE):
+        # x + 0 = x - 0 = x | 0 = x * 1 = x & true = x
+        return x
+    if is_pure(x) and ((op in {'*', '&'} and c == 0) or (op == '|' and c == TRUE)):
+        # x * 0 = x & 0 = 0, x | true = true
+        return IntConst(c)
+    return None
@@ -8,6 +8,7 @@ from pathlib import Path
 
 import argparse
 
+from ParseTree import XmlTreeBuilder
 from CompilationEngine import CompilationEngine
 
 # %% command-line arguments
@@ -26,7 +27,7 @@ def _main():
 
     # process each jack file
     for jack_file in jack_files:
-        engine = CompilationEngine(jack_file)
+        engine = CompilationEngine(jack_file, listener=XmlTreeBuilder())
         engine.compile_class()
         engine.write_to_xml()
 
@@ -8,38 +8,91 @@ For each source Xxx.jack file, the program
     3. uses a CompilationEngine, a SymbolTable, and a VMWriter
        for parsing the input file and emitting the translated
        VM code into the output file.
+Since each class is compiled independently, the files can be compiled
+    on a pool of processes (--jobs N).
+Files whose outputs are still valid are skipped (see BuildCache).
+With --opt, constant expressions are folded (see Folding); with
+    --const-statics too, the statics set to a constant by Xxx.init are
+    propagated (for the programs running every Xxx.init first, see Passes).
+With --map, the source map of Xxx.vm is written to Xxx.vm.map (see VMWriter).
 """
 
 # %% import modules
 
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 import argparse
 
+from BuildCache import BuildCache
+from VMWriter import VMWriter
+from ParseTree import XmlTreeBuilder
 from CompilationEngine import CompilationEngine
 
-# %% command-line arguments
+# %% compile a jack file
 
-parser = argparse.ArgumentParser()
-parser.add_argument("src", help="Jack source file(s)")
-parser.add_argument("--xml", help="Set to generate xml", action="store_true")
-options = parser.parse_args()
+def compile_jack_file(jack_file: Path, write_xml: bool=False, streaming: bool=False,
+                      optimize: bool=False, write_map: bool=False, const_statics: bool=False):
+    # the parse tree is only built when it is written to xml
+    listener = XmlTreeBuilder() if write_xml else None
+    vm_writer = VMWriter(jack_file.with_suffix(".vm"), write_map)
+    engine = CompilationEngine(jack_file, streaming, listener, vm_writer, optimize, const_statics)
+    engine.compile_class()
+    engine.close(write_xml=write_xml)
 
 # %% main function
 
-def _main():
+def _main(options):
 
     # cmd-line arg parsing
     src = Path(options.src)
     jack_files = [*src.glob("*.jack")] if src.is_dir() else [src]
+    src_dir = src if src.is_dir() else src.parent
+
+    # skip the jack files whose outputs are still valid
+    if options.clear_cache:
+        BuildCache.clear(src_dir)
+    if not options.no_cache:
+        cache = BuildCache(src_dir, {"xml": options.xml, "opt": options.opt, "map": options.map,
+                                     "const-statics": options.const_statics})
+        jack_files = [jack_file for jack_file in jack_files if not cache.lookup(jack_file)]
 
     # process each jack file
-    for jack_file in jack_files:
-        engine = CompilationEngine(jack_file)
-        engine.compile_class()
-        engine.close(write_xml=options.xml)
+    if options.jobs > 1 and len(jack_files) > 1:
+        n = len(jack_files)
+        with ProcessPoolExecutor(max_workers=options.jobs) as pool:
+            # consume the results to re-raise any compilation error
+            for _ in pool.map(compile_jack_file, jack_files, [options.xml]*n,
+                              [options.streaming]*n, [options.opt]*n, [options.map]*n,
+                              [options.const_statics]*n):
+                pass
+    else:
+        for jack_file in jack_files:
+            compile_jack_file(jack_file, options.xml, options.streaming, options.opt, options.map,
+                              options.const_statics)
+
+    # update the build cache
+    if not options.no_cache:
+        for jack_file in jack_files:
+            cache.store(jack_file)
+        cache.close()
 
 # %% call the main function
 
 if __name__ == "__main__":
-    _main()
+
+    # command-line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("src", help="Jack source file(s)")
+    parser.add_argument("--xml", help="Set to generate xml", action="store_true")
+    parser.add_argument("--streaming", help="Set to tokenize lazily (for huge sources)", action="store_true")
+    parser.add_argument("--opt", help="Set to fold constant expressions", action="store_true")
+    parser.add_argument("--const-statics", help="With --opt, set to propagate the constant statics "
+                        "set by Xxx.init (assumes that Xxx.init runs first)", action="store_true")
+    parser.add_argument("--map", help="Set to write the source maps (Xxx.vm.map)", action="store_true")
+    parser.add_argument("--no-cache", help="Set to compile without the build cache", action="store_true")
+    parser.add_argument("--clear-cache", help="Set to drop the build cache first", action="store_true")
+    parser.add_argument("--jobs", "-j", help="Number of processes compiling in parallel", type=int, default=1)
+    options = parser.parse_args()
+
+    _main(options)
@@ -8,68 +8,181 @@ Also, it parses and provides the type of each token.
 
 import re
 
-from typing import List
-from itertools import chain
+from array import array
+from typing import Iterator, List, Tuple
+from operator import add, sub
+from itertools import accumulate, chain, islice, repeat
 
 from MyTypes import TokenType
 
 # %% regex patterns
 
-PATT_STR = r"\"[^\"\n]+\""
-PATT_STR_CONST = '^' + PATT_STR + '$'
-PATT_IDENTIFIER = r"^[a-zA-Z_]\w*$"
+# a single master pattern: captures any run of white space and comments,
+# then the next token; the run is possessive (*+), so a comment is never
+# re-scanned as tokens, and '/*' is captured only when it is never closed;
+# trailing white space and comments are captured with an empty token;
+# a run of word chars is a single token, so 1abc is rejected (see classify)
+PATT_TOKEN = re.compile(
+    r"((?:\s+|//[^\n]*|/\*.*?\*/)*+)"
+    r"(\"[^\"\n]*\"|\w+|/\*|\S|\Z)",
+    re.DOTALL
+)
 
-# %% utils
+# token type codes (as stored in a TokenStream) -> token types
+TOKEN_TYPES = {t.value: t for t in TokenType}
 
-def is_string_constant(block: str):
-    return re.match(PATT_STR_CONST, block)
+# %% token classification
 
+class Lexicon(dict):
+    '''{lexeme: lexeme_id}, each distinct lexeme is interned and classified only once.'''
 
-def is_identifier(block: str):
-    return re.match(PATT_IDENTIFIER, block)
+    def __init__(self) -> None:
+        super().__init__()
+        self.lexemes = []         # [lexeme], indexed by lexeme_id
+        self.kinds = array('b')   # [token type code], indexed by lexeme_id
+
+    def __missing__(self, lexeme: str) -> int:
+        kind = classify(lexeme)
+        self[lexeme] = lexeme_id = len(self.lexemes)
+        self.lexemes.append(lexeme)
+        self.kinds.append(kind.value)
+        return lexeme_id
+
+
+def classify(token: str) -> TokenType:
+    '''Returns the type of the given token.'''
+    if token in JackTokenizer.keywords:
+        return TokenType.KEYWORD
+    elif token in JackTokenizer.symbols:
+        return TokenType.SYMBOL
+    c = token[0]
+    if c == '"':
+        # string: a sequence of chars not including " or \n
+        if len(token) < 2 or token[-1] != '"':
+            raise Exception(f"Unterminated string: [{token}]")
+        if len(token) == 2:
+            raise Exception(f"Empty string constant: [{token}]")
+        return TokenType.STRING_CONST
+    elif c.isdigit():
+        # integer in range 0...32767
+        if not token.isdigit():
+            raise Exception(f"Unrecognized token: [{token}]")
+        if int(token) > 32767:
+            raise OverflowError(f"[{token}] is out-of-range!")
+        return TokenType.INT_CONST
+    elif c == '_' or (c.isascii() and c.isalpha()):
+        # indentifier: a sequence of letters, digits, and _
+        # (not starting with a digit)
+        return TokenType.IDENTIFIER
+    elif token == "/*":
+        raise Exception("Unterminated comment: [/*]")
+    else:
+        raise Exception(f"Unrecognized token: [{token}]")
+
+# %% token stream
+
+class TokenStream:
+    '''Tokens of a Jack source, stored in parallel arrays:
+    token type codes, interned lexeme ids, and 1-based lines and columns.'''
+
+    __slots__ = ("lexicon", "kinds", "ids", "lines", "cols")
+
+    def __init__(self, codes: str, lexicon: Lexicon) -> None:
+        '''Scans Jack source code in a single pass.'''
+        # [skipped, prefix, token, skipped, prefix, token, ..., rest]
+        parts = PATT_TOKEN.split(codes)
+        prefixes, tokens = parts[1::3], parts[2::3]
+        while tokens and not tokens[-1]:
+            prefixes.pop(), tokens.pop()
+        try:
+            self.ids = array('I', map(lexicon.__getitem__, tokens))
+        except Exception as e:
+            raise type(e)(f"{e} (line {locate(codes, lexicon)})")
+        self.lexicon = lexicon
+        self.kinds = array('b', map(lexicon.kinds.__getitem__, self.ids))
+        # offset of token i = len(prefix_0..i) + len(token_0..i-1)
+        offsets = accumulate(map(add, map(len, prefixes), map(len, chain([""], tokens))))
+        # line of token i = 1 + number of line breaks in prefix_0..i
+        n_breaks = accumulate(map(str.count, prefixes, repeat("\n")), initial=1)
+        self.lines = array('I', islice(n_breaks, 1, None))
+        # column of token i = offset of token i - offset of its line's 1st char + 1
+        line_ends = [-1, -1, *(m.start() for m in re.finditer("\n", codes))]
+        self.cols = array('I', map(sub, offsets, map(line_ends.__getitem__, self.lines)))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def token_type(self, i: int) -> TokenType:
+        '''Returns the type of the i-th token.'''
+        return TOKEN_TYPES[self.kinds[i]]
+
+    def token(self, i: int) -> str:
+        '''Returns the i-th token.'''
+        return self.lexicon.lexemes[self.ids[i]]
+
+    def position(self, i: int) -> Tuple[int, int]:
+        '''Returns the (line, column) of the i-th token.'''
+        return self.lines[i], self.cols[i]
+
+    def tokens(self) -> List[str]:
+        return [*map(self.lexicon.lexemes.__getitem__, self.ids)]
+
+
+def locate(codes: str, lexicon: Lexicon) -> int:
+    '''Returns the line number of the first token that cannot be classified.'''
+    for m in PATT_TOKEN.finditer(codes):
+        if m.group(2) and m.group(2) not in lexicon:
+            return codes.count("\n", 0, m.start(2)) + 1
+    return -1
+
+# %% streaming
+
+CHUNK_SIZE = 1 << 16  # chars read from the source at a time in streaming mode
+
+
+def stream_tokens(jack_file_path, lexicon: Lexicon, chunk_size: int=CHUNK_SIZE) \
+    -> Iterator[Tuple[int, int, int]]:
+    '''Lazily scans a Jack source file chunk by chunk.
+    Yields (lexeme_id, line, column) for each token.'''
+    buffer, line, line_end = "", 1, -1  # line_end: offset of the last line break
+    with open(jack_file_path, 'r') as f:
+        eof = False
+        while not eof:
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            consumed = 0
+            for m in PATT_TOKEN.finditer(buffer):
+                token = m.group(2)
+                # a token touching the end of the buffer may be cut by the chunk
+                # boundary; '/*' and '"' may be closed in the next chunk
+                if not eof and (m.end() == len(buffer) or token == "/*" \
+                    or (token == '"' and "\n" not in buffer[m.end():])):
+                    break
+                if not token:  # end of file
+                    break
+                prefix = m.group(1)
+                n_breaks = prefix.count("\n")
+                if n_breaks:
+                    line += n_breaks
+                    line_end = m.start(1) + prefix.rindex("\n")
+                try:
+                    lexeme_id = lexicon[token]
+                except Exception as e:
+                    raise type(e)(f"{e} (line {line})")
+                yield lexeme_id, line, m.start(2) - line_end
+                consumed = m.end()
+            # keep the unscanned part (starting with white space or comments)
+            buffer = buffer[consumed:]
+            line_end -= consumed
 
 # %% jack file processing
 
-def process_line(line: str) -> List[str]:
-    line = re.sub("//.*$", "", line)
-    line = line.strip()
-    return re.findall(r'\S*".*"\S*|\S+', line)
-
-
-def split_into_tokens(block: str) -> List[str]:
-    # step 1: extract strings
-    parts = re.split('('+PATT_STR+')', block)
-    # step 2: split each part that is not a string into tokens
-    patt = '([' + re.escape("".join(JackTokenizer.symbols)) + '])'
-    tokens = [[part] if '"' in part else re.split(patt, part) for part in parts]
-    return [*chain(*tokens)]
-
-
-def process_code_block(block: str) -> List[str]:
-    # when the given block is a stand-alone token
-    if block in JackTokenizer.keywords \
-        or block in JackTokenizer.symbols \
-        or block.isdigit() \
-        or is_string_constant(block) \
-        or is_identifier(block):
-        return [block]
-    else:  # the given block is a collection of tokens
-        return split_into_tokens(block)
-
-def get_tokens(jack_file_path):
+def get_tokens(jack_file_path) -> List[str]:
     # read the code as str
     with open(jack_file_path, 'r') as f:
         codes = f.read()
-    # erase block comments
-    # NOTE: *? will match in a non-greedy fasion
-    codes = re.sub(r"/\*.*?\*/", " ", codes, flags=re.DOTALL)
-    # split codes into lines
-    lines = [process_line(line) for line in codes.split("\n")]
-    # flatten processed lines into code blocks
-    code_blocks = [*chain(*lines)]
-    # split code blocks into tokens
-    tokens = [process_code_block(block) for block in code_blocks]
-    return [tkn for tkn in chain(*tokens) if tkn]
+    return TokenStream(codes, JackTokenizer.lexicon).tokens()
 
 # %% class definition
 
@@ -85,78 +198,82 @@ class JackTokenizer:
         '{', '}', '(', ')', '[', ']', '.', ',', ';', 
         '+', '-', '*', '/', '&', '|', '<', '>', '=', '~'
     }
+    lexicon = Lexicon()  # shared by all the tokenizers
 
-    def __init__(self, jack_file_path):
-        self.tokens = get_tokens(jack_file_path)
-        self.n_tokens = len(self.tokens)
-        self.i_curr_token = -1
+    def __init__(self, jack_file_path, streaming=False):
+        '''Opens the input .jack file and gets ready to tokenize it.
+        Note: In streaming mode, tokens are scanned lazily as they are
+              consumed, instead of scanning the whole file upfront.
+        '''
+        self.jack_file_path = jack_file_path
+        self.lexemes = JackTokenizer.lexicon.lexemes
+        self.kinds = JackTokenizer.lexicon.kinds
+        if streaming:
+            self.stream = None
+            self.source = stream_tokens(jack_file_path, JackTokenizer.lexicon)
+        else:
+            with open(jack_file_path, 'r') as f:
+                codes = f.read()
+            self.stream = TokenStream(codes, JackTokenizer.lexicon)
+            self.source = zip(self.stream.ids, self.stream.lines, self.stream.cols)
+        self.next = next(self.source, None)  # (lexeme_id, line, column)
         self.curr_token = None  # initially, there is no current token
+        self.curr_type = None
+        self.curr_pos = None
 
     def has_more_tokens(self):
         '''Are there more tokens in the input'''
-        return self.i_curr_token < self.n_tokens - 1
+        return self.next is not None
 
     def advance(self):
         '''Gets the next token and makes it the current token'''
         assert self.has_more_tokens()
-        self.i_curr_token += 1
-        self.curr_token = self.tokens[self.i_curr_token]
+        lexeme_id, self.curr_pos = self.next[0], self.next[1:]
+        self.curr_type = TOKEN_TYPES[self.kinds[lexeme_id]]
+        self.curr_token = self.lexemes[lexeme_id]
+        self.next = next(self.source, None)
     
     def token_lookahead(self):
         '''Checks the next token'''
         assert self.has_more_tokens()
-        return self.tokens[self.i_curr_token+1]
+        return self.lexemes[self.next[0]]
 
     def token_type(self):
         '''Returns the type of the current token'''
-        if self.curr_token is None:
-            # when there is no current token
-            return None
-        elif self.curr_token in JackTokenizer.keywords:
-            # keyword
-            return TokenType.KEYWORD
-        elif self.curr_token in JackTokenizer.symbols:
-            # symbol
-            return TokenType.SYMBOL
-        elif self.curr_token.isdigit():
-            # integer in range 0...32767
-            if int(self.curr_token) <= 32767:
-                return TokenType.INT_CONST
-            else:
-                raise OverflowError(f"[{self.curr_token}] is out-of-range!")
-        elif is_string_constant(self.curr_token):
-            # string: a sequence of chars not including " or \n
-            return TokenType.STRING_CONST
-        elif is_identifier(self.curr_token):
-            # indentifier: a sequence of letters, digits, and _
-            # (not starting with a digit)
-            return TokenType.IDENTIFIER
-        else:
-            raise Exception(f"Unrecognized token: [{self.curr_token}]")
+        return self.curr_type
+
+    def position(self):
+        '''Returns the (line, column) of the current token'''
+        return self.curr_pos
+
+    def location(self):
+        '''Returns the location of the current token as "file:line:column"'''
+        line, col = self.curr_pos
+        return f"{self.jack_file_path}:{line}:{col}"
 
     def keyword(self):
         '''Returns the keyword which is the current token'''
-        assert self.token_type() == TokenType.KEYWORD
+        assert self.curr_type == TokenType.KEYWORD
         return self.curr_token  # TODO
 
     def symbol(self):
         '''Returns the character which is the current token'''
-        assert self.token_type() == TokenType.SYMBOL
+        assert self.curr_type == TokenType.SYMBOL
         return self.curr_token
 
     def identifier(self):
         '''Returns the string which is the current token'''
-        assert self.token_type() == TokenType.IDENTIFIER
+        assert self.curr_type == TokenType.IDENTIFIER
         return self.curr_token
 
     def int_val(self):
         '''Returns the integer value of the current token'''
-        assert self.token_type() == TokenType.INT_CONST
+        assert self.curr_type == TokenType.INT_CONST
         return int(self.curr_token)
 
     def string_val(self):
         '''Returns the string value of the current token'''
-        assert self.token_type() == TokenType.STRING_CONST
+        assert self.curr_type == TokenType.STRING_CONST
         return self.curr_token.strip('"')
 
 # %% testing
@@ -0,0 +1,81 @@
+"""
+This module defines the listeners that a CompilationEngine notifies
+    while it parses a class, so that a parse tree is only built when
+    one is requested (e.g. with --xml).
+"""
+
+# %% import libs
+
+from pathlib import Path
+
+import xml.etree.ElementTree as ET
+
+from utils import pretty_print
+
+# %% listener interface
+
+class ParseTreeListener:
+    """Receives the parse events of a CompilationEngine (no-ops by default)."""
+
+    def enter(self, name: str) -> None:
+        """Enters a non-terminal, e.g. 'class', 'statements'."""
+
+    def exit(self) -> None:
+        """Exits the current non-terminal."""
+
+    def empty(self) -> None:
+        """Marks the current non-terminal as empty."""
+
+    def terminal(self, tag: str, text: str) -> None:
+        """Adds a terminal, e.g. ('keyword', 'class'), ('symbol', '{')."""
+
+    def identifier(self, name: str, category: str, index: int, usage: str) -> None:
+        """Adds an identifier with its symbol table properties (index < 0 if none)."""
+
+# %% xml tree builder
+
+class XmlTreeBuilder(ParseTreeListener):
+    """Builds the parse tree as an xml element tree."""
+
+    def __init__(self) -> None:
+        self.root = None     # root for the element tree
+        self.parents = []    # stack of the open non-terminals
+
+    def enter(self, name: str) -> None:
+        if self.parents:
+            node = ET.SubElement(self.parents[-1], name)
+        else:
+            assert self.root is None
+            node = self.root = ET.Element(name)
+        self.parents.append(node)
+
+    def exit(self) -> None:
+        self.parents.pop()
+
+    def empty(self) -> None:
+        self.parents[-1].text = " "
+
+    def terminal(self, tag: str, text: str) -> None:
+        elem = ET.SubElement(self.parents[-1], tag)
+        elem.text = text
+
+    def identifier(self, name: str, category: str, index: int, usage: str) -> None:
+        elem = ET.SubElement(self.parents[-1], "identifier")
+        # name
+        sub_elem = ET.SubElement(elem, "name")
+        sub_elem.text = name
+        # category
+        sub_elem = ET.SubElement(elem, "category")
+        sub_elem.text = category
+        # index
+        if index >= 0:
+            sub_elem = ET.SubElement(elem, "index")
+            sub_elem.text = str(index)
+        # usage
+        sub_elem = ET.SubElement(elem, "usage")
+        sub_elem.text = usage
+
+    def write(self, xml_file_path: Path) -> None:
+        """Writes the parse tree to xml."""
+        pretty_print(self.root)
+        ET.ElementTree(self.root).write(xml_file_path)
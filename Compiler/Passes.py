@@ -0,0 +1,139 @@
+"""
+The optimization passes over the AST of a class (see AST).
+A pass rewrites the tree of a class in place. The passes are registered
+    with the @ast_pass(name) decorator, and run in the order of PIPELINE
+    (a pass may run several times, e.g. folding again what another pass
+    made constant).
+"""
+
+# %% import libs
+
+from collections import Counter
+from typing import Callable, Dict, List
+
+from MyTypes import SegmentType
+from AST import Node, Class, IntConst, Var, Call, Let, If, While, Return, \
+    Subroutine, rewrite, rewrite_list, walk
+from Folding import constant_value, fold_node
+
+Pass = Callable[[Class], None]
+
+# %% pass registry
+
+PASSES: Dict[str, Pass] = {}
+
+def ast_pass(name: str):
+    def register(func: Pass) -> Pass:
+        PASSES[name] = func
+        return func
+    return register
+
+# %% passes
+
+@ast_pass("fold")
+def fold(cls: Class) -> None:
+    '''Folds the constant expressions (see Folding).'''
+    rewrite(cls, fold_node)
+
+
+@ast_pass("const-statics")
+def const_statics(cls: Class) -> None:
+    '''Propagates the values of the statics that are never reassigned, i.e.
+    assigned once, by a constant, at the top level of the class's init function.
+    Note: Assumes that Xxx.init runs before the other subroutines of Xxx
+          (e.g. Sys.init initializes the OS classes first). Nothing in Jack
+          guarantees it, so the pass is not in PIPELINE: it runs first on
+          request (--const-statics), for the programs that do. In init itself, a static is only known
+          after its assignment, and only if init does not call the class's
+          subroutines before.'''
+    init = next((sub for sub in cls.subroutines
+                 if sub.kind == "function" and sub.name == "init"), None)
+    if init is None:
+        return
+    n_lets = Counter(node.index for node in walk(cls)
+                     if isinstance(node, Let) and node.segment == SegmentType.STATIC)
+    known = {}  # {static index: value}
+    body = []
+    for stmt in init.body:
+        body += rewrite_list([stmt], substitute_statics(dict(known)))
+        if any(isinstance(node, Call) and node.name.startswith(cls.name + '.')
+               for node in walk(stmt)):
+            break
+        if isinstance(stmt, Let) and stmt.segment == SegmentType.STATIC \
+                and n_lets[stmt.index] == 1:
+            value = constant_value(stmt.value)
+            if value is not None:
+                known[stmt.index] = value
+    init.body = body + init.body[len(body):]
+    if known:
+        for sub in cls.subroutines:
+            if sub is not init:
+                sub.body = rewrite_list(sub.body, substitute_statics(known))
+
+
+def substitute_statics(known: Dict[int, int]):
+    def substitute(node: Node) -> Node:
+        if isinstance(node, Var) and node.segment == SegmentType.STATIC \
+                and node.index in known:
+            return IntConst(known[node.index])
+        return node
+    return substitute
+
+
+@ast_pass("branch-fold")
+def branch_fold(cls: Class) -> None:
+    '''Replaces an if statement with a constant condition by the branch taken,
+    and drops the while statements with a false condition.
+    (The while statements with a true condition are lowered without a test.)'''
+    def fold_branch(node: Node):
+        if isinstance(node, If):
+            value = constant_value(node.cond)
+            if value is None:
+                return node
+            return node.then if value else (node.orelse or [])
+        if isinstance(node, While) and constant_value(node.cond) == 0:
+            return None
+        return node
+    rewrite(cls, fold_branch)
+
+
+def terminates(stmts: List[Node]) -> bool:
+    '''Checks whether a list of statements always ends with a return.'''
+    if not stmts:
+        return False
+    last = stmts[-1]
+    if isinstance(last, If):
+        return last.orelse is not None and terminates(last.then) and terminates(last.orelse)
+    return isinstance(last, Return)
+
+
+@ast_pass("dce")
+def dead_code(cls: Class) -> None:
+    '''Drops the statements following a return (in the same statement list).'''
+    def trim(stmts: List[Node]) -> List[Node]:
+        for i, stmt in enumerate(stmts):
+            if terminates([stmt]):
+                return stmts[:i+1]
+        return stmts
+
+    def trim_lists(node: Node) -> Node:
+        if isinstance(node, (Subroutine, While)):
+            node.body = trim(node.body)
+        elif isinstance(node, If):
+            node.then = trim(node.then)
+            if node.orelse is not None:
+                node.orelse = trim(node.orelse)
+        return node
+    rewrite(cls, trim_lists)
+
+# %% pass manager
+
+PIPELINE = ["fold", "branch-fold", "dce"]
+CONST_STATICS_PIPELINE = ["const-statics", *PIPELINE]
+
+
+def run_passes(cls: Class, names: List[str]=PIPELINE) -> Class:
+    '''Runs the given passes over the AST of a class.'''
+    for name in names:
+        PASSES[name](cls)
+    return cls
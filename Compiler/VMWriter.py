@@ -1,13 +1,49 @@
 """
 This module features a set of simple routines for
     writing VM commands into the output file.
+The commands are collected in an in-memory buffer of
+    (command type, arg1, arg2) records, and written in one bulk write
+    when the writer is flushed/closed. Downstream consumers may take
+    the records directly, without serialising them to text.
+With a source map, the (line, column) in the Jack source of the statement
+    (or subroutine) each command comes from is kept, and written to Xxx.vm.map
+    as JSON lines {"vm", "cmd", "jack", "line", "col"}: the commands from
+    index cmd on, up to the next line, come from jack:line:col.
 """
 
 # %% import libs
 
-from MyTypes import SegmentType
+from MyTypes import SegmentType, CmdType
+
+import json
 
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# %% pre-rendered strings
+
+SEGMENT_NAMES = {segment: segment.name.lower() for segment in SegmentType}
+
+CMD_PREFIXES = {
+    CmdType.C_ARITHMETIC: "",
+    CmdType.C_PUSH      : "push ",
+    CmdType.C_POP       : "pop ",
+    CmdType.C_LABEL     : "label ",
+    CmdType.C_GOTO      : "goto ",
+    CmdType.C_IF        : "if-goto ",
+    CmdType.C_FUNCTION  : "function ",
+    CmdType.C_RETURN    : "return",
+    CmdType.C_CALL      : "call ",
+}
+
+
+def render(commands: List[Tuple[CmdType, str, int]]) -> str:
+    """Renders VM command records as VM code."""
+    prefixes = CMD_PREFIXES
+    return "".join([
+        f"{prefixes[cmd_t]}{arg1}\n" if arg2 is None else f"{prefixes[cmd_t]}{arg1} {arg2}\n"
+        for cmd_t, arg1, arg2 in commands
+    ])
 
 # %% class definition
 
@@ -15,55 +51,106 @@ class VMWriter:
 
     # arithmetic-logical commands
     al_op2cmd = {
-        '+': "add", '-': "sub", '=': "eq", 
+        '+': "add", '-': "sub", '=': "eq",
         '>': "gt", '<': "lt", '&': "and", '|': "or"
     }
     al_op2func = {'*': "Math.multiply", '/': "Math.divide"}
     al_uop2cmd = {'-': "neg", '~': "not"}
-
-    def __init__(self, vm_file_path: Path) -> None:
-        """Creates a new output .vm file/stream, and prepares it for writing."""
-        self.f_vm = open(vm_file_path, "w")
+    al_cmds = {"add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"}
+
+    def __init__(self, vm_file_path: Path=None, write_map: bool=False) -> None:
+        """Creates a new output .vm file/stream, and prepares it for writing.
+        Note: Without a file path, the commands are only kept in memory.
+              With write_map, the source map is written to Xxx.vm.map too.
+        """
+        self.vm_file_path = vm_file_path
+        self.write_map = write_map
+        self.commands: List[Tuple[CmdType, str, int]] = []  # [(cmd_type, arg1, arg2)]
+        self.positions: List[Tuple[int, int, int]] = []     # [(first command, line, column)]
+
+    def set_position(self, pos: Optional[Tuple[int, int]]) -> None:
+        """Sets the (line, column) in the source of the next commands."""
+        if pos is None:
+            return
+        if self.positions and self.positions[-1][0] == len(self.commands):
+            self.positions.pop()  # no command from the previous position
+        if not self.positions or self.positions[-1][1:] != tuple(pos):
+            self.positions.append((len(self.commands), *pos))
 
     def write_push(self, segment: SegmentType, index: int) -> None:
         """Writes a VM push command."""
-        self.f_vm.write(f"push {segment.name.lower()} {index}\n")
+        self.commands.append((CmdType.C_PUSH, SEGMENT_NAMES[segment], index))
 
     def write_pop(self, segment: SegmentType, index: int) -> None:
         """Writes a VM pop command."""
         assert segment != SegmentType.CONSTANT, "Cannot pop a constant!"
-        self.f_vm.write(f"pop {segment.name.lower()} {index}\n")
+        self.commands.append((CmdType.C_POP, SEGMENT_NAMES[segment], index))
 
     def write_arithmetic(self, command: str) -> None:
         """Writes a VM arithmetic-logical command."""
-        assert command in {"add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"}
-        self.f_vm.write(command + '\n')
+        assert command in VMWriter.al_cmds
+        self.commands.append((CmdType.C_ARITHMETIC, command, None))
 
     def write_label(self, label: str) -> None:
         """Writes a VM label command."""
-        self.f_vm.write(f"label {label}\n")
+        self.commands.append((CmdType.C_LABEL, label, None))
 
     def write_goto(self, label: str) -> None:
         """Writes a VM goto command."""
-        self.f_vm.write(f"goto {label}\n")
+        self.commands.append((CmdType.C_GOTO, label, None))
 
     def write_if(self, label: str) -> None:
         """Writes a VM if-goto command."""
-        self.f_vm.write(f"if-goto {label}\n")
+        self.commands.append((CmdType.C_IF, label, None))
 
     def write_call(self, name: str, n_args: int) -> None:
         """Writes a VM call commands."""
-        self.f_vm.write(f"call {name} {n_args}\n")
+        self.commands.append((CmdType.C_CALL, name, n_args))
 
     def write_function(self, name: str, n_vars: int) -> None:
         """Writes a VM function command."""
-        self.f_vm.write(f"function {name} {n_vars}\n")
+        self.commands.append((CmdType.C_FUNCTION, name, n_vars))
 
     def write_return(self) -> None:
         """Writes a VM return command."""
-        self.f_vm.write("return\n")
+        self.commands.append((CmdType.C_RETURN, "", None))
+
+    def write_constant(self, value: int) -> None:
+        """Writes the shortest VM code pushing a 16-bit word (0..65535)."""
+        value &= 0xFFFF
+        if value <= 32767:
+            self.write_push(SegmentType.CONSTANT, value)
+        elif value == 0xFFFF:  # true
+            self.write_push(SegmentType.CONSTANT, 0)
+            self.write_arithmetic("not")
+        elif value == 0x8000:  # -32768
+            self.write_push(SegmentType.CONSTANT, 32767)
+            self.write_arithmetic("not")
+        else:
+            self.write_push(SegmentType.CONSTANT, -value & 0xFFFF)
+            self.write_arithmetic("neg")
+
+    def source_map(self, vm_name: str, jack_name: str) -> List[Dict[str, object]]:
+        """Returns the source map records of the commands."""
+        return [{"vm": vm_name, "cmd": cmd, "jack": jack_name, "line": line, "col": col}
+                for cmd, line, col in self.positions]
+
+    def to_text(self) -> str:
+        """Renders the buffered commands as VM code."""
+        return render(self.commands)
+
+    def map_text(self, vm_name: str, jack_name: str) -> str:
+        """Renders the source map records as JSON lines."""
+        return "".join(json.dumps(record) + "\n" for record in self.source_map(vm_name, jack_name))
 
     def close(self) -> None:
-        """Closes the output file/stream."""
-        print(f"VM file written to [{self.f_vm.name}]")
-        self.f_vm.close()
+        """Flushes the buffered commands to the output file in one write."""
+        if self.vm_file_path is not None:
+            with open(self.vm_file_path, "w") as f_vm:
+                f_vm.write(self.to_text())
+            print(f"VM file written to [{self.vm_file_path}]")
+            if self.write_map:
+                map_file_path = self.vm_file_path.with_suffix(".vm.map")
+                with open(map_file_path, "w") as f_map:
+                    f_map.write(self.map_text(self.vm_file_path.name, self.vm_file_path.with_suffix(".jack").name))
+                print(f"Source map written to [{map_file_path}]")
@@ -28,19 +28,20 @@ def pretty_print(current, parent=None, index=-1, depth=0, indent=" "*2):
             else:
                 pass
 
-# %% a decorator to update parent node and set it back
+# %% a decorator to notify the parse tree listener of a non-terminal
 
-def update_parent(parent_name):
-    def _update_parent(func):
+def grammar_rule(name):
+    def _grammar_rule(func):
         def _inner(self, *args, **kwargs):
-            # backup self.parent
-            parent = self.parent
-            # update self.parent
-            self.parent = ET.SubElement(self.parent, parent_name)
+            # without a listener, no parse tree is built at all
+            if self.listener is None:
+                return func(self, *args, **kwargs)
+            # enter the non-terminal
+            self.listener.enter(name)
             # call func
             res = func(self, *args, **kwargs)
-            # reset self.parent
-            self.parent = parent
+            # exit the non-terminal
+            self.listener.exit()
             return res
         return _inner
-    return _update_parent
+    return _grammar_rule
@@ -0,0 +1,333 @@
+"""
+The Hack CPU Emulator (runs .hack/.asm programs headlessly).
+The ROM is decoded once into a table of predecoded instructions, and the
+    straight-line runs of instructions (basic blocks) are compiled lazily
+    into Python functions, so that a block runs with a single call.
+The RAM is an array('H') of 16-bit words (the ALU works on unsigned values,
+    and the jumps read the sign bit), with the memory maps
+    SCREEN (RAM[16384..24575]) and KBD (RAM[24576]).
+With the symbols of the program (e.g. when it is loaded from .asm), the calls
+    to OS functions with an intrinsic (see Intrinsics) are run natively:
+    the block at the function entry performs the function, and returns.
+Usage: python CPUEmulator.py Prog(.hack|.asm) [--cycles N] [--ram a:b] [--screen out.pbm] [--jack-os]
+"""
+
+# %% import libs
+
+import sys
+import time
+import argparse
+
+from array import array
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from Intrinsics import INTRINSICS, FALLBACK
+
+# %% constants
+
+RAM_SIZE = 32768
+SCREEN = 16384
+KBD = 24576
+SCREEN_WIDTH, SCREEN_HEIGHT = 512, 256
+SCREEN_SIZE = SCREEN_HEIGHT * SCREEN_WIDTH // 16
+SP, LCL, ARG, THIS, THAT = range(5)
+
+# comp bits (a=0) -> expression of x (D) and y (A or M)
+COMP_EXPRS = {
+    0b101010: "0",
+    0b111111: "1",
+    0b111010: "65535",
+    0b001100: "D",
+    0b110000: "Y",
+    0b001101: "D ^ 65535",
+    0b110001: "Y ^ 65535",
+    0b001111: "-D & 65535",
+    0b110011: "-Y & 65535",
+    0b011111: "(D + 1) & 65535",
+    0b110111: "(Y + 1) & 65535",
+    0b001110: "(D - 1) & 65535",
+    0b110010: "(Y - 1) & 65535",
+    0b000010: "(D + Y) & 65535",
+    0b010011: "(D - Y) & 65535",
+    0b000111: "(Y - D) & 65535",
+    0b000000: "D & Y",
+    0b010101: "D | Y",
+}
+
+# jump bits -> condition on the (unsigned) ALU output v
+JUMP_CONDS = {
+    0b001: "0 < v < 32768",
+    0b010: "v == 0",
+    0b011: "v < 32768",
+    0b100: "v >= 32768",
+    0b101: "v != 0",
+    0b110: "v == 0 or v >= 32768",
+    0b111: "True",
+}
+
+# %% decoding
+
+# predecoded instruction: (comp expression, dest bits, jump bits);
+# A-instructions are (None, value, 0)
+Instruct = Tuple[str, int, int]
+
+
+def decode(word: int) -> Instruct:
+    '''Decodes a 16-bit instruction.'''
+    if not word & 0x8000:
+        return None, word, 0
+    comp = COMP_EXPRS.get((word >> 6) & 0b111111)
+    if comp is None:
+        raise ValueError(f"Invalid instruction: [{word:016b}]")
+    y = "ram[A]" if word & 0x1000 else "A"
+    return comp.replace("Y", y), (word >> 3) & 0b111, word & 0b111
+
+
+def compile_instructs(instructs: List[Instruct], start: int, end: int) -> Tuple[str, bool]:
+    '''Generates the body of a function running instructs[start:end].
+    Returns the source code, and whether the code halts (an @pc; 0;JMP loop).
+    M is RAM[A] on 15 bits: A is masked, unless it was set by an A-instruction.'''
+    body = []
+    a_is_address = False  # A < RAM_SIZE (set by an A-instruction in the block)
+    for pc in range(start, end):
+        comp, dest, jump = instructs[pc]
+        if comp is None:
+            body.append(f"A = {dest}")
+            a_is_address = True
+            continue
+        m = "ram[A]" if a_is_address else f"ram[A & {RAM_SIZE - 1}]"
+        comp = comp.replace("ram[A]", m)
+        if not jump and dest in (0b001, 0b010, 0b100):
+            # a single destination
+            target = {0b001: m, 0b010: "D", 0b100: "A"}[dest]
+            body.append(f"{target} = {comp}")
+            a_is_address &= dest != 0b100
+            continue
+        body.append(f"v = {comp}")
+        if jump and dest & 0b100:
+            body.append("T = A")  # jumps go to the A register before the update
+        if dest & 0b001:
+            body.append(f"{m} = v")
+        if dest & 0b010:
+            body.append("D = v")
+        if dest & 0b100:
+            body.append("A = v")
+            a_is_address = False
+        if jump:
+            target = "T" if dest & 0b100 else "A"
+            if jump == 0b111:
+                body.append(f"return {target}, A, D")
+            else:
+                body.append(f"return ({target} if {JUMP_CONDS[jump]} else {pc + 1}), A, D")
+    if not body or not body[-1].startswith("return"):
+        body.append(f"return {end}, A, D")
+    halts = (end - start == 2 and instructs[start] == (None, start, 0)
+             and instructs[start + 1] == ("0", 0, 0b111))
+    return "".join(f"    {line}\n" for line in body), halts
+
+
+def signed(value: int) -> int:
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def load_program(path: Path) -> Tuple[array, Dict[str, int]]:
+    '''Loads a .hack file (or assembles a .asm file) into ROM words.
+    Returns the ROM, and the symbol table (empty for .hack files).'''
+    path = Path(path)
+    symbols = {}
+    if path.suffix == ".asm":
+        sys.path.insert(0, str(Path(__file__).parent.parent / "HackAssembler"))
+        from HackAssembler import assemble
+        with open(path, 'r') as f:
+            return assemble(f, symbols), symbols
+    with open(path, 'r') as f:
+        return array('H', [int(line, 2) for line in f if line.strip()]), symbols
+
+# %% class definition
+
+class CPUEmulator:
+
+    def __init__(self, rom: Sequence[int], symbols: Dict[str, int]=None,
+                 natives: Dict[str, Callable]=None):
+        '''Loads a program (ROM words) and resets the CPU.
+        symbols: the symbol table of the program {symbol: address}.
+        natives: {function name: native implementation}, run at the function
+            entries found in the symbols.
+        '''
+        self.rom = array('H', rom)
+        self.symbols = symbols or {}
+        self.natives = {self.symbols[name]: native for name, native in (natives or {}).items()
+                        if name in self.symbols}
+        self.instructs = [decode(word) for word in self.rom]
+        # {start pc: (block function, number of instructions, halts)}
+        self.blocks: Dict[int, Tuple[Callable, int, bool]] = {}
+        self.steps: Dict[int, Tuple[Callable, int, bool]] = {}  # one-instruction blocks
+        self.ram = array('H', bytes(2 * RAM_SIZE))
+        self.reset()
+
+    def reset(self) -> None:
+        '''Resets the registers (the RAM is kept).'''
+        self.pc = 0
+        self.A = 0
+        self.D = 0
+        self.cycles = 0
+        self.halted = False
+
+    # %% block compilation
+
+    def block_end(self, start: int) -> int:
+        end = start
+        n = len(self.instructs)
+        while end < n:
+            end += 1
+            if self.instructs[end - 1][2]:
+                break
+        return end
+
+    def compile(self, start: int, end: int) -> Tuple[Callable, int, bool]:
+        '''Compiles instructs[start:end] into a function (ram, A, D) -> (pc, A, D).'''
+        body, halts = compile_instructs(self.instructs, start, end)
+        namespace = {}
+        exec(f"def block(ram, A, D):\n{body}", namespace)
+        return namespace["block"], end - start, halts
+
+    def native_block(self, pc: int) -> Tuple[Callable, int, bool]:
+        '''Returns a block running the native implementation of the function at pc.
+        Note: A native run counts as many cycles as the entry block of the function.'''
+        native = self.natives[pc]
+        jack, length, halts = self.compile(pc, self.block_end(pc))
+
+        def block(ram, A, D):
+            frame, arg = ram[LCL], ram[ARG]
+            value = native(self, [signed(v) for v in ram[arg:frame-5]])
+            if value is FALLBACK:
+                return jack(ram, A, D)
+            # return (see CodeWriter.write_return)
+            ret = ram[frame-5]
+            ram[arg] = value & 0xFFFF
+            ram[SP] = arg + 1
+            ram[THAT] = ram[frame-1]
+            ram[THIS] = ram[frame-2]
+            ram[ARG] = ram[frame-3]
+            ram[LCL] = ram[frame-4]
+            return ret, A, D
+
+        return block, length, halts
+
+    def block(self, pc: int) -> Tuple[Callable, int, bool]:
+        blk = self.blocks.get(pc)
+        if blk is None:
+            if pc in self.natives:
+                blk = self.blocks[pc] = self.native_block(pc)
+            else:
+                blk = self.blocks[pc] = self.compile(pc, self.block_end(pc))
+        return blk
+
+    def step_block(self, pc: int) -> Tuple[Callable, int, bool]:
+        blk = self.steps.get(pc)
+        if blk is None:
+            blk = self.steps[pc] = self.compile(pc, pc + 1)
+        return blk
+
+    # %% execution
+
+    def run(self, n_cycles: int) -> int:
+        '''Runs (at most) n_cycles instructions.
+        Stops early if the program halts (an infinite @pc; 0;JMP loop)
+        or runs past the end of the ROM.
+        Returns the number of instructions executed.'''
+        ram, pc, A, D = self.ram, self.pc, self.A, self.D
+        n_rom = len(self.rom)
+        blocks, block = self.blocks, self.block
+        done = 0
+        try:
+            while done < n_cycles:
+                if pc >= n_rom:
+                    self.halted = True
+                    break
+                func, length, halts = blocks.get(pc) or block(pc)
+                if halts:
+                    self.halted = True
+                    break
+                if done + length > n_cycles:
+                    # run the last instructions one by one
+                    func, length, _ = self.step_block(pc)
+                pc, A, D = func(ram, A, D)
+                done += length
+        finally:
+            self.pc, self.A, self.D = pc, A, D
+            self.cycles += done
+        return done
+
+    def step(self) -> int:
+        '''Runs a single instruction.'''
+        return self.run(1)
+
+    # %% memory maps
+
+    def peek(self, address: int) -> int:
+        '''Returns RAM[address] as a signed 16-bit value.'''
+        return signed(self.ram[address])
+
+    def poke(self, address: int, value: int) -> None:
+        self.ram[address] = value & 0xFFFF
+
+    def static(self, class_name: str, index: int) -> int:
+        '''Returns the address of a static variable (from the symbols).'''
+        # statics are named Xxx.vm.i by VMTranslator (Xxx.i in the book)
+        symbol = f"{class_name}.vm.{index}"
+        return self.symbols[symbol if symbol in self.symbols else f"{class_name}.{index}"]
+
+    def screen(self) -> memoryview:
+        '''The SCREEN memory map: 256 rows of 32 words (16 pixels each, LSB first).'''
+        return memoryview(self.ram)[SCREEN:SCREEN + SCREEN_SIZE]
+
+    def set_key(self, key: int) -> None:
+        '''Sets the KBD memory map (0: no key pressed).'''
+        self.ram[KBD] = key
+
+    def write_pbm(self, path: Path) -> None:
+        '''Writes the screen as a plain-text PBM image.'''
+        screen = self.screen()
+        rows = []
+        for r in range(SCREEN_HEIGHT):
+            words = screen[r * 32:(r + 1) * 32]
+            rows.append(" ".join(str((word >> b) & 1) for word in words for b in range(16)))
+        with open(path, 'w') as f:
+            f.write(f"P1\n{SCREEN_WIDTH} {SCREEN_HEIGHT}\n" + "\n".join(rows) + "\n")
+
+# %% main
+
+def _main():
+
+    # argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", help="hack machine code (.hack) or assembly code (.asm) file")
+    parser.add_argument("--cycles", help="Max number of instructions to run", type=int, default=10_000_000)
+    parser.add_argument("--ram", help="RAM range to print, e.g. 256:270", default="0:16")
+    parser.add_argument("--screen", help="Write the screen to a .pbm file")
+    parser.add_argument("--jack-os", help="Set to run the OS in Hack code only (no intrinsics)", action="store_true")
+    options = parser.parse_args()
+
+    rom, symbols = load_program(options.file)
+    emulator = CPUEmulator(rom, symbols, None if options.jack_os else INTRINSICS)
+
+    t0 = time.perf_counter()
+    n = emulator.run(options.cycles)
+    dt = time.perf_counter() - t0
+    status = "halted" if emulator.halted else f"stopped at pc={emulator.pc}"
+    print(f"{n} instructions in {dt:.3f}s ({n / max(dt, 1e-9) / 1e6:.2f} MIPS), {status}")
+
+    a, b = (int(x) for x in options.ram.split(":"))
+    for address in range(a, b):
+        print(f"RAM[{address}] = {emulator.peek(address)}")
+
+    if options.screen:
+        emulator.write_pbm(options.screen)
+        print(f"Screen written to: {options.screen}")
+
+# %% run main
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,316 @@
+"""
+OS intrinsics: native (Python) implementations of the hot OS functions,
+    for the VM emulator and the CPU emulator.
+An intrinsic is called with the engine and the arguments (signed ints),
+    and returns the return value (0 for void functions). It works on the
+    engine's RAM with the same semantics as the Jack implementation in OS/,
+    including the statics it shares with the rest of its class
+    (engine.static(class name, index) returns the address of a static).
+Whenever the Jack code would do something else than compute a result
+    (e.g. call Sys.error on illegal arguments), the intrinsic returns
+    FALLBACK before touching the RAM, and the Jack implementation runs instead.
+Note: The intrinsics rely on the static layout of the classes in OS/.
+      The Jack code compares x and y by the sign of x-y (as the CPU), which
+      overflows when they are more than 32767 apart: the intrinsics compare
+      the same way (see gt, lt), or fall back when they cannot.
+"""
+
+# %% import libs
+
+from math import isqrt
+from array import array
+from typing import Callable, Dict, List
+
+# %% constants
+
+FALLBACK = object()  # returned to run the Jack implementation instead
+
+SCREEN = 16384
+WORDS_PER_ROW = 32
+ROW_CHARS, COL_CHARS = 23, 64  # Output: 23 rows x 64 columns of characters
+
+Intrinsic = Callable[[object, List[int]], int]
+
+# %% comparisons
+
+def gt(x: int, y: int) -> bool:
+    '''x > y, as compared by the translated code (the sign of the 16-bit x-y).'''
+    return 0 < (x - y) & 0xFFFF < 0x8000
+
+
+def lt(x: int, y: int) -> bool:
+    '''x < y, as compared by the translated code.'''
+    return (x - y) & 0x8000 != 0
+
+# %% Math
+
+def math_multiply(engine, args: List[int]) -> int:
+    return args[0] * args[1]
+
+
+def math_divide(engine, args: List[int]) -> int:
+    x, y = args
+    if y == 0:
+        return FALLBACK  # Sys.error(3)
+    if x == -32768 or y == -32768:
+        return FALLBACK
+    q = abs(x) // abs(y)
+    return -q if (x > 0 and y < 0) or (x < 0 and y > 0) else q
+
+
+def math_sqrt(engine, args: List[int]) -> int:
+    x, = args
+    if x < 0:
+        return FALLBACK  # Sys.error(4)
+    return isqrt(x)
+
+
+def math_abs(engine, args: List[int]) -> int:
+    x, = args
+    return -x if x < 0 else x
+
+
+def math_max(engine, args: List[int]) -> int:
+    a, b = args
+    return b if gt(b, a) else a
+
+
+def math_min(engine, args: List[int]) -> int:
+    a, b = args
+    return b if lt(b, a) else a
+
+# %% Memory
+
+def memory_peek(engine, args: List[int]) -> int:
+    address, = args
+    if not 0 <= address < len(engine.ram):
+        return FALLBACK
+    return engine.ram[address]
+
+
+def memory_poke(engine, args: List[int]) -> int:
+    address, value = args
+    if not 0 <= address < len(engine.ram):
+        return FALLBACK
+    engine.ram[address] = value & 0xFFFF
+    return 0
+
+# %% Screen
+
+def in_screen(x: int, y: int) -> bool:
+    return 0 <= x <= 511 and 0 <= y <= 255
+
+
+def fill_row(ram: array, y: int, x1: int, x2: int, black: bool) -> None:
+    '''Sets the pixels (x1..x2, y), x1 <= x2, to the given color.'''
+    row = SCREEN + WORDS_PER_ROW * y
+    q1, r1 = divmod(x1, 16)
+    q2, r2 = divmod(x2, 16)
+    if q1 == q2:
+        masks = [((0xFFFF << r1) & (0xFFFF >> (15 - r2)))]
+    else:
+        masks = [(0xFFFF << r1) & 0xFFFF] + [0xFFFF] * (q2 - q1 - 1) + [0xFFFF >> (15 - r2)]
+    if len(masks) > 2:
+        # the full words in between
+        ram[row+q1+1:row+q2] = array('H', [0xFFFF if black else 0]) * (q2 - q1 - 1)
+    for address, mask in ((row + q1, masks[0]), (row + q2, masks[-1])):
+        ram[address] = (ram[address] | mask) if black else (ram[address] & ~mask & 0xFFFF)
+
+
+def set_pixel(ram: array, x: int, y: int, black: bool) -> None:
+    address = SCREEN + WORDS_PER_ROW * y + (x >> 4)
+    mask = 1 << (x & 15)
+    ram[address] = (ram[address] | mask) if black else (ram[address] & ~mask & 0xFFFF)
+
+
+def screen_color(engine) -> bool:
+    return engine.ram[engine.static("Screen", 0)] != 0  # m_color
+
+
+def draw_line(ram: array, x1: int, y1: int, x2: int, y2: int, black: bool) -> None:
+    if y1 == y2:
+        fill_row(ram, y1, min(x1, x2), max(x1, x2), black)
+        return
+    if x1 == x2:
+        for y in range(min(y1, y2), max(y1, y2) + 1):
+            set_pixel(ram, x1, y, black)
+        return
+    # the same walk as Screen.drawLine
+    dx, da = (x2 - x1, 1) if x1 < x2 else (x1 - x2, -1)
+    dy, db = (y2 - y1, 1) if y1 < y2 else (y1 - y2, -1)
+    a = b = diff = 0
+    while a <= dx and b <= dy:
+        set_pixel(ram, x1 + a * da, y1 + b * db, black)
+        if diff < 0:
+            a += 1
+            diff += dy
+        else:
+            b += 1
+            diff -= dx
+
+
+def screen_clear(engine, args: List[int]) -> int:
+    engine.ram[SCREEN:SCREEN + WORDS_PER_ROW * 256] = array('H', [0]) * (WORDS_PER_ROW * 256)
+    return 0
+
+
+def screen_draw_pixel(engine, args: List[int]) -> int:
+    x, y = args
+    if not in_screen(x, y):
+        return FALLBACK  # Sys.error(7)
+    set_pixel(engine.ram, x, y, screen_color(engine))
+    return 0
+
+
+def screen_draw_line(engine, args: List[int]) -> int:
+    x1, y1, x2, y2 = args
+    if not (in_screen(x1, y1) and in_screen(x2, y2)):
+        return FALLBACK  # Sys.error(8)
+    draw_line(engine.ram, x1, y1, x2, y2, screen_color(engine))
+    return 0
+
+
+def screen_draw_rectangle(engine, args: List[int]) -> int:
+    x1, y1, x2, y2 = args
+    if not (in_screen(x1, y1) and in_screen(x2, y2)):
+        return FALLBACK  # Sys.error(9)
+    black = screen_color(engine)
+    for y in range(min(y1, y2), max(y1, y2) + 1):
+        fill_row(engine.ram, y, min(x1, x2), max(x1, x2), black)
+    return 0
+
+
+def screen_draw_circle(engine, args: List[int]) -> int:
+    x, y, r = args
+    if not in_screen(x, y) or not 0 < r <= 181:
+        return FALLBACK  # Sys.error(12), Sys.error(13)
+    if not (in_screen(x - r, y - r) and in_screen(x + r, y + r)):
+        return FALLBACK  # Sys.error(8) from drawLine, after a partial circle
+    black = screen_color(engine)
+    for dy in range(-r, r + 1):
+        dx = isqrt(r * r - dy * dy)
+        fill_row(engine.ram, y + dy, x - dx, x + dx, black)
+    return 0
+
+# %% Output
+
+def cursor(engine):
+    '''Returns the addresses of the statics charMaps, m_i, m_j.'''
+    return engine.static("Output", 0), engine.static("Output", 1), engine.static("Output", 2)
+
+
+def print_char(engine, c: int) -> None:
+    '''Output.__printChar: blits the character map of c at the cursor.'''
+    ram = engine.ram
+    char_maps, m_i, m_j = cursor(engine)
+    if c < 32 or c > 126:
+        c = 0
+    char_map = ram[(ram[char_maps] + c) & 0xFFFF]
+    i, j = ram[m_i], ram[m_j]
+    address = SCREEN + 352 * i + (j >> 1)
+    for k in range(11):
+        m = ram[char_map + k]
+        if j & 1:
+            ram[address] = (ram[address] & 0x00FF) | ((m << 8) & 0xFFFF)
+        else:
+            ram[address] = (ram[address] & 0xFF00) | m
+        address += WORDS_PER_ROW
+
+
+def move_cursor(engine, i: int, j: int) -> None:
+    _, m_i, m_j = cursor(engine)
+    engine.ram[m_i], engine.ram[m_j] = i, j
+    print_char(engine, 32)
+
+
+def cursor_ok(engine) -> bool:
+    _, m_i, m_j = cursor(engine)
+    return engine.ram[m_i] < ROW_CHARS and engine.ram[m_j] < COL_CHARS
+
+
+def advance_cursor(engine) -> None:
+    _, m_i, m_j = cursor(engine)
+    i, j = engine.ram[m_i], engine.ram[m_j]
+    if j == COL_CHARS - 1:
+        move_cursor(engine, 0 if i == ROW_CHARS - 1 else i + 1, 0)
+    else:
+        move_cursor(engine, i, j + 1)
+
+
+def output_print_char_raw(engine, args: List[int]) -> int:
+    if not cursor_ok(engine):
+        return FALLBACK
+    print_char(engine, args[0])
+    return 0
+
+
+def output_move_cursor(engine, args: List[int]) -> int:
+    i, j = args
+    if not (0 <= i < ROW_CHARS and 0 <= j < COL_CHARS):
+        return FALLBACK  # Sys.error(20)
+    move_cursor(engine, i, j)
+    return 0
+
+
+def output_print_char(engine, args: List[int]) -> int:
+    if not cursor_ok(engine):
+        return FALLBACK
+    print_char(engine, args[0])
+    advance_cursor(engine)
+    return 0
+
+
+def output_print_string(engine, args: List[int]) -> int:
+    # String: field Array m_str; field int m_str_length, m_max_length;
+    ram = engine.ram
+    s = args[0] & 0xFFFF
+    if not cursor_ok(engine) or s + 1 >= len(ram):
+        return FALLBACK
+    chars, n = ram[s], ram[s + 1]
+    if n & 0x8000 or chars + n > len(ram):
+        return FALLBACK
+    for k in range(n):
+        print_char(engine, ram[chars + k])
+        advance_cursor(engine)
+    return 0
+
+
+def output_println(engine, args: List[int]) -> int:
+    if not cursor_ok(engine):
+        return FALLBACK
+    _, m_i, _ = cursor(engine)
+    i = engine.ram[m_i]
+    move_cursor(engine, 0 if i == ROW_CHARS - 1 else i + 1, 0)
+    return 0
+
+# %% Sys
+
+def sys_wait(engine, args: List[int]) -> int:
+    duration, = args
+    if duration <= 0:
+        return FALLBACK  # Sys.error(1)
+    return 0
+
+# %% the intrinsics table
+
+INTRINSICS: Dict[str, Intrinsic] = {
+    "Math.multiply": math_multiply,
+    "Math.divide": math_divide,
+    "Math.sqrt": math_sqrt,
+    "Math.abs": math_abs,
+    "Math.max": math_max,
+    "Math.min": math_min,
+    "Memory.peek": memory_peek,
+    "Memory.poke": memory_poke,
+    "Screen.clearScreen": screen_clear,
+    "Screen.drawPixel": screen_draw_pixel,
+    "Screen.drawLine": screen_draw_line,
+    "Screen.drawRectangle": screen_draw_rectangle,
+    "Screen.drawCircle": screen_draw_circle,
+    "Output.__printChar": output_print_char_raw,
+    "Output.moveCursor": output_move_cursor,
+    "Output.printChar": output_print_char,
+    "Output.printString": output_print_string,
+    "Output.println": output_println,
+    "Sys.wait": sys_wait,
+}
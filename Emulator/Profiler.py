@@ -0,0 +1,280 @@
+"""
+A cycle-accurate profiler for the Hack CPU emulator.
+The execution is attributed to the functions of the program with the labels
+    of the translated code (see VMTranslator/CodeWriter): reaching a function
+    entry "(Xxx.f)" just after a call sequence (LCL = SP, with a new LCL) is
+    a call of Xxx.f; reaching it otherwise is a jump within the function
+    (e.g. to a while loop at the top of its body, which shares the address
+    of the entry). The return address of the call and ARG are read from its
+    frame, and the call returns when the return address is reached with
+    SP = ARG + 1 (as set by the return code; the labels of the return
+    addresses may be shared, e.g. with the routines of --compact).
+The shared call/return routines (--compact) count as the code of the caller
+    (__CALL) and of the callee (__RETURN), like the inlined call code.
+The profiler runs the basic blocks of the emulator itself, so the cycles of
+    a run are the same as without profiling. It collects:
+    the exclusive cycles (spent in the function's own code) and inclusive
+    cycles (until it returns, recursive calls counted once) of every function;
+    the call counts, and the call graph {(caller, callee): calls};
+    the cycles of every call stack, written in the collapsed-stack format of
+    flame graphs ("Sys.init;Main.main;Math.multiply 12345");
+    with a source map (see VMTranslator/SourceMap), the cycles of every VM
+    command and Jack line.
+Note: With intrinsics, a native OS function costs the cycles of its entry
+      block; run with --jack-os to profile the OS code.
+Usage: python Profiler.py Prog.asm [--cycles N] [--map Prog.map] [--top N]
+                        [--collapsed out.txt] [--jack-os]
+"""
+
+# %% import libs
+
+import re
+import json
+import argparse
+
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from CPUEmulator import CPUEmulator, load_program
+from Intrinsics import INTRINSICS
+
+# %% constants
+
+ROOT = "<bootstrap>"  # the code before the first call (and the shared routines)
+
+# function entries are named Xxx.f
+# (the statics Xxx.vm.i / Xxx.i are RAM addresses, not labels)
+FUNCTION_LABEL = re.compile(r"[A-Za-z_]\w*\.[A-Za-z_]\w*")
+SP, LCL, ARG = range(3)
+
+# %% label analysis
+
+def function_entries(symbols: Dict[str, int], n_rom: int) -> Dict[int, str]:
+    '''Returns {ROM address: function name} of the function entries.'''
+    return {address: name for name, address in sorted(symbols.items(), key=lambda item: item[1])
+            if FUNCTION_LABEL.fullmatch(name) and address < n_rom}
+
+# %% class definition
+
+class Profiler:
+
+    def __init__(self, emulator: CPUEmulator):
+        '''Profiles the runs of an emulator (loaded with the symbols of its program).'''
+        self.emulator = emulator
+        self.entries = function_entries(emulator.symbols, len(emulator.rom))
+        self.names: List[str] = [ROOT]            # the active functions
+        self.starts: List[int] = [0]              # the cycle at the entry of each
+        self.rets: List[int] = [-1]               # the return address of each
+        self.args: List[int] = [-1]               # the ARG of each
+        self.lcls: List[int] = [-1]               # the LCL of each
+        self.active = Counter({ROOT: 1})          # {function: active calls}
+        self.inclusive = Counter()                # {function: cycles} (returned calls)
+        self.calls = Counter()                    # {function: calls}
+        self.edges = Counter()                    # {(caller, callee): calls}
+        # the call stacks are the nodes of a call tree, so that a block run
+        # adds to a list, and a call/return costs the same at any depth
+        self.nodes: List[Tuple[int, str]] = [(-1, ROOT)]  # [(parent node, function)]
+        self.children: Dict[Tuple[int, str], int] = {}   # {(parent node, function): node}
+        self.node_cycles: List[int] = [0]
+        self.path: List[int] = [0]                # the nodes of the active calls
+        self.block_runs = Counter()               # {(block start, instructions): runs}
+
+    # %% execution
+
+    def run(self, n_cycles: int) -> int:
+        '''Runs (at most) n_cycles instructions of the emulator, and profiles them
+        (see CPUEmulator.run). Returns the number of instructions executed.'''
+        emu = self.emulator
+        ram, pc, A, D = emu.ram, emu.pc, emu.A, emu.D
+        n_rom = len(emu.rom)
+        entries, rets, args, lcls, path = self.entries, self.rets, self.args, self.lcls, self.path
+        node_cycles, block_runs = self.node_cycles, self.block_runs
+        done = 0
+        try:
+            while done < n_cycles:
+                if pc >= n_rom:
+                    emu.halted = True
+                    break
+                if pc in entries and ram[SP] == ram[LCL] != lcls[-1]:
+                    self.enter(entries[pc], emu.cycles + done)
+                elif pc == rets[-1] and ram[SP] == args[-1] + 1:
+                    self.leave(emu.cycles + done)
+                func, length, halts = emu.blocks.get(pc) or emu.block(pc)
+                if halts:
+                    emu.halted = True
+                    break
+                if done + length > n_cycles:
+                    # run the last instructions one by one
+                    func, length, _ = emu.step_block(pc)
+                node_cycles[path[-1]] += length
+                block_runs[(pc, length)] += 1
+                pc, A, D = func(ram, A, D)
+                done += length
+        finally:
+            emu.pc, emu.A, emu.D = pc, A, D
+            emu.cycles += done
+        return done
+
+    def enter(self, name: str, cycle: int) -> None:
+        ram = self.emulator.ram
+        self.calls[name] += 1
+        self.edges[(self.names[-1], name)] += 1
+        self.active[name] += 1
+        self.names.append(name)
+        self.starts.append(cycle)
+        # the frame of the call: returnAddress, LCL, ARG, THIS, THAT; LCL = SP
+        self.rets.append(ram[ram[LCL] - 5])
+        self.args.append(ram[ARG])
+        self.lcls.append(ram[LCL])
+        key = (self.path[-1], name)
+        node = self.children.get(key)
+        if node is None:
+            node = self.children[key] = len(self.nodes)
+            self.nodes.append(key)
+            self.node_cycles.append(0)
+        self.path.append(node)
+
+    def leave(self, cycle: int) -> None:
+        name = self.names.pop()
+        start = self.starts.pop()
+        self.rets.pop()
+        self.args.pop()
+        self.lcls.pop()
+        self.path.pop()
+        self.active[name] -= 1
+        if not self.active[name]:  # the outermost call of a recursion
+            self.inclusive[name] += cycle - start
+
+    # %% results
+
+    @property
+    def stacks(self) -> Dict[Tuple[str, ...], int]:
+        '''{call stack: cycles}'''
+        stacks = [(ROOT,)]
+        for parent, name in self.nodes[1:]:  # the parents come first
+            stacks.append(stacks[parent] + (name,))
+        return dict(zip(stacks, self.node_cycles))
+
+    def function_stats(self) -> Dict[str, Tuple[int, int, int]]:
+        '''Returns {function: (calls, exclusive cycles, inclusive cycles)},
+        the calls still active counting up to the current cycle.'''
+        exclusive = Counter()
+        for (_, name), cycles in zip(self.nodes, self.node_cycles):
+            exclusive[name] += cycles
+        inclusive = Counter(self.inclusive)
+        seen = set()
+        for name, start in zip(self.names, self.starts):
+            if name not in seen:
+                seen.add(name)
+                inclusive[name] += self.emulator.cycles - start
+        names = set(exclusive) | set(inclusive) | set(self.calls)
+        return {name: (self.calls[name], exclusive[name], inclusive[name]) for name in names}
+
+    def report(self, top: int=20) -> str:
+        '''The hottest functions (by exclusive cycles).'''
+        stats = self.function_stats()
+        total = max(self.emulator.cycles, 1)
+        lines = [f"Profile: {self.emulator.cycles} cycles, {sum(self.calls.values())} calls",
+                 f"    {'function':<28}{'calls':>9}{'exclusive':>12}{'%':>7}{'inclusive':>12}{'%':>7}"]
+        ranked = sorted(stats.items(), key=lambda item: (-item[1][1], item[0]))[:top]
+        lines += [f"    {name:<28}{calls:>9}{excl:>12}{excl / total:>7.1%}{incl:>12}{incl / total:>7.1%}"
+                  for name, (calls, excl, incl) in ranked]
+        return "\n".join(lines)
+
+    def call_graph(self) -> Dict[str, Dict[str, int]]:
+        '''Returns {caller: {callee: calls}}.'''
+        graph = defaultdict(dict)
+        for (caller, callee), n in sorted(self.edges.items()):
+            graph[caller][callee] = n
+        return dict(graph)
+
+    def call_graph_report(self, top: int=20) -> str:
+        lines = [f"Call graph: {len(self.edges)} edges"]
+        lines += [f"    {caller:<28} -> {callee:<28}{n:>9}"
+                  for (caller, callee), n in self.edges.most_common(top)]
+        return "\n".join(lines)
+
+    def collapsed(self) -> str:
+        '''The cycles of every call stack, in the collapsed-stack format
+        (one "f1;f2;...;fn cycles" line per stack, for flamegraph.pl & co).'''
+        return "".join(f"{';'.join(stack)} {cycles}\n"
+                       for stack, cycles in sorted(self.stacks.items()) if cycles)
+
+    def instruction_counts(self) -> Counter:
+        '''Returns {ROM address: runs} of the instructions run.'''
+        counts = Counter()
+        for (start, length), runs in self.block_runs.items():
+            for address in range(start, start + length):
+                counts[address] += runs
+        return counts
+
+    def hotspots(self, records: List[Dict[str, object]], top: int=20) -> str:
+        '''The hottest Jack lines and VM commands, with the records of
+        a source map (see VMTranslator/SourceMap).'''
+        roms = sorted((r["rom"], r["vm"], r["cmd"]) for r in records if "rom" in r)
+        starts = [address for address, _, _ in roms]
+        by_cmd = Counter()
+        for address, runs in self.instruction_counts().items():
+            i = bisect_right(starts, address) - 1
+            if i >= 0 and roms[i][1] is not None:  # not the bootstrap nor the shared routines
+                by_cmd[roms[i][1:]] += runs
+        jacks = defaultdict(list)  # {vm file: [(first command, jack file, line)]}
+        for r in records:
+            if "jack" in r:
+                jacks[r["vm"]].append((r["cmd"], r["jack"], r["line"]))
+        for positions in jacks.values():
+            positions.sort()
+        by_line = Counter()
+        for (vm, cmd), runs in by_cmd.items():
+            positions = jacks.get(vm, [])
+            i = bisect_right(positions, (cmd, "\uffff")) - 1
+            if i >= 0:
+                by_line[positions[i][1:]] += runs
+        total = max(self.emulator.cycles, 1)
+        lines = ["Hotspots: Jack lines"]
+        lines += [f"    {f'{jack}:{line}':<28}{n:>12}{n / total:>7.1%}"
+                  for (jack, line), n in by_line.most_common(top)]
+        lines += ["Hotspots: VM commands"]
+        lines += [f"    {f'{vm}:{cmd}':<28}{n:>12}{n / total:>7.1%}"
+                  for (vm, cmd), n in by_cmd.most_common(top)]
+        return "\n".join(lines)
+
+# %% main
+
+def _main():
+
+    # argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", help="assembly code (.asm) file (the labels name the functions)")
+    parser.add_argument("--cycles", help="Max number of instructions to run", type=int, default=10_000_000)
+    parser.add_argument("--map", help="Source map of the program (default: Prog.map, if any)")
+    parser.add_argument("--top", help="Number of lines of each report", type=int, default=20)
+    parser.add_argument("--collapsed", help="Write the collapsed stacks to a file (for flame graphs)")
+    parser.add_argument("--jack-os", help="Set to run the OS in Hack code only (no intrinsics)", action="store_true")
+    options = parser.parse_args()
+
+    rom, symbols = load_program(options.file)
+    emulator = CPUEmulator(rom, symbols, None if options.jack_os else INTRINSICS)
+    profiler = Profiler(emulator)
+    profiler.run(options.cycles)
+
+    print(profiler.report(options.top))
+    print(profiler.call_graph_report(options.top))
+
+    map_file_path = Path(options.map) if options.map else Path(options.file).with_suffix(".map")
+    if map_file_path.exists():
+        with open(map_file_path, "r") as f_map:
+            records = [json.loads(line) for line in f_map if line.strip()]
+        print(profiler.hotspots(records, options.top))
+
+    if options.collapsed:
+        with open(options.collapsed, "w") as f:
+            f.write(profiler.collapsed())
+        print(f"Collapsed stacks written to: {options.collapsed}")
+
+# %% run main
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,357 @@
+"""
+The VM Emulator (runs .vm programs directly, without translating them).
+The VM commands are predecoded into (opcode, operand, operand) tuples:
+    the segments are resolved to RAM addresses (or base registers), and the
+    label/call targets to command indices, once, when the program is loaded.
+The memory layout is the one of the Hack platform (SP, LCL, ARG, THIS, THAT
+    in RAM[0..4], temp in RAM[5..12], statics from RAM[16], the stack from
+    RAM[256], the heap, SCREEN and KBD), so that the OS runs unchanged.
+gt and lt compare x and y by the sign of the 16-bit x - y, like the code of
+    the VMTranslator runs on the CPU (not the exact order when x and y are
+    more than 32767 apart), so that both engines run a program the same way.
+Functions may be replaced by native (Python) implementations, e.g. the OS
+    intrinsics (see Intrinsics); a native receives the emulator and the
+    arguments (as signed ints), and returns the return value, or FALLBACK
+    to run the VM code of the function instead.
+Usage: python VMEmulator.py Prog(.vm|dir) [--cycles N] [--ram a:b] [--jack-os]
+"""
+
+# %% import libs
+
+import time
+import argparse
+
+from array import array
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from Intrinsics import INTRINSICS, FALLBACK
+
+# %% constants
+
+RAM_SIZE = 32768
+STATIC_BASE = 16
+STACK_BASE = 256
+SP, LCL, ARG, THIS, THAT = range(5)
+TEMP_BASE = 5
+
+# VM command codes (same as CmdType in Compiler/ and VMTranslator/)
+C_ARITHMETIC, C_PUSH, C_POP, C_LABEL, C_GOTO, C_IF, C_FUNCTION, C_RETURN, C_CALL = range(9)
+CMD_CODES = {
+    "push": C_PUSH, "pop": C_POP, "label": C_LABEL, "goto": C_GOTO, "if-goto": C_IF,
+    "function": C_FUNCTION, "return": C_RETURN, "call": C_CALL,
+}
+
+# opcodes
+(PUSH_CONST, PUSH_FIXED, PUSH_BASED, POP_FIXED, POP_BASED,
+ ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+ GOTO, IF_GOTO, CALL, NATIVE, FUNCTION, RETURN, HALT) = range(21)
+
+ARITHMETIC_OPS = {
+    "add": ADD, "sub": SUB, "neg": NEG, "eq": EQ, "gt": GT,
+    "lt": LT, "and": AND, "or": OR, "not": NOT,
+}
+BASE_REGS = {"local": LCL, "argument": ARG, "this": THIS, "that": THAT}
+
+# (opcode, operand, operand)
+Op = Tuple[int, object, object]
+Native = Callable[["VMEmulator", List[int]], int]
+
+# %% utils
+
+def signed(value: int) -> int:
+    return value - 0x10000 if value & 0x8000 else value
+
+# %% loading
+
+def parse_vm_file(vm_file_path: Path) -> List[Tuple[int, str, int]]:
+    '''Parses a .vm file into (command code, arg1, arg2) records.'''
+    commands = []
+    with open(vm_file_path, 'r') as f:
+        for line in f:
+            parts = line.split("//", 1)[0].split()
+            if not parts:
+                continue
+            if parts[0] in ARITHMETIC_OPS:
+                commands.append((C_ARITHMETIC, parts[0], None))
+            else:
+                arg2 = int(parts[2]) if len(parts) > 2 else None
+                commands.append((CMD_CODES[parts[0]], parts[1] if len(parts) > 1 else "", arg2))
+    return commands
+
+
+def load_vm(path: Path) -> Dict[str, List[Tuple[int, str, int]]]:
+    '''Loads a .vm file, or the .vm files of a folder: {file name: records}.'''
+    path = Path(path)
+    vm_files = sorted(path.glob("*.vm")) if path.is_dir() else [path]
+    return {vm_file.stem: parse_vm_file(vm_file) for vm_file in vm_files}
+
+# %% class definition
+
+class VMEmulator:
+
+    def __init__(self, files: Dict[str, Sequence[Tuple[object, str, int]]],
+                 natives: Dict[str, Native]=None, entry: str="Sys.init"):
+        '''Loads a program: {file name: [(command type, arg1, arg2)]}.
+        The command type is either an int or an enum with the CmdType codes
+            (e.g. the records of Compiler/VMWriter).
+        natives: {function name: native implementation} (called instead of the VM code).
+        '''
+        self.natives = dict(natives or {})
+        self.entry = entry
+        self.statics: Dict[Tuple[str, int], int] = {}  # {(file name, index): address}
+        self.functions: Dict[str, int] = {}            # {function name: command index}
+        self.names: List[str] = []                     # function name of each command
+        self.code: List[Op] = self.predecode(files)
+        self.ram = array('H', bytes(2 * RAM_SIZE))
+        self.reset()
+
+    # %% predecoding
+
+    def static_address(self, file_name: str, index: int) -> int:
+        key = (file_name, index)
+        if key not in self.statics:
+            self.statics[key] = STATIC_BASE + len(self.statics)
+        return self.statics[key]
+
+    def predecode(self, files) -> List[Op]:
+        # pass 1: flatten the commands, and locate the functions and labels
+        commands, labels = [], {}
+        func_name = ""
+        for file_name, records in files.items():
+            for cmd_t, arg1, arg2 in records:
+                cmd_t = getattr(cmd_t, "value", cmd_t)
+                if cmd_t == C_FUNCTION:
+                    func_name = arg1
+                    self.functions[arg1] = len(commands)
+                if cmd_t == C_LABEL:
+                    labels[f"{func_name}${arg1}"] = len(commands)
+                    continue
+                commands.append((file_name, func_name, cmd_t, arg1, arg2))
+        # pass 2: resolve the segments and targets
+        code = []
+        for file_name, func_name, cmd_t, arg1, arg2 in commands:
+            self.names.append(func_name)
+            if cmd_t == C_ARITHMETIC:
+                code.append((ARITHMETIC_OPS[arg1], None, None))
+            elif cmd_t in (C_PUSH, C_POP):
+                if arg1 == "constant":
+                    assert cmd_t == C_PUSH, "Cannot pop a constant!"
+                    code.append((PUSH_CONST, arg2, None))
+                elif arg1 in BASE_REGS:
+                    code.append((PUSH_BASED if cmd_t == C_PUSH else POP_BASED, BASE_REGS[arg1], arg2))
+                else:
+                    if arg1 == "temp":
+                        address = TEMP_BASE + arg2
+                    elif arg1 == "pointer":
+                        address = THIS + arg2
+                    elif arg1 == "static":
+                        address = self.static_address(file_name, arg2)
+                    else:
+                        raise Exception(f"Invalid segment type: [{arg1}]")
+                    code.append((PUSH_FIXED if cmd_t == C_PUSH else POP_FIXED, address, None))
+            elif cmd_t in (C_GOTO, C_IF):
+                label = f"{func_name}${arg1}"
+                if label not in labels:
+                    raise Exception(f"Undefined label: [{label}]")
+                code.append((GOTO if cmd_t == C_GOTO else IF_GOTO, labels[label], None))
+            elif cmd_t == C_FUNCTION:
+                code.append((FUNCTION, arg2, None))
+            elif cmd_t == C_RETURN:
+                code.append((RETURN, None, None))
+            elif cmd_t == C_CALL:
+                code.append(self.call_op(arg1, arg2))
+            else:
+                raise Exception(f"Unrecognized command type: [{cmd_t}]")
+        return code
+
+    def call_op(self, func_name: str, n_args: int) -> Op:
+        if func_name == "Sys.halt":
+            return HALT, None, None
+        if func_name in self.natives:
+            # (native, the VM code to fall back to)
+            return NATIVE, (self.natives[func_name], self.functions.get(func_name)), n_args
+        if func_name not in self.functions:
+            raise Exception(f"Undefined function: [{func_name}]")
+        return CALL, self.functions[func_name], n_args
+
+    def reset(self) -> None:
+        '''Resets the stack, and calls the entry function (the RAM is kept).'''
+        self.ram[SP] = STACK_BASE
+        self.sp = STACK_BASE
+        self.rets: List[int] = []  # return addresses (command indices)
+        self.cycles = 0
+        self.halted = False
+        self.pc = len(self.code)
+        if self.entry in self.functions:
+            # call entry 0 (a return from it halts)
+            self.pc = self.functions[self.entry]
+            self.rets.append(len(self.code))
+            self.ram[self.sp] = 0
+            for i in range(LCL, THAT + 1):
+                self.ram[self.sp + i] = self.ram[i]
+            self.sp += 5
+            self.ram[ARG] = STACK_BASE
+            self.ram[LCL] = self.sp
+
+    # %% execution
+
+    def run(self, n_cycles: int) -> int:
+        '''Runs (at most) n_cycles VM commands.
+        Stops early if the program halts (calls Sys.halt, or returns from the entry).
+        Returns the number of commands executed.'''
+        code, ram, rets = self.code, self.ram, self.rets
+        pc, sp = self.pc, self.sp
+        n_code = len(code)
+        done = 0
+        try:
+            while done < n_cycles:
+                if pc >= n_code:
+                    self.halted = True
+                    break
+                op, a, b = code[pc]
+                pc += 1
+                done += 1
+                if op == PUSH_BASED:
+                    ram[sp] = ram[ram[a] + b]
+                    sp += 1
+                elif op == PUSH_CONST:
+                    ram[sp] = a
+                    sp += 1
+                elif op == POP_BASED:
+                    sp -= 1
+                    ram[ram[a] + b] = ram[sp]
+                elif op == PUSH_FIXED:
+                    ram[sp] = ram[a]
+                    sp += 1
+                elif op == POP_FIXED:
+                    sp -= 1
+                    ram[a] = ram[sp]
+                elif op == ADD:
+                    sp -= 1
+                    ram[sp-1] = (ram[sp-1] + ram[sp]) & 0xFFFF
+                elif op == SUB:
+                    sp -= 1
+                    ram[sp-1] = (ram[sp-1] - ram[sp]) & 0xFFFF
+                elif op == IF_GOTO:
+                    sp -= 1
+                    if ram[sp]:
+                        pc = a
+                elif op == GOTO:
+                    pc = a
+                elif op == NOT:
+                    ram[sp-1] ^= 0xFFFF
+                elif op == NEG:
+                    ram[sp-1] = -ram[sp-1] & 0xFFFF
+                elif op == EQ:
+                    sp -= 1
+                    ram[sp-1] = 0xFFFF if ram[sp-1] == ram[sp] else 0
+                elif op == GT:
+                    # by the sign of x - y, like the translated code
+                    sp -= 1
+                    d = (ram[sp-1] - ram[sp]) & 0xFFFF
+                    ram[sp-1] = 0xFFFF if 0 < d < 0x8000 else 0
+                elif op == LT:
+                    sp -= 1
+                    ram[sp-1] = 0xFFFF if (ram[sp-1] - ram[sp]) & 0x8000 else 0
+                elif op == AND:
+                    sp -= 1
+                    ram[sp-1] &= ram[sp]
+                elif op == OR:
+                    sp -= 1
+                    ram[sp-1] |= ram[sp]
+                elif op == CALL or op == NATIVE:
+                    if op == NATIVE:
+                        native, a = a
+                        ram[SP] = sp
+                        self.pc = pc
+                        value = native(self, [signed(v) for v in ram[sp-b:sp]])
+                        if value is not FALLBACK:
+                            sp -= b
+                            ram[sp] = value & 0xFFFF
+                            sp += 1
+                            continue
+                        if a is None:
+                            raise Exception(f"No VM code to fall back to in [{self.names[pc-1]}]")
+                    # push returnAddress, LCL, ARG, THIS, THAT
+                    ram[sp] = pc & 0xFFFF
+                    ram[sp+1] = ram[LCL]
+                    ram[sp+2] = ram[ARG]
+                    ram[sp+3] = ram[THIS]
+                    ram[sp+4] = ram[THAT]
+                    sp += 5
+                    ram[ARG] = sp - 5 - b
+                    ram[LCL] = sp
+                    rets.append(pc)
+                    pc = a
+                elif op == FUNCTION:
+                    for _ in range(a):
+                        ram[sp] = 0
+                        sp += 1
+                elif op == RETURN:
+                    frame = ram[LCL]
+                    arg = ram[ARG]
+                    ram[arg] = ram[sp-1]
+                    sp = arg + 1
+                    ram[THAT] = ram[frame-1]
+                    ram[THIS] = ram[frame-2]
+                    ram[ARG] = ram[frame-3]
+                    ram[LCL] = ram[frame-4]
+                    pc = rets.pop()
+                elif op == HALT:
+                    pc -= 1
+                    done -= 1
+                    self.halted = True
+                    break
+        finally:
+            self.pc, self.sp = pc, sp
+            ram[SP] = sp
+            self.cycles += done
+        return done
+
+    # %% memory
+
+    def peek(self, address: int) -> int:
+        '''Returns RAM[address] as a signed 16-bit value.'''
+        return signed(self.ram[address])
+
+    def poke(self, address: int, value: int) -> None:
+        self.ram[address] = value & 0xFFFF
+
+    def static(self, class_name: str, index: int) -> int:
+        '''Returns the address of a static variable.'''
+        return self.statics[(class_name, index)]
+
+    def backtrace(self) -> List[str]:
+        '''Returns the names of the active functions (outermost first).'''
+        return [self.names[ret - 1] for ret in self.rets[1:]] + \
+               ([self.names[self.pc]] if self.pc < len(self.code) else [])
+
+# %% main
+
+def _main():
+
+    # argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("src", help="VM code file (.vm) or a folder of .vm files")
+    parser.add_argument("--cycles", help="Max number of VM commands to run", type=int, default=10_000_000)
+    parser.add_argument("--ram", help="RAM range to print, e.g. 256:270", default="0:16")
+    parser.add_argument("--jack-os", help="Set to run the OS in VM code only (no intrinsics)", action="store_true")
+    options = parser.parse_args()
+
+    vm = VMEmulator(load_vm(options.src), None if options.jack_os else INTRINSICS)
+
+    t0 = time.perf_counter()
+    n = vm.run(options.cycles)
+    dt = time.perf_counter() - t0
+    status = "halted" if vm.halted else f"stopped in {vm.names[vm.pc]}"
+    print(f"{n} VM commands in {dt:.3f}s ({n / max(dt, 1e-9) / 1e6:.2f} M/s), {status}")
+
+    a, b = (int(x) for x in options.ram.split(":"))
+    for address in range(a, b):
+        print(f"RAM[{address}] = {vm.peek(address)}")
+
+# %% run main
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,63 @@
+"""
+Benchmarks the assembler on a large synthetic program.
+The program repeats the given .asm file with the labels renamed per copy,
+    so that the symbol table grows as it would for a large translated program.
+Usage: python BenchAssembler.py Prog.asm [--copies N] [--repeat R]
+"""
+
+# %% import libs
+
+from pathlib import Path
+
+import re
+import time
+import argparse
+
+from HackAssembler import assemble, to_text
+from SymbolTable import SymbolTable
+
+# %% synthetic program
+
+PATT_SYMBOL = re.compile(r"([@(])([A-Za-z_.$:][\w.$:]*)")
+
+
+def make_synthetic_program(asm: str, n_copies: int) -> list:
+    def rename(k: int, m: re.Match) -> str:
+        prefix, symbol = m.groups()
+        if symbol in SymbolTable.predefined:
+            return m.group(0)
+        return f"{prefix}{symbol}_{k}"
+    copies = [PATT_SYMBOL.sub(lambda m: rename(k, m), asm) for k in range(n_copies)]
+    return "".join(copies).splitlines()
+
+# %% benchmarking
+
+def best_of(func, arg, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+# %% main function
+
+def _main(asm_file: Path, n_copies: int, repeat: int):
+    lines = make_synthetic_program(asm_file.read_text(), n_copies)
+    codes = assemble(lines)
+    t_asm = best_of(assemble, lines, repeat)
+    t_txt = best_of(to_text, codes, repeat)
+    print(f"{len(codes)} instructions: "
+          f"assemble {t_asm*1e3:.1f} ms, render {t_txt*1e3:.1f} ms")
+
+# %% calling the main function
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", help="hack assembly code file")
+    parser.add_argument("--copies", help="Copies of the program", type=int, default=4)
+    parser.add_argument("--repeat", help="Timing repetitions", type=int, default=3)
+    options = parser.parse_args()
+
+    _main(Path(options.file), options.copies, options.repeat)
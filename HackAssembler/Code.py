@@ -0,0 +1,100 @@
+"""
+Translating the fields (symbolic mnemonics) into binary codes.
+The tables are precomputed as integers, and each distinct C-instruction
+    is encoded only once (see CInstructions).
+"""
+
+# %% translation tables
+
+D_TABLE = {
+    ""   : 0b000,
+    "M"  : 0b001,
+    "D"  : 0b010,
+    "DM" : 0b011,
+    "MD" : 0b011,
+    "A"  : 0b100,
+    "AM" : 0b101,
+    "MA" : 0b101,
+    "AD" : 0b110,
+    "DA" : 0b110,
+    "ADM": 0b111,
+    "AMD": 0b111,
+    "DAM": 0b111,
+    "DMA": 0b111,
+    "MAD": 0b111,
+    "MDA": 0b111,
+}
+
+C_TABLE = {
+    "0"  : 0b0101010,
+    "1"  : 0b0111111,
+    "-1" : 0b0111010,
+    "D"  : 0b0001100,
+    "A"  : 0b0110000,
+    "!D" : 0b0001101,
+    "!A" : 0b0110001,
+    "-D" : 0b0001111,
+    "-A" : 0b0110011,
+    "D+1": 0b0011111,
+    "A+1": 0b0110111,
+    "D-1": 0b0001110,
+    "A-1": 0b0110010,
+    "D+A": 0b0000010,
+    "D-A": 0b0010011,
+    "A-D": 0b0000111,
+    "D&A": 0b0000000,
+    "D|A": 0b0010101,
+    "M"  : 0b1110000,
+    "!M" : 0b1110001,
+    "-M" : 0b1110011,
+    "M+1": 0b1110111,
+    "M-1": 0b1110010,
+    "D+M": 0b1000010,
+    "D-M": 0b1010011,
+    "M-D": 0b1000111,
+    "D&M": 0b1000000,
+    "D|M": 0b1010101,
+}
+
+J_TABLE = {
+    ""   : 0b000,
+    "JGT": 0b001,
+    "JEQ": 0b010,
+    "JGE": 0b011,
+    "JLT": 0b100,
+    "JNE": 0b101,
+    "JLE": 0b110,
+    "JMP": 0b111,
+}
+
+# %% C-instruction encoding
+
+def fields(instruct: str):
+    '''Splits a C-instruction into its (dest, comp, jump) parts.'''
+    n1 = instruct.find('=')
+    n2 = instruct.find(';')
+    dest = instruct[:n1] if n1 >= 0 else ""
+    jump = instruct[n2+1:] if n2 >= 0 else ""
+    if n1 >= 0 and n2 >= 0 and n1 < n2:
+        comp = instruct[n1+1:n2]
+    elif n1 >= 0:
+        comp = instruct[n1+1:]
+    elif n2 >= 0:
+        comp = instruct[:n2]
+    else:
+        comp = ""
+    return dest, comp, jump
+
+
+def encode_c(instruct: str) -> int:
+    '''Encodes a C-instruction: 111a cccc ccdd djjj'''
+    dest, comp, jump = fields(instruct)
+    return 0b111 << 13 | C_TABLE[comp] << 6 | D_TABLE[dest] << 3 | J_TABLE[jump]
+
+
+class CInstructions(dict):
+    '''{C-instruction: binary code}, encoded on first use.'''
+
+    def __missing__(self, instruct: str) -> int:
+        self[instruct] = code = encode_c(instruct)
+        return code
@@ -0,0 +1,81 @@
+"""
+The Hack Assembler (assembly code to binary code).
+Pass 1 collects the instructions and resolves the labels;
+    pass 2 encodes the instructions into 16-bit words.
+Usage: python HackAssembler.py Prog.asm
+"""
+
+# %% Import Libs
+
+import time
+import argparse
+
+from array import array
+from pathlib import Path
+from typing import Iterable
+
+from Code import CInstructions
+from Parser import parse
+from SymbolTable import SymbolTable
+
+# %% assembling
+
+def assemble(lines: Iterable[str], symbols: dict=None) -> array:
+    '''Translates lines of assembly code into machine code (an array('H')).
+    If a symbols dict is given, it receives the symbol table {symbol: address}.'''
+
+    # 1st pass: collect the instructions, and construct the symbol table
+    instructs, labels, line_nos = parse(lines)
+    symbol_tbl = SymbolTable(labels)
+
+    # 2nd pass: translate instructions to bits
+    c_instructs = CInstructions()
+    codes = array('H', bytes(2 * len(instructs)))
+    for i, instruct in enumerate(instructs):
+        if instruct[0] == '@':
+            symbol = instruct[1:]
+            if symbol.isdigit():
+                codes[i] = int(symbol) & 0x7FFF
+            else:  # either a variable or a label
+                codes[i] = symbol_tbl[symbol] & 0x7FFF
+        else:
+            try:
+                codes[i] = c_instructs[instruct]
+            except KeyError:
+                raise Exception(f"Invalid instruction at line {line_nos[i]}: [{instruct}]") from None
+    if symbols is not None:
+        symbols.update(symbol_tbl)
+    return codes
+
+
+def to_text(codes: array) -> str:
+    '''Renders machine code as the lines of a .hack file.'''
+    return "".join([f"{code:016b}\n" for code in codes])
+
+# %% main
+
+def _main():
+
+    # argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", help="hack assembly code file")
+    options = parser.parse_args()
+
+    # path processing
+    asm_file_path = Path(options.file)
+    hack_file_path = asm_file_path.with_suffix(".hack")
+
+    print(f"Parsing [{asm_file_path}]... ", end="")
+    t0 = time.perf_counter()
+    with open(asm_file_path, 'r') as f:
+        codes = assemble(f)
+    with open(hack_file_path, 'w') as f:
+        f.write(to_text(codes))
+    print(f"done ({len(codes)} instructions, {time.perf_counter() - t0:.3f}s)...")
+
+    print(f"File written to: {hack_file_path}")
+
+# %% run main
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,36 @@
+"""
+Parsing the input into instructions.
+1. skipping comments and white spaces
+2. collecting the label symbols (xxx) with their ROM addresses
+3. keeping the A- and C-instructions in program order
+"""
+
+# %% import libs
+
+from typing import Dict, Iterable, List, Tuple
+
+# %% helper functions
+
+def format_input(input: str) -> str:
+    # remove in-line comments and white space
+    return "".join(input.split("//", 1)[0].split())
+
+
+# %% parsing
+
+def parse(lines: Iterable[str]) -> Tuple[List[str], Dict[str, int], List[int]]:
+    '''Parses lines of assembly code in a single pass.
+    Returns the instructions (without labels), the {label: address} table,
+    and the line number of each instruction (for the error messages).'''
+    instructs, labels, line_nos = [], {}, []
+    for n, line in enumerate(lines, 1):
+        instruct = format_input(line)
+        if not instruct:
+            continue
+        if instruct[0] == '(':
+            # label symbols: the address of the next instruction
+            labels[instruct.strip("()")] = len(instructs)
+        else:
+            instructs.append(instruct)
+            line_nos.append(n)
+    return instructs, labels, line_nos
@@ -0,0 +1,26 @@
+"""
+The Symbol Table: {symbol: address}.
+"""
+
+# %% class definition
+
+class SymbolTable(dict):
+
+    # pre-defined symbols
+    predefined = {
+        **{f"R{i}": i for i in range(16)},
+        "SCREEN": 16384, "KBD": 24576,
+        "SP": 0, "LCL": 1, "ARG": 2, "THIS": 3, "THAT": 4,
+    }
+
+    def __init__(self, labels: dict=None):
+        '''Creates a symbol table with the pre-defined and label symbols.'''
+        super().__init__(SymbolTable.predefined)
+        self.update(labels or {})
+        self.next_var_address = 16
+
+    def __missing__(self, symbol: str) -> int:
+        # a symbol seen for the first time is a new variable
+        self[symbol] = address = self.next_var_address
+        self.next_var_address += 1
+        return address
@@ -1,34 +1,234 @@
 # %% Import Libs
 
+from io import StringIO
 from pathlib import Path
-from collections import defaultdict
+from functools import lru_cache
+from collections import Counter, defaultdict
 
-from MyTypes import CmdType
+from MyTypes import CmdType, StaticRef
 
 import dnchg, dchg
+import Peephole
+import SourceMap
 
 # %% utils
 
-def compare_top2(j_cond):
+COMPARE_JUMPS = {"eq": "JEQ", "gt": "JGT", "lt": "JLT"}
+NEGATED_JUMPS = {"JEQ": "JNE", "JGT": "JLE", "JLT": "JGE"}
+
+
+def compare_top2(j_cond, label_id=None):
     code_if_true = dnchg.star_ptrm1("SP") + "M=-1\n"
     code_if_false = dnchg.star_ptrm1("SP") + "M=0\n"
     return (
         dchg.stack_pop() +
         dnchg.star_ptrm1("SP") +
         "D=M-D\n" +
-        dnchg.if_else(j_cond, code_if_true, code_if_false)
+        dnchg.if_else(j_cond, code_if_true, code_if_false, label_id)
+    )
+
+def jump_back(reg):
+    # goto the return address kept in reg
+    return dnchg.star_ptr(reg) + "0;JMP\n"
+
+# %% code templates
+# The code of a command only depends on the command (and on the file name for
+# the statics), except for the labels of the comparisons: it is rendered once,
+# and reused. The comparisons are rendered with a "{n}" placeholder for the
+# number of their labels.
+
+TEMPLATE_CACHE_SIZE = 4096  # max number of templates of each kind
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def arithmetic_code(cmd: str) -> str:
+    code = f"// {cmd}\n"
+    if cmd == "add":
+        code += dchg.stack_pop() + dnchg.star_ptrm1("SP") + "M=D+M\n"
+    elif cmd == "sub":
+        code += dchg.stack_pop() + dnchg.star_ptrm1("SP") + "M=M-D\n"
+    elif cmd == "neg":
+        code += dnchg.star_ptrm1("SP") + "M=-M\n"
+    elif cmd in COMPARE_JUMPS:
+        code += compare_top2(COMPARE_JUMPS[cmd], "{n}")
+    elif cmd == "and":
+        code += dchg.stack_pop() + dnchg.star_ptrm1("SP") + "M=D&M\n"
+    elif cmd == "or":
+        code += dchg.stack_pop() + dnchg.star_ptrm1("SP") + "M=D|M\n"
+    elif cmd == "not":
+        code += dnchg.star_ptrm1("SP") + "M=!M\n"
+    else:
+        raise Exception(f"Invalid arithmetic command: [{cmd}]")
+    return code
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def push_pop_code(cmd_t: CmdType, seg: str, idx: int, f_name: str) -> str:
+    # f_name: the file of a static (None for the other segments)
+    code = ""
+    if cmd_t == CmdType.C_PUSH:
+        code += f"// push {seg} {idx}\n"
+        if seg == "local":
+            code += dchg.stack_push_seg("LCL", idx)
+        elif seg == "argument":
+            code += dchg.stack_push_seg("ARG", idx)
+        elif seg == "this":
+            code += dchg.stack_push_seg("THIS", idx)
+        elif seg == "that":
+            code += dchg.stack_push_seg("THAT", idx)
+        elif seg == "static":
+            code += dchg.stack_push_static(f_name, idx)
+        elif seg == "constant":
+            code += dchg.stack_push_val(idx)
+        elif seg == "temp":
+            code += dchg.assign_val2var("R13", 5) + dchg.stack_push_seg("R13", idx)
+        elif seg == "pointer":
+            code += dchg.stack_push_pointer(idx)
+        else:
+            raise Exception(f"Invalid segment type: [{seg}]")
+    elif cmd_t == CmdType.C_POP:
+        code += f"// pop {seg} {idx}\n"
+        if seg == "local":
+            code += dchg.stack_pop_seg("LCL", idx)
+        elif seg == "argument":
+            code += dchg.stack_pop_seg("ARG", idx)
+        elif seg == "this":
+            code += dchg.stack_pop_seg("THIS", idx)
+        elif seg == "that":
+            code += dchg.stack_pop_seg("THAT", idx)
+        elif seg == "static":
+            code += dchg.stack_pop_static(f_name, idx)
+        elif seg == "temp":
+            code += dchg.assign_val2var("R13", 5) + dchg.stack_pop_seg("R13", idx)
+        elif seg == "pointer":
+            code += dchg.stack_pop_pointer(idx)
+        else:
+            raise Exception(f"Invalid segment type: [{seg}]")
+    else:
+        raise Exception(f"Invalid command type: [{cmd_t.name}]")
+    return code
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def call_frame_code(n_args: int) -> str:
+    # the code of a call after "push returnAddress", up to "goto f"
+    return (
+        # push LCL
+        dchg.stack_push_var("LCL")
+        # push ARG
+        + dchg.stack_push_var("ARG")
+        # push THIS
+        + dchg.stack_push_var("THIS")
+        # push TAHT
+        + dchg.stack_push_var("THAT")
+        # ARG = SP - 5 - nArgs
+        + dchg.var_mi("SP", 5+n_args) + dnchg.assign_d2var("ARG")
+        # LCL = SP
+        + dchg.assign_var2var("SP", "LCL")
+    )
+
+# %% shared routines (compact mode)
+
+COMPARE_ROUTINES = {"eq": ("__EQ", "JEQ"), "gt": ("__GT", "JGT"), "lt": ("__LT", "JLT")}
+
+
+def compare_routine(name, j_cond):
+    # D = return address
+    return (
+        f"// routine {name}\n"
+        + f"({name})\n"
+        + dnchg.assign_d2var("R15")
+        + compare_top2(j_cond)
+        + jump_back("R15")
+    )
+
+
+def call_routine():
+    # R13 = function address, R14 = nArgs, D = return address
+    return (
+        "// routine __CALL\n"
+        + "(__CALL)\n"
+        # push returnAddress
+        + dnchg.stack_push()
+        # push LCL, ARG, THIS, THAT
+        + dchg.stack_push_var("LCL")
+        + dchg.stack_push_var("ARG")
+        + dchg.stack_push_var("THIS")
+        + dchg.stack_push_var("THAT")
+        # ARG = SP - 5 - nArgs
+        + "@R14\n" + "D=M\n" + "@5\n" + "D=D+A\n"
+        + "@SP\n" + "D=M-D\n" + dnchg.assign_d2var("ARG")
+        # LCL = SP
+        + dchg.assign_var2var("SP", "LCL")
+        # goto f
+        + jump_back("R13")
+    )
+
+
+def return_routine():
+    return "// routine __RETURN\n" + "(__RETURN)\n" + return_code()
+
+
+@lru_cache(maxsize=None)
+def return_code():
+    return (
+        # R14 (frame) = LCL
+        dchg.assign_var2var("LCL", "R14")
+        # R15 (retAddr) = *(frame - 5)
+        + dchg.var_mi("R14", 5) + dnchg.star() + "D=M\n" + dnchg.assign_d2var("R15")
+        # *ARG = pop()
+        + dchg.stack_pop() + dnchg.star_ptr("ARG") + "M=D\n"
+        # SP = ARG + 1
+        + dchg.var_pi("ARG", 1) + dnchg.assign_d2var("SP")
+        # THAT = *(frame - 1)
+        + dchg.var_mi("R14", 1) + dnchg.star() + "D=M\n" + dnchg.assign_d2var("THAT")
+        # THIS = *(frame - 2)
+        + dchg.var_mi("R14", 2) + dnchg.star() + "D=M\n" + dnchg.assign_d2var("THIS")
+        # ARG = *(frame - 3)
+        + dchg.var_mi("R14", 3) + dnchg.star() + "D=M\n" + dnchg.assign_d2var("ARG")
+        # LCL = *(frame - 4)
+        + dchg.var_mi("R14", 4) + dnchg.star() + "D=M\n" + dnchg.assign_d2var("LCL")
+        # goto retAddr
+        + jump_back("R15")
     )
 
 # %% Class Def
 
 class CodeWriter:
 
-    def __init__(self, asm_file_path: Path):
-        self.f_asm = open(asm_file_path, 'w')
-        self.vm_f_name = asm_file_path.stem
+    def __init__(self, asm_file_path: Path=None, optimize: bool=False, compact: bool=False,
+                 namespace: str="", bootstrap: bool=True, source_map: bool=False,
+                 comments: bool=True):
+        # the assembly code is buffered, and written to the file (if any) on close;
+        # with optimize, the buffered code goes through the peephole optimizer first;
+        # with compact, call/return/eq/gt/lt jump to shared routines instead of
+        # being inlined at every site;
+        # namespace prefixes the numbers of the generated labels (return addresses,
+        # comparisons), so that the code of files translated by different writers
+        # can be linked together (see link); a writer without bootstrap only
+        # produces code to be linked;
+        # with source_map, the ROM address -> VM command records are collected
+        # (see SourceMap); without comments, no comment is left in the code
+        self.asm_file_path = asm_file_path
+        self.f_asm = StringIO()
+        self.vm_f_name = asm_file_path.stem if asm_file_path else ""
+        self.code = None  # the final assembly code (once closed)
+        self.optimize = optimize
+        self.peephole_report = ""
+        self.peephole_stats = (0, Counter())  # (instructions before, {rule: instructions saved})
+        self.idiom_stats = defaultdict(lambda: [0, 0])  # {idiom: [matches, instructions saved]}
         self.curr_func_name = ""
         self.n_func_calls = defaultdict(lambda: 0)
-        self.write_bootstrap()
+        self.compact = compact
+        self.n_compares = 0
+        self.namespace = namespace
+        self.linked = []  # the code of the files translated by other writers
+        self.source_map = source_map
+        self.comments = comments
+        self.rom_map = []  # the "rom" records of the source map (once closed)
+        self.is_final = bootstrap
+        if bootstrap:
+            self.write_bootstrap()
 
     def set_file_name(self, file_name: str):
         self.vm_f_name = file_name
@@ -38,75 +238,39 @@ class CodeWriter:
         code = "// Bootstrap\n" + dchg.assign_val2var("SP", 256)
         self.f_asm.write(code)
         self.write_call("Sys.init", 0)
+        if self.compact:
+            # Sys.init never returns, so the shared routines go right after it
+            self.f_asm.write(
+                call_routine() + return_routine() +
+                "".join(compare_routine(*COMPARE_ROUTINES[cmd]) for cmd in ("eq", "gt", "lt"))
+            )
 
     def write_arithmetic(self, cmd: str):
-        code = f"// {cmd}\n"
-        if cmd == "add":
-            code += dchg.stack_pop() + dnchg.star_ptrm1("SP") + "M=D+M\n"
-        elif cmd == "sub":
-            code += dchg.stack_pop() + dnchg.star_ptrm1("SP") + "M=M-D\n"
-        elif cmd == "neg":
-            code += dnchg.star_ptrm1("SP") + "M=-M\n"
-        elif cmd == "eq":
-            code += compare_top2("JEQ")
-        elif cmd == "gt":
-            code += compare_top2("JGT")
-        elif cmd == "lt":
-            code += compare_top2("JLT")
-        elif cmd == "and":
-            code += dchg.stack_pop() + dnchg.star_ptrm1("SP") + "M=D&M\n"
-        elif cmd == "or":
-            code += dchg.stack_pop() + dnchg.star_ptrm1("SP") + "M=D|M\n"
-        elif cmd == "not":
-            code += dnchg.star_ptrm1("SP") + "M=!M\n"
+        if self.compact and cmd in COMPARE_ROUTINES:
+            self.n_compares += 1
+            return_address = f"__CMP_RET_{self.namespace}{self.n_compares}"
+            code = (
+                f"// {cmd}\n"
+                # D = returnAddress
+                + f"@{return_address}\n" + "D=A\n"
+                + f"@{COMPARE_ROUTINES[cmd][0]}\n" + "0;JMP\n"
+                + f"({return_address})\n"
+            )
+        elif cmd in COMPARE_JUMPS:
+            code = arithmetic_code(cmd).replace("{n}", f"{self.namespace}{dnchg.next_if_else_id()}")
         else:
-            raise Exception(f"Invalid arithmetic command: [{cmd}]")
+            code = arithmetic_code(cmd)
         self.f_asm.write(code)
 
     def write_push_pop(self, cmd_t: CmdType, seg: str, idx: int):
-        code = ""
-        if cmd_t == CmdType.C_PUSH:
-            code += f"// push {seg} {idx}\n"
-            if seg == "local":
-                code += dchg.stack_push_seg("LCL", idx)
-            elif seg == "argument":
-                code += dchg.stack_push_seg("ARG", idx)
-            elif seg == "this":
-                code += dchg.stack_push_seg("THIS", idx)
-            elif seg == "that":
-                code += dchg.stack_push_seg("THAT", idx)
-            elif seg == "static":
-                code += dchg.stack_push_static(self.vm_f_name, idx)
-            elif seg == "constant":
-                code += dchg.stack_push_val(idx)
-            elif seg == "temp":
-                code += dchg.assign_val2var("R13", 5) + dchg.stack_push_seg("R13", idx)
-            elif seg == "pointer":
-                code += dchg.stack_push_pointer(idx)
-            else:
-                raise Exception(f"Invalid segment type: [{seg}]")
-            pass
-        elif cmd_t == CmdType.C_POP:
-            code += f"// pop {seg} {idx}\n"
-            if seg == "local":
-                code += dchg.stack_pop_seg("LCL", idx)
-            elif seg == "argument":
-                code += dchg.stack_pop_seg("ARG", idx)
-            elif seg == "this":
-                code += dchg.stack_pop_seg("THIS", idx)
-            elif seg == "that":
-                code += dchg.stack_pop_seg("THAT", idx)
-            elif seg == "static":
-                code += dchg.stack_pop_static(self.vm_f_name, idx)
-            elif seg == "temp":
-                code += dchg.assign_val2var("R13", 5) + dchg.stack_pop_seg("R13", idx)
-            elif seg == "pointer":
-                code += dchg.stack_pop_pointer(idx)
-            else:
-                raise Exception(f"Invalid segment type: [{seg}]")
-        else:
-            raise Exception(f"Invalid command type: [{cmd_t.name}]")
-        self.f_asm.write(code)
+        f_name = None
+        if seg == "static":
+            f_name, idx = self.static_var(idx)
+        self.f_asm.write(push_pop_code(cmd_t, seg, idx, f_name))
+
+    def static_var(self, idx):
+        # (file name, index) of static idx; idx may be a StaticRef (see Inliner)
+        return tuple(idx) if isinstance(idx, StaticRef) else (self.vm_f_name, idx)
 
     def write_label(self, label: str):
         prefix = self.get_label_prefix()
@@ -126,6 +290,32 @@ class CodeWriter:
             + "D;JNE\n"  # true: -1; false: 0
         self.f_asm.write(code)
 
+    def write_source(self, file_name: str, index: int):
+        # the next code comes from the index-th command of file_name
+        if self.source_map:
+            self.f_asm.write(SourceMap.marker(file_name, index))
+
+    def write_idiom(self, name: str, code: str, n_baseline: int):
+        # a superinstruction (see Idioms) replacing VM code of n_baseline instructions
+        stats = self.idiom_stats[name]
+        stats[0] += 1
+        stats[1] += n_baseline - Peephole.count_instructs(code)
+        self.f_asm.write(f"// {name}\n" + code)
+
+    def render(self, write) -> str:
+        # returns the code written by write(), instead of writing it;
+        # the label counters are restored, so that the code written next
+        # does not depend on what was rendered
+        f_asm, self.f_asm = self.f_asm, StringIO()
+        counters = (self.n_compares, self.n_func_calls.copy(), dnchg.last_if_else_id())
+        try:
+            write()
+            return self.f_asm.getvalue()
+        finally:
+            self.f_asm = f_asm
+            self.n_compares, self.n_func_calls, n_if_else = counters
+            dnchg.reset_if_else_ids(n_if_else)
+
     def write_function(self, func_name: str, n_vars: int):
         self.curr_func_name = func_name
         code = f"// function {func_name} {n_vars}\n"
@@ -137,48 +327,34 @@ class CodeWriter:
         self.f_asm.write(code)
     
     def write_return(self):
-        code = (
-            "// return\n" 
-            # R14 (frame) = LCL
-            + dchg.assign_var2var("LCL", "R14")
-            # R15 (retAddr) = *(frame - 5)
-            + dchg.var_mi("R14", 5) + dnchg.star() + "D=M\n" + dnchg.assign_d2var("R15")
-            # *ARG = pop()
-            + dchg.stack_pop() + dnchg.star_ptr("ARG") + "M=D\n" 
-            # SP = ARG + 1
-            + dchg.var_pi("ARG", 1) + dnchg.assign_d2var("SP") 
-            # THAT = *(frame - 1)
-            + dchg.var_mi("R14", 1) + dnchg.star() + "D=M\n" + dnchg.assign_d2var("THAT")
-            # THIS = *(frame - 2)
-            + dchg.var_mi("R14", 2) + dnchg.star() + "D=M\n" + dnchg.assign_d2var("THIS")
-            # ARG = *(frame - 3)
-            + dchg.var_mi("R14", 3) + dnchg.star() + "D=M\n" + dnchg.assign_d2var("ARG")
-            # LCL = *(frame - 4)
-            + dchg.var_mi("R14", 4) + dnchg.star() + "D=M\n" + dnchg.assign_d2var("LCL")
-            # goto retAddr
-            + dnchg.star_ptr("R15") + "0;JMP\n"
-        )
+        if self.compact:
+            code = "// return\n" + "@__RETURN\n" + "0;JMP\n"
+        else:
+            code = "// return\n" + return_code()
         self.f_asm.write(code)
     
     def write_call(self, func_name: str, n_args: int):
-        return_address = f"{func_name}$ret.{self.n_func_calls[func_name]}"
+        return_address = f"{func_name}$ret.{self.namespace}{self.n_func_calls[func_name]}"
         self.n_func_calls[func_name] += 1
+        if self.compact:
+            code = (
+                f"// call {func_name} {n_args}\n"
+                # R13 = f, R14 = nArgs, D = returnAddress
+                + dchg.assign_val2var("R13", func_name)
+                + dchg.assign_val2var("R14", n_args)
+                + f"@{return_address}\n" + "D=A\n"
+                + "@__CALL\n" + "0;JMP\n"
+                # (returnAddress)
+                + f"({return_address})\n"
+            )
+            self.f_asm.write(code)
+            return
         code = (
             f"// call {func_name} {n_args}\n"
             # push returnAddress
             + dchg.stack_push_val(return_address)
-            # push LCL
-            + dchg.stack_push_var("LCL")
-            # push ARG
-            + dchg.stack_push_var("ARG")
-            # push THIS 
-            + dchg.stack_push_var("THIS")
-            # push TAHT
-            + dchg.stack_push_var("THAT")
-            # ARG = SP - 5 - nArgs
-            + dchg.var_mi("SP", 5+n_args) + dnchg.assign_d2var("ARG")
-            # LCL = SP
-            + dchg.assign_var2var("SP", "LCL")
+            # push LCL, ARG, THIS, THAT; ARG = SP - 5 - nArgs; LCL = SP
+            + call_frame_code(n_args)
             # goto f
             + f"@{func_name}\n" + "0;JMP\n"
             # (returnAddress)
@@ -186,9 +362,41 @@ class CodeWriter:
         )
         self.f_asm.write(code)
 
+    @property
+    def idiom_report(self) -> str:
+        total = sum(saved for _, saved in self.idiom_stats.values())
+        lines = [f"Idioms: {sum(n for n, _ in self.idiom_stats.values())} matches, "
+                 f"{total} instructions saved"]
+        lines += [f"    {name:<16}{n:>8}{saved:>10}"
+                  for name, (n, saved) in sorted(self.idiom_stats.items(), key=lambda item: -item[1][1])]
+        return "\n".join(lines)
+
+    def link(self, code: str, idiom_stats, peephole_stats):
+        # appends the final code of a file translated by another writer
+        # (in another namespace), and adds up its stats
+        self.linked.append(code)
+        for name, (n, saved) in idiom_stats.items():
+            self.idiom_stats[name][0] += n
+            self.idiom_stats[name][1] += saved
+        n_before, saved = self.peephole_stats
+        self.peephole_stats = (n_before + peephole_stats[0], saved + peephole_stats[1])
+
     def close(self):
         # self.f_asm.write("(END)\n@END\n0;JMP\n")
+        code = self.f_asm.getvalue()
         self.f_asm.close()
+        if self.optimize:
+            n_before = Peephole.count_instructs(code)
+            code, saved = Peephole.optimize(code)
+            self.peephole_stats = (self.peephole_stats[0] + n_before, self.peephole_stats[1] + saved)
+            self.peephole_report = Peephole.report(*self.peephole_stats)
+        code += "".join(self.linked)
+        if self.is_final and (self.source_map or not self.comments):
+            code, self.rom_map = SourceMap.finalize(code, self.comments)
+        if self.asm_file_path:
+            with open(self.asm_file_path, 'w') as f:
+                f.write(code)
+        self.code = code
 
     def get_label_prefix(self):
         return (self.curr_func_name + "$") if self.curr_func_name else ""
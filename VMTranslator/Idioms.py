@@ -0,0 +1,231 @@
+"""
+Superinstructions: fused translations of common multi-command VM idioms.
+The VM commands of a file are scanned with a sliding window (see
+    VMTranslator.translate_commands), and the first idiom matching at the
+    window is translated as a whole, e.g. "push local 2; push constant 1;
+    add; pop local 2" into an in-place "M=M+1".
+New idioms are registered with the @idiom(name) decorator; they are tried
+    in the order of registration (the longest ones first).
+Labels, function and call commands are never part of an idiom, so control
+    never enters a superinstruction in the middle.
+
+Measured savings (the OS + a test program, jcc.py --opt --compact; the
+    instructions are counted before the peephole pass, which would have
+    caught a part of them too, see CodeWriter.idiom_report):
+
+    idiom               matches   instructions saved   per match
+    move                   115                 1994        17.3
+    push-op                111                 1302        11.7
+    inc                     22                  777        35.3
+    push-compare-if         53                  698        13.2
+    array-store              6                  234        39.0
+    that-load               25                  200         8.0
+    not-if                  15                   75         5.0
+    compare-if               6                   33         5.5
+    total                  353                 5313
+
+    After the peephole pass: ROM 18867 -> 18203 words,
+    cycles of the test program 3.69M -> 3.44M.
+"""
+
+# %% Import Libs
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+from MyTypes import CmdType
+from CodeWriter import COMPARE_JUMPS, NEGATED_JUMPS
+
+# idiom(commands, i, writer) -> (number of commands, assembly code) or None
+Command = Tuple[CmdType, str, int]
+Match = Tuple[int, str]
+Idiom = Callable[[List[Command], int, object], Optional[Match]]
+
+# %% idiom registry
+
+IDIOMS: Dict[str, Idiom] = {}
+
+def idiom(name: str):
+    def register(func: Idiom) -> Idiom:
+        IDIOMS[name] = func
+        return func
+    return register
+
+
+def match(commands: List[Command], i: int, writer) -> Optional[Tuple[str, int, str]]:
+    '''Returns (idiom name, number of commands, assembly code) of the first
+    idiom matching at commands[i], or None.'''
+    for name, func in IDIOMS.items():
+        m = func(commands, i, writer)
+        if m is not None:
+            return (name,) + m
+    return None
+
+# %% addressing
+
+BASE_PTRS = {"local": "LCL", "argument": "ARG", "this": "THIS", "that": "THAT"}
+MAX_STEPS = 3  # max number of A=A+1 steps to address seg[i]
+
+
+def address(writer, seg: str, idx: int, keep_d: bool=False) -> Optional[str]:
+    '''Code setting A to the address of seg[idx].
+    With keep_d, returns None if the code would overwrite D.'''
+    if seg in BASE_PTRS:
+        if idx <= MAX_STEPS:
+            return f"@{BASE_PTRS[seg]}\n" + "A=M\n" + "A=A+1\n" * idx
+        if keep_d:
+            return None
+        return f"@{idx}\n" + "D=A\n" + f"@{BASE_PTRS[seg]}\n" + "A=D+M\n"
+    if seg == "static":
+        f_name, idx = writer.static_var(idx)
+        return f"@{f_name}.{idx}\n"
+    if seg == "temp":
+        return f"@{5 + idx}\n"
+    if seg == "pointer":
+        return "@THIS\n" if idx == 0 else "@THAT\n"
+    return None
+
+
+def load(writer, seg: str, idx: int) -> str:
+    '''Code setting D to seg[idx].'''
+    if seg == "constant":
+        return f"@{idx}\n" + "D=A\n"
+    return address(writer, seg, idx) + "D=M\n"
+
+
+def is_cmd(command: Command, cmd_t: CmdType, *args) -> bool:
+    return command[0] == cmd_t and all(a is None or a == b for a, b in zip(args, command[1:]))
+
+
+def window(commands: List[Command], i: int, n: int) -> List[Command]:
+    return commands[i:i+n] if i + n <= len(commands) else []
+
+# %% idioms
+
+@idiom("inc")
+def inc(commands, i, writer) -> Optional[Match]:
+    '''push seg k; push constant c; add|sub; pop seg k  ==>  seg[k] += c (in place)'''
+    w = window(commands, i, 4)
+    if not (w and is_cmd(w[0], CmdType.C_PUSH) and w[0][1] != "constant"
+            and is_cmd(w[1], CmdType.C_PUSH, "constant")
+            and w[2][0] == CmdType.C_ARITHMETIC and w[2][1] in {"add", "sub"}
+            and is_cmd(w[3], CmdType.C_POP, w[0][1], w[0][2])):
+        return None
+    seg, idx = w[0][1], w[0][2]
+    c, op = w[1][2], w[2][1]
+    if c == 1:
+        return 4, address(writer, seg, idx) + ("M=M+1\n" if op == "add" else "M=M-1\n")
+    addr = address(writer, seg, idx, keep_d=True)
+    if addr is None:
+        return None
+    return 4, f"@{c}\n" + "D=A\n" + addr + ("M=D+M\n" if op == "add" else "M=M-D\n")
+
+
+@idiom("array-store")
+def array_store(commands, i, writer) -> Optional[Match]:
+    '''pop temp 0; pop pointer 1; push temp 0; pop that 0  ==>  *(THAT = addr) = value'''
+    w = window(commands, i, 4)
+    if not (w and is_cmd(w[0], CmdType.C_POP, "temp", 0) and is_cmd(w[1], CmdType.C_POP, "pointer", 1)
+            and is_cmd(w[2], CmdType.C_PUSH, "temp", 0) and is_cmd(w[3], CmdType.C_POP, "that", 0)):
+        return None
+    return 4, (
+        "@SP\n" + "AM=M-1\n" + "D=M\n" + "@5\n" + "M=D\n"     # temp 0 = value
+        + "@SP\n" + "AM=M-1\n" + "D=M\n" + "@THAT\n" + "M=D\n"  # THAT = address
+        + "@5\n" + "D=M\n" + "@THAT\n" + "A=M\n" + "M=D\n"      # *THAT = value
+    )
+
+
+def compare_if(commands, j, n_before) -> Optional[Tuple[int, str, str]]:
+    # matches "eq|gt|lt; [not;] if-goto label" at j
+    # returns (number of commands from j - n_before, jump, label)
+    if j >= len(commands) or commands[j][0] != CmdType.C_ARITHMETIC \
+            or commands[j][1] not in COMPARE_JUMPS:
+        return None
+    j_cond = COMPARE_JUMPS[commands[j][1]]
+    k = j + 1
+    if k < len(commands) and is_cmd(commands[k], CmdType.C_ARITHMETIC, "not"):
+        j_cond = NEGATED_JUMPS[j_cond]
+        k += 1
+    if k < len(commands) and commands[k][0] == CmdType.C_IF:
+        return k + 1 - j + n_before, j_cond, commands[k][1]
+    return None
+
+
+@idiom("push-compare-if")
+def push_compare_if(commands, i, writer) -> Optional[Match]:
+    '''push seg k; eq|gt|lt; [not;] if-goto L  ==>  D = x - seg[k]; D;Jcc'''
+    if not is_cmd(commands[i], CmdType.C_PUSH):
+        return None
+    m = compare_if(commands, i + 1, 1)
+    if m is None:
+        return None
+    n, j_cond, label = m
+    return n, (
+        load(writer, commands[i][1], commands[i][2])
+        + "@SP\n" + "AM=M-1\n" + "D=M-D\n"
+        + f"@{writer.get_label_prefix()}{label}\n" + f"D;{j_cond}\n"
+    )
+
+
+@idiom("compare-if")
+def compare_branch(commands, i, writer) -> Optional[Match]:
+    '''eq|gt|lt; [not;] if-goto L  ==>  D = x - y; D;Jcc
+    (the comparison is not materialized as -1/0)'''
+    m = compare_if(commands, i, 0)
+    if m is None:
+        return None
+    n, j_cond, label = m
+    return n, (
+        "@SP\n" + "AM=M-1\n" + "D=M\n"
+        + "@SP\n" + "AM=M-1\n" + "D=M-D\n"
+        + f"@{writer.get_label_prefix()}{label}\n" + f"D;{j_cond}\n"
+    )
+
+
+@idiom("that-load")
+def that_load(commands, i, writer) -> Optional[Match]:
+    '''pop pointer 1; push that 0  ==>  THAT = top; top = *THAT'''
+    w = window(commands, i, 2)
+    if not (w and is_cmd(w[0], CmdType.C_POP, "pointer", 1) and is_cmd(w[1], CmdType.C_PUSH, "that", 0)):
+        return None
+    return 2, (
+        "@SP\n" + "A=M-1\n" + "D=M\n" + "@THAT\n" + "M=D\n"
+        + "A=D\n" + "D=M\n" + "@SP\n" + "A=M-1\n" + "M=D\n"
+    )
+
+
+@idiom("not-if")
+def not_if(commands, i, writer) -> Optional[Match]:
+    '''not; if-goto L  ==>  jump if x != -1'''
+    w = window(commands, i, 2)
+    if not (w and is_cmd(w[0], CmdType.C_ARITHMETIC, "not") and w[1][0] == CmdType.C_IF):
+        return None
+    return 2, (
+        "@SP\n" + "AM=M-1\n" + "D=M+1\n"
+        + f"@{writer.get_label_prefix()}{w[1][1]}\n" + "D;JNE\n"
+    )
+
+
+@idiom("move")
+def move(commands, i, writer) -> Optional[Match]:
+    '''push seg1 k1; pop seg2 k2  ==>  seg2[k2] = seg1[k1] (without the stack)
+    e.g. push argument 0; pop pointer 0 in every method prologue'''
+    w = window(commands, i, 2)
+    if not (w and is_cmd(w[0], CmdType.C_PUSH) and is_cmd(w[1], CmdType.C_POP)):
+        return None
+    addr = address(writer, w[1][1], w[1][2], keep_d=True)
+    if addr is None:
+        return None
+    return 2, load(writer, w[0][1], w[0][2]) + addr + "M=D\n"
+
+
+PUSH_OPS = {"add": "M=D+M\n", "sub": "M=M-D\n", "and": "M=D&M\n", "or": "M=D|M\n"}
+
+
+@idiom("push-op")
+def push_op(commands, i, writer) -> Optional[Match]:
+    '''push seg k; add|sub|and|or  ==>  top = top op seg[k] (in place)'''
+    w = window(commands, i, 2)
+    if not (w and is_cmd(w[0], CmdType.C_PUSH)
+            and w[1][0] == CmdType.C_ARITHMETIC and w[1][1] in PUSH_OPS):
+        return None
+    return 2, load(writer, w[0][1], w[0][2]) + "@SP\n" + "A=M-1\n" + PUSH_OPS[w[1][1]]
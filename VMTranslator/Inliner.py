@@ -0,0 +1,187 @@
+"""
+Inlining of small leaf functions.
+A call to a function that calls no other function, and has at most
+    max_size commands, is replaced by a copy of its body:
+    1. the arguments are popped from the stack, and the arguments and locals
+       are kept in temp 2..7 (the locals are zeroed first);
+    2. the labels are renamed into the caller's namespace, and the returns
+       jump to the end of the copy, where the return value is left on the
+       stack (as after a call);
+    3. the statics are qualified with the callee's file (see StaticRef);
+    4. THIS and THAT are saved and restored, if the callee sets them.
+The temp segment is not saved by the calls, so the inlined code uses
+    temp 2..7 only if no function of the program uses them.
+A function is only inlined if the stack depth of its body is known at every
+    command, and is 1 at every return (as for the code of the compiler).
+"""
+
+# %% Import Libs
+
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from MyTypes import CmdType, StaticRef
+from Linker import Command, split_functions
+
+MAX_SIZE = 20        # default max number of commands of an inlined function
+FIRST_TEMP = 2       # temp 0 and 1 are used by the compiler
+N_TEMPS = 8 - FIRST_TEMP
+
+BINARY_OPS = {"add", "sub", "eq", "gt", "lt", "and", "or"}
+
+# %% inlinable functions
+
+def stack_depths(body: List[Command]) -> Optional[List[Optional[int]]]:
+    '''Returns the stack depth before every command of a function body
+    (None for the unreachable ones), or None if it is not known statically,
+    or if the body calls a function, or does not return with one value.'''
+    if not body:
+        return None
+    labels = {arg1: i for i, (cmd_t, arg1, _) in enumerate(body) if cmd_t == CmdType.C_LABEL}
+    depths = [None] * len(body)
+    depths[0] = 0
+    work = [0]
+    while work:
+        i = work.pop()
+        (cmd_t, arg1, _), d = body[i], depths[i]
+        if cmd_t == CmdType.C_PUSH:
+            nexts = [(i + 1, d + 1)]
+        elif cmd_t == CmdType.C_POP:
+            nexts = [(i + 1, d - 1)]
+        elif cmd_t == CmdType.C_ARITHMETIC:
+            nexts = [(i + 1, d - 1 if arg1 in BINARY_OPS else d)]
+        elif cmd_t == CmdType.C_LABEL:
+            nexts = [(i + 1, d)]
+        elif cmd_t == CmdType.C_GOTO and arg1 in labels:
+            nexts = [(labels[arg1], d)]
+        elif cmd_t == CmdType.C_IF and arg1 in labels:
+            nexts = [(labels[arg1], d - 1), (i + 1, d - 1)]
+        elif cmd_t == CmdType.C_RETURN and d == 1:
+            nexts = []
+        else:  # call, function, unknown label, return with a dirty stack
+            return None
+        for j, d_next in nexts:
+            # the body must not read below its frame, nor fall off its end
+            if d_next < 0 or d_next < (cmd_t == CmdType.C_ARITHMETIC) or j == len(body):
+                return None
+            if depths[j] is None:
+                depths[j] = d_next
+                work.append(j)
+            elif depths[j] != d_next:
+                return None
+    return depths
+
+
+class Callee:
+
+    def __init__(self, file_name: str, name: str, n_vars: int, body: List[Command], depths: List[int]):
+        self.file_name = file_name
+        self.name = name
+        self.n_vars = n_vars
+        # the reachable commands only
+        self.body = [cmd for cmd, d in zip(body, depths) if d is not None]
+        self.n_args = 1 + max((arg2 for cmd_t, arg1, arg2 in self.body
+                               if cmd_t in (CmdType.C_PUSH, CmdType.C_POP)
+                               and arg1 == "argument"), default=-1)
+        self.pointers = sorted({arg2 for cmd_t, arg1, arg2 in self.body
+                                if cmd_t == CmdType.C_POP and arg1 == "pointer"})
+
+
+def inlinable(files: Dict[str, List[Command]], max_size: int) -> Dict[str, Callee]:
+    '''Returns {function name: Callee} of the functions that may be inlined.'''
+    callees = {}
+    for file_name, commands in files.items():
+        for name, body in split_functions(commands):
+            if not name or len(body) - 1 > max_size:
+                continue
+            depths = stack_depths(body[1:])
+            if depths is not None:
+                callees[name] = Callee(file_name, name, body[0][2], body[1:], depths)
+    return callees
+
+
+def uses_high_temps(files: Dict[str, List[Command]]) -> bool:
+    return any(cmd_t in (CmdType.C_PUSH, CmdType.C_POP) and arg1 == "temp"
+               and arg2 >= FIRST_TEMP
+               for commands in files.values() for cmd_t, arg1, arg2 in commands)
+
+# %% inlining
+
+def expand(callee: Callee, n_args: int, tag: str) -> Optional[List[Command]]:
+    '''Returns the commands replacing "call callee n_args",
+    with the labels of the copy prefixed by tag; or None if it does not fit.'''
+    if callee.n_args > n_args or n_args + callee.n_vars + len(callee.pointers) > N_TEMPS:
+        return None
+    slots = {
+        "argument": FIRST_TEMP,
+        "local": FIRST_TEMP + n_args,
+        "pointer": FIRST_TEMP + n_args + callee.n_vars,  # saved THIS/THAT
+    }
+    # the renamed labels are tag$label: the end label is not one of them
+    end = f"{tag}.END"
+    code = [(CmdType.C_POP, "temp", slots["argument"] + i) for i in reversed(range(n_args))]
+    code += [cmd for j in range(callee.n_vars)
+             for cmd in ((CmdType.C_PUSH, "constant", 0), (CmdType.C_POP, "temp", slots["local"] + j))]
+    saves = [(k, slots["pointer"] + n) for n, k in enumerate(callee.pointers)]
+    code += [cmd for k, slot in saves
+             for cmd in ((CmdType.C_PUSH, "pointer", k), (CmdType.C_POP, "temp", slot))]
+    for i, (cmd_t, arg1, arg2) in enumerate(callee.body):
+        if cmd_t in (CmdType.C_PUSH, CmdType.C_POP) and arg1 in ("argument", "local"):
+            code.append((cmd_t, "temp", slots[arg1] + arg2))
+        elif cmd_t in (CmdType.C_PUSH, CmdType.C_POP) and arg1 == "static":
+            code.append((cmd_t, arg1, StaticRef(callee.file_name, arg2)))
+        elif cmd_t in (CmdType.C_LABEL, CmdType.C_GOTO, CmdType.C_IF):
+            code.append((cmd_t, f"{tag}${arg1}", None))
+        elif cmd_t == CmdType.C_RETURN:
+            if i < len(callee.body) - 1:
+                code.append((CmdType.C_GOTO, end, None))
+        else:
+            code.append((cmd_t, arg1, arg2))
+    if any(cmd == (CmdType.C_GOTO, end, None) for cmd in code):
+        code.append((CmdType.C_LABEL, end, None))
+    # the return value stays at the top of the stack
+    code += [cmd for k, slot in saves
+             for cmd in ((CmdType.C_PUSH, "temp", slot), (CmdType.C_POP, "pointer", k))]
+    return code
+
+
+def inline(files: Dict[str, List[Command]], max_size: int=MAX_SIZE,
+           origins: Dict[str, List[int]]=None) -> Tuple[Dict[str, List[Command]], str]:
+    '''Inlines the calls to the small leaf functions of a program.
+    files: {.vm file name: commands}; the command types may be any enum
+        sharing the codes of CmdType (see VMTranslator.translate_commands).
+    origins: {.vm file name: index of every command in the source file}
+        (for the source maps), updated in place; an inlined copy comes
+        from its call.
+    Returns the files with the calls inlined (the callees are kept, see
+        Linker.prune), and a report.'''
+    files = {file_name: [(CmdType(cmd_t.value), arg1, arg2) for cmd_t, arg1, arg2 in commands]
+             for file_name, commands in files.items()}
+    if uses_high_temps(files):
+        return files, f"Inliner: temp {FIRST_TEMP}..7 in use, no call inlined"
+    callees = inlinable(files, max_size)
+    n_inlined = Counter()
+    inlined = {}
+    for file_name, commands in files.items():
+        code, code_origins = [], []
+        source = iter(origins[file_name]) if origins is not None else None
+        for name, body in split_functions(commands):
+            n_sites = 0
+            for cmd_t, arg1, arg2 in body:
+                origin = next(source) if source is not None else None
+                expansion = None
+                if cmd_t == CmdType.C_CALL and arg1 in callees:
+                    expansion = expand(callees[arg1], arg2, f"{arg1}${n_sites}")
+                if expansion is None:
+                    expansion = [(cmd_t, arg1, arg2)]
+                else:
+                    n_sites += 1
+                    n_inlined[arg1] += 1
+                code += expansion
+                code_origins += [origin] * len(expansion)
+        inlined[file_name] = code
+        if origins is not None:
+            origins[file_name] = code_origins
+    lines = [f"Inliner: {sum(n_inlined.values())} calls to {len(n_inlined)} functions inlined"]
+    lines += [f"    {name:<24}{n:>6}" for name, n in n_inlined.most_common()]
+    return inlined, "\n".join(lines)
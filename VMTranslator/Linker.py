@@ -0,0 +1,107 @@
+"""
+Link-time dead function elimination.
+The VM code of a whole program (the .vm files of a folder, with the OS) is
+    split into its functions, and the static call graph is built from the
+    call commands. Only the functions reachable from the entry point
+    (Sys.init, called by the bootstrap code) are kept.
+The VM has no function pointers, so a function that is never the target of
+    a call reachable from the entry point can never run. Labels are local
+    to their function, and the statics to their file, so dropping whole
+    functions does not change the code of the ones kept.
+"""
+
+# %% Import Libs
+
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+from MyTypes import CmdType
+
+Command = Tuple[CmdType, str, int]
+
+ENTRY = "Sys.init"
+
+# the command types are compared by code: the records may come from
+# the compiler (see VMTranslator.translate_commands)
+C_FUNCTION = CmdType.C_FUNCTION.value
+C_CALL = CmdType.C_CALL.value
+
+# %% call graph
+
+def split_functions(commands: List[Command]) -> List[Tuple[str, List[Command]]]:
+    '''Splits the commands of a .vm file into [(function name, commands)].
+    The commands before the first function (if any) get the name "".'''
+    functions = []
+    for command in commands:
+        is_function = command[0].value == C_FUNCTION
+        if is_function or not functions:
+            name = command[1] if is_function else ""
+            functions.append((name, []))
+        functions[-1][1].append(command)
+    return functions
+
+
+def call_graph(files: Dict[str, List[Command]]) -> Dict[str, Set[str]]:
+    '''Returns {function name: names of the functions it calls}.'''
+    graph = defaultdict(set)
+    for commands in files.values():
+        for name, body in split_functions(commands):
+            graph[name] |= {arg1 for cmd_t, arg1, _ in body if cmd_t.value == C_CALL}
+    return graph
+
+
+def reachable(graph: Dict[str, Set[str]], roots: List[str]) -> Set[str]:
+    '''Returns the names of the functions reachable from roots.'''
+    seen = set()
+    stack = [*roots]
+    while stack:
+        name = stack.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        stack += graph.get(name, ())
+    return seen
+
+# %% linking
+
+def prune(files: Dict[str, List[Command]], entry: str=ENTRY,
+          origins: Dict[str, List[int]]=None) -> Tuple[Dict[str, List[Command]], str]:
+    '''Drops the functions unreachable from the entry point.
+    files: {.vm file name: commands}, in translation order.
+    origins: {.vm file name: index of every command in the source file}
+        (for the source maps), updated in place.
+    Returns the pruned files (without the files left empty), and a size report.
+    Note: Without an entry point (e.g. a single file), nothing is dropped.'''
+    graph = call_graph(files)
+    if entry not in graph:
+        return files, f"Linker: no {entry}, no function dropped"
+    live = reachable(graph, ["", entry])  # the code outside functions always runs
+    pruned = {}
+    stats = {}  # {.vm file name: [functions kept, functions, commands kept, commands]}
+    for file_name, commands in files.items():
+        kept, kept_origins = [], []
+        n_kept = n_funcs = start = 0
+        for name, body in split_functions(commands):
+            n_funcs += bool(name)
+            if name in live:
+                kept += body
+                n_kept += bool(name)
+                if origins is not None:
+                    kept_origins += origins[file_name][start:start+len(body)]
+            start += len(body)
+        stats[file_name] = [n_kept, n_funcs, len(kept), len(commands)]
+        if origins is not None:
+            origins[file_name] = kept_origins
+        if kept:
+            pruned[file_name] = kept
+    return pruned, report(stats)
+
+
+def report(stats: Dict[str, List[int]]) -> str:
+    totals = [sum(column) for column in zip(*stats.values())] or [0, 0, 0, 0]
+    lines = [f"Linker: {totals[0]}/{totals[1]} functions kept, "
+             f"{totals[2]}/{totals[3]} VM commands kept",
+             f"    {'class':<16}{'functions':>12}{'commands':>14}"]
+    lines += [f"    {file_name.rsplit('.', 1)[0]:<16}{f'{n_kept}/{n_funcs}':>12}{f'{c_kept}/{c_all}':>14}"
+              for file_name, (n_kept, n_funcs, c_kept, c_all) in stats.items()]
+    return "\n".join(lines)
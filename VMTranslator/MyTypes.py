@@ -1,4 +1,5 @@
 from enum import Enum, unique
+from typing import NamedTuple
 
 @unique
 class CmdType(Enum):
@@ -11,4 +12,12 @@ class CmdType(Enum):
 	C_FUNCTION = 6
 	C_RETURN = 7
 	C_CALL = 8
-	C_INVALID = 9
\ No newline at end of file
+	C_INVALID = 9
+
+class StaticRef(NamedTuple):
+	# the index of a static of another .vm file (e.g. in an inlined function)
+	file_name: str
+	index: int
+
+	def __str__(self):
+		return f"{self.file_name}.{self.index}"
@@ -1,96 +1,79 @@
+"""
+Parsing VM code into predecoded (command type, arg1, arg2) records.
+A whole .vm file is read at once, and every line is decoded a single time,
+    with a table lookup on its first word (see COMMANDS):
+    arithmetic: (C_ARITHMETIC, "add", None)
+    push/pop/function/call: (cmd_type, "local", 2)
+    label/goto/if-goto: (cmd_type, "LOOP", None)
+    return: (C_RETURN, None, None)
+"""
+
 # %% Import Libs
 
-import re
+from pathlib import Path
+from typing import Iterable, List, Tuple
 
 from MyTypes import CmdType
 
+Command = Tuple[CmdType, str, int]
+
 # %% Helper Functions
 
-def format_input(input: str):
-    # remove comments
-    input = re.sub(r"//.*$", "", input)
-    # remove leading and trailing whitespaces
-    input = input.strip()
-    return input
-
-# %% Class Definition
-
-class Parser:
-    
-    # static vars
-    al_cmds = {"add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"}
-
-    def __init__(self, vm_file_path):
-        self.f_vm = open(vm_file_path, 'r')
-        self._has_more_lines = True
-        self.curr_cmd = ""
-
-    def has_more_lines(self):
-        return self._has_more_lines
-
-    def advance(self):
-        while self.has_more_lines():
-            line = self.f_vm.readline()
-            if line == '':  # EOF
-                self.curr_cmd = ""
-                self._has_more_lines = False
-                break
-            self.curr_cmd = format_input(line)
-            if self.is_curr_cmd_valid():
-                break
-
-    def command_type(self):
-        if self.curr_cmd in self.al_cmds:
-            return CmdType.C_ARITHMETIC
-        elif self.curr_cmd.startswith("push"):
-            return CmdType.C_PUSH
-        elif self.curr_cmd.startswith("pop"):
-            return CmdType.C_POP
-        elif self.curr_cmd.startswith("label"):
-            return CmdType.C_LABEL
-        elif self.curr_cmd.startswith("goto"):
-            return CmdType.C_GOTO
-        elif self.curr_cmd.startswith("if-goto"):
-            return CmdType.C_IF
-        elif self.curr_cmd.startswith("function"):
-            return CmdType.C_FUNCTION
-        elif self.curr_cmd == "return":
-            return CmdType.C_RETURN
-        elif self.curr_cmd.startswith("call"):
-            return CmdType.C_CALL
-        else:
-            return CmdType.C_INVALID
-
-    def arg1(self):
-        cmd_t = self.command_type()
-        assert cmd_t != CmdType.C_RETURN
-        if cmd_t == CmdType.C_ARITHMETIC:
-            return self.curr_cmd
-        else:
-            return self.curr_cmd.split(' ')[1]
-
-    def arg2(self):
-        cmd_t = self.command_type()
-        assert cmd_t == CmdType.C_PUSH \
-            or cmd_t == CmdType.C_POP \
-            or cmd_t == CmdType.C_FUNCTION \
-            or cmd_t == CmdType.C_CALL
-        return int(self.curr_cmd.split(' ')[2])
-    
-    def close(self):
-        self.f_vm.close()
-
-    def is_curr_cmd_valid(self):
-        is_empty = self.curr_cmd == ''
-        is_comment = self.curr_cmd.startswith("//")
-        return (not is_empty) and (not is_comment)
+def format_input(input: str) -> List[str]:
+    # remove comments, and split into words
+    return input.split("//", 1)[0].split()
+
+# %% decoding table
+
+AL_CMDS = ("add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not")
+
+# {first word: (command type, number of args)}
+COMMANDS = {
+    **{cmd: (CmdType.C_ARITHMETIC, 0) for cmd in AL_CMDS},
+    "push"    : (CmdType.C_PUSH, 2),
+    "pop"     : (CmdType.C_POP, 2),
+    "label"   : (CmdType.C_LABEL, 1),
+    "goto"    : (CmdType.C_GOTO, 1),
+    "if-goto" : (CmdType.C_IF, 1),
+    "function": (CmdType.C_FUNCTION, 2),
+    "return"  : (CmdType.C_RETURN, 0),
+    "call"    : (CmdType.C_CALL, 2),
+}
+
+# %% parsing
+
+def parse(lines: Iterable[str]) -> List[Command]:
+    '''Parses lines of VM code in a single pass into [(cmd_type, arg1, arg2)].'''
+    commands = []
+    append = commands.append
+    for n, line in enumerate(lines, 1):
+        words = format_input(line)
+        if not words:
+            continue
+        cmd_t, n_args = COMMANDS.get(words[0], (CmdType.C_INVALID, None))
+        if n_args != len(words) - 1:
+            raise Exception(f"Invalid VM command at line {n}: [{line.strip()}]")
+        if n_args == 2:
+            append((cmd_t, words[1], int(words[2])))
+        elif n_args == 1:
+            append((cmd_t, words[1], None))
+        elif cmd_t == CmdType.C_ARITHMETIC:
+            append((cmd_t, words[0], None))
+        else:  # return
+            append((cmd_t, None, None))
+    return commands
+
+
+def parse_file(vm_file_path: Path) -> List[Command]:
+    '''Parses a .vm file into [(cmd_type, arg1, arg2)].'''
+    with open(vm_file_path, 'r') as f_vm:
+        return parse(f_vm.read().splitlines())
 
 # %% Testing
 
 def _main():
     print(format_input("   abc // def  "))
-    parser = Parser("./tests/MemoryAccess/BasicTest/BasicTest.vm")
-    print(parser._has_more_lines)
+    print(parse(["push constant 7 // seven", "", "add", "return"]))
 
 if __name__ == "__main__":
     _main()
@@ -0,0 +1,242 @@
+"""
+Peephole optimization of the generated assembly code.
+The code is scanned with a sliding window, and every rule may rewrite the
+    instructions at the window into a shorter sequence.
+Comments are transparent to the rules (they are kept in the output), and
+    labels are barriers, since control may enter the code at a label.
+The rules are grouped into passes; each pass runs until no rule applies.
+New rules are registered with the @rule(name) decorator and enabled by
+    adding their names to PASSES.
+"""
+
+# %% Import Libs
+
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+# rule(instructs, i) -> (number of instructions replaced, replacement) or None
+Rewrite = Tuple[int, List[str]]
+Rule = Callable[[List[str], int], Optional[Rewrite]]
+
+# %% rule registry
+
+RULES: Dict[str, Rule] = {}
+
+def rule(name: str):
+    def register(func: Rule) -> Rule:
+        RULES[name] = func
+        return func
+    return register
+
+# %% code patterns (see dchg, dnchg)
+
+PUSH_D = ["@SP", "A=M", "M=D", "@SP", "M=M+1"]   # *SP = D; SP++
+POP_D = ["@SP", "M=M-1", "@SP", "A=M", "D=M"]    # SP--; D = *SP
+SEGMENT_PTRS = {"LCL", "ARG", "THIS", "THAT"}
+
+
+def match_var_pi(instructs: List[str], i: int, var: str=None):
+    '''Matches dchg.var_pi(var, k) (D = var + k) at i.
+    Returns (var, k, length) or None.'''
+    if instructs[i+1:i+2] == ["D=M+1"] and instructs[i][0] == '@':
+        if var is None or instructs[i][1:] == var:
+            return instructs[i][1:], 1, 2
+    window = instructs[i:i+4]
+    if (len(window) == 4 and window[0][0] == '@' and window[0][1:].isdigit()
+            and window[1] == "D=A" and window[2][0] == '@' and window[3] == "D=D+M"
+            and (var is None or window[2][1:] == var)):
+        return window[2][1:], int(window[0][1:]), 4
+    return None
+
+
+def next_is_a_instruct(instructs: List[str], i: int) -> bool:
+    '''Checks whether instructs[i] reloads the A register,
+    i.e. the A register is dead before instructs[i].'''
+    return i < len(instructs) and instructs[i][0] == '@'
+
+# %% rules: stack traffic
+
+@rule("push-pop")
+def push_pop(instructs: List[str], i: int) -> Optional[Rewrite]:
+    '''*SP = D; SP++; SP--; D = *SP  ==>  (nothing)
+    e.g. push constant 7 + add, push local 0 + pop static 1'''
+    n = len(PUSH_D) + len(POP_D)
+    if instructs[i:i+n] == PUSH_D + POP_D and next_is_a_instruct(instructs, i+n):
+        return n, []
+    return None
+
+
+@rule("push-pop-seg")
+def push_pop_seg(instructs: List[str], i: int) -> Optional[Rewrite]:
+    '''push x + pop seg k: the value stays in D, and is stored into seg[k]
+    without going through the stack.'''
+    if instructs[i:i+5] != PUSH_D:
+        return None
+    j = i + 5
+    m = match_var_pi(instructs, j)
+    if m is None or m[0] not in SEGMENT_PTRS:
+        return None
+    seg, k, n_addr = m
+    tail = ["@R13", "M=D"] + POP_D + ["@R13", "A=M", "M=D"]
+    if instructs[j+n_addr:j+n_addr+len(tail)] != tail:
+        return None
+    n = 5 + n_addr + len(tail)
+    if k <= 10:
+        # A = seg + k, step by step
+        if k == 0:
+            addr = ["@" + seg, "A=M"]
+        else:
+            addr = ["@" + seg, "A=M+1"] + ["A=A+1"] * (k - 1)
+        return n, addr + ["M=D"]
+    # keep the value in R15 while the address is computed
+    return n, (["@R15", "M=D"] + instructs[j:j+n_addr] +
+               ["@R13", "M=D", "@R15", "D=M", "@R13", "A=M", "M=D"])
+
+# %% rules: addressing
+
+@rule("temp-fold")
+def temp_fold(instructs: List[str], i: int) -> Optional[Rewrite]:
+    '''R13 = 5; ... R13 + k ...  ==>  @{5+k}
+    The temp segment is at a fixed address, so push/pop temp k
+    address RAM[5+k] directly.'''
+    if instructs[i:i+4] != ["@5", "D=A", "@R13", "M=D"]:
+        return None
+    m = match_var_pi(instructs, i+4, "R13")
+    if m is None:
+        return None
+    _, k, n_addr = m
+    j = i + 4 + n_addr
+    if instructs[j:j+2] == ["A=D", "D=M"]:
+        # push temp k
+        return j + 2 - i, [f"@{5+k}", "D=M"]
+    tail = ["@R13", "M=D"] + POP_D + ["@R13", "A=M", "M=D"]
+    if instructs[j:j+len(tail)] == tail:
+        # pop temp k
+        return j + len(tail) - i, POP_D + [f"@{5+k}", "M=D"]
+    return None
+
+
+@rule("const-d")
+def const_d(instructs: List[str], i: int) -> Optional[Rewrite]:
+    '''@0 D=A  ==>  D=0 (likewise for 1), when A is reloaded next.'''
+    if instructs[i] in ("@0", "@1") and instructs[i+1:i+2] == ["D=A"] \
+            and next_is_a_instruct(instructs, i+2):
+        return 2, ["D=" + instructs[i][1:]]
+    return None
+
+# %% rules: stack pointer updates
+
+@rule("sp-dec")
+def sp_dec(instructs: List[str], i: int) -> Optional[Rewrite]:
+    '''@SP M=M-1 @SP A=M  ==>  @SP AM=M-1'''
+    if instructs[i:i+4] == ["@SP", "M=M-1", "@SP", "A=M"]:
+        return 4, ["@SP", "AM=M-1"]
+    return None
+
+
+@rule("sp-reuse")
+def sp_reuse(instructs: List[str], i: int) -> Optional[Rewrite]:
+    '''@SP AM=M-1 D=M @SP A=M-1  ==>  @SP AM=M-1 D=M A=A-1
+    (A still holds SP after the pop)'''
+    if instructs[i:i+5] == ["@SP", "AM=M-1", "D=M", "@SP", "A=M-1"]:
+        return 5, ["@SP", "AM=M-1", "D=M", "A=A-1"]
+    return None
+
+
+@rule("push-inc")
+def push_inc(instructs: List[str], i: int) -> Optional[Rewrite]:
+    '''@SP A=M M=D @SP M=M+1  ==>  @SP M=M+1 A=M-1 M=D, when A is reloaded next.'''
+    if instructs[i:i+5] == PUSH_D and next_is_a_instruct(instructs, i+5):
+        return 5, ["@SP", "M=M+1", "A=M-1", "M=D"]
+    return None
+
+# %% pass manager
+
+PASSES = [
+    ["temp-fold", "push-pop", "push-pop-seg"],
+    ["sp-dec", "sp-reuse", "push-inc", "const-d"],
+]
+
+WINDOW = 24  # max number of instructions a rule looks at
+
+
+def rewrite_block(instructs: List[str], notes: List[List[str]],
+                  rules: List[Tuple[str, Rule]], saved: Counter) -> List[str]:
+    '''Applies the rules to a block of instructions (without labels) in place.
+    notes[i]: the comments before instructs[i].
+    Returns the comments left over at the end of the block.'''
+    left_over = []
+    i = 0
+    while i < len(instructs):
+        for name, func in rules:
+            m = func(instructs, i)
+            if m is None:
+                continue
+            n, replacement = m
+            comments = [line for lines in notes[i:i+n] for line in lines]
+            instructs[i:i+n] = replacement
+            notes[i:i+n] = [comments] + [[] for _ in replacement[1:]] if replacement else []
+            if not replacement:
+                # the comments go with the next instruction
+                if i < len(notes):
+                    notes[i] = comments + notes[i]
+                else:
+                    left_over += comments
+            saved[name] += n - len(replacement)
+            # the rewritten code may enable another rewrite just before it
+            i = max(0, i - WINDOW)
+            break
+        else:
+            i += 1
+    return left_over
+
+
+def optimize(code: str, passes: List[List[str]]=PASSES) -> Tuple[str, Counter]:
+    '''Optimizes assembly code with the given passes of rules.
+    Returns the optimized code, and the number of instructions saved by each rule.'''
+    saved = Counter()
+    lines = code.splitlines()
+    for names in passes:
+        rules = [(name, RULES[name]) for name in names]
+        output = []
+        instructs, notes, comments = [], [], []
+
+        def flush():
+            left_over = rewrite_block(instructs, notes, rules, saved)
+            for instruct, lines_before in zip(instructs, notes):
+                output.extend(lines_before)
+                output.append(instruct)
+            output.extend(left_over)
+            instructs.clear()
+            notes.clear()
+
+        for line in lines:
+            if line.startswith("//"):
+                comments.append(line)
+            elif line.startswith("("):
+                # labels are barriers
+                flush()
+                output.extend(comments)
+                output.append(line)
+                comments = []
+            elif line:
+                instructs.append(line)
+                notes.append(comments)
+                comments = []
+        flush()
+        output.extend(comments)
+        lines = output
+    return "".join(line + "\n" for line in lines), saved
+
+
+def count_instructs(code: str) -> int:
+    return sum(1 for line in code.splitlines()
+               if line and not line.startswith(("//", "(")))
+
+
+def report(n_before: int, saved: Counter) -> str:
+    total = sum(saved.values())
+    lines = [f"Peephole: {n_before} -> {n_before - total} instructions "
+             f"({total} saved, {total / max(n_before, 1):.1%})"]
+    lines += [f"    {name:<14}{n:>8}" for name, n in saved.most_common() if n]
+    return "\n".join(lines)
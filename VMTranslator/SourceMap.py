@@ -0,0 +1,76 @@
+"""
+Source maps: from the ROM addresses of a program back to its VM commands
+    (and to the Jack source, see Compiler/VMWriter).
+A source map is a JSON-lines file of records:
+    {"rom": addr, "vm": "Xxx.vm", "cmd": i}: the instructions from ROM address
+        addr on, up to the next "rom" record, come from the i-th command of
+        Xxx.vm ("vm" and "cmd" are null for the bootstrap and shared routines);
+    {"vm": "Xxx.vm", "cmd": i, "jack": "Xxx.jack", "line": l, "col": c}: the
+        commands of Xxx.vm from index i on, up to the next record of Xxx.vm,
+        come from Xxx.jack:l:c.
+While translating, the CodeWriter marks the code of each command with a
+    "//@Xxx.vm:i" comment line. The markers go through the peephole optimizer
+    like the other comments, and are replaced by the "rom" records when the
+    final code is produced (see finalize).
+"""
+
+# %% Import Libs
+
+import json
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+Record = Dict[str, object]
+
+MARKER = "//@"
+
+# %% markers
+
+def marker(file_name: str, index: int) -> str:
+    return f"{MARKER}{file_name}:{index}\n"
+
+
+def finalize(code: str, comments: bool=True) -> Tuple[str, List[Record]]:
+    '''Replaces the markers of the code by "rom" records.
+    Without comments, the other comment lines are dropped too.
+    Returns the code, and the records.'''
+    lines, records = [], []
+    source, recorded = (None, None), None
+    addr = 0
+    for line in code.splitlines():
+        if line.startswith(MARKER):
+            file_name, index = line[len(MARKER):].rsplit(":", 1)
+            source = (file_name, int(index))
+            continue
+        if line.startswith("//"):
+            if comments:
+                lines.append(line)
+            continue
+        lines.append(line)
+        if not line or line[0] == "(":
+            continue
+        if source != recorded:
+            records.append({"rom": addr, "vm": source[0], "cmd": source[1]})
+            recorded = source
+        addr += 1
+    return "".join(line + "\n" for line in lines), records
+
+# %% files
+
+def read(map_file_path: Path) -> List[Record]:
+    with open(map_file_path, "r") as f_map:
+        return [json.loads(line) for line in f_map if line.strip()]
+
+
+def write(map_file_path: Path, records: List[Record]) -> None:
+    with open(map_file_path, "w") as f_map:
+        f_map.write("".join(json.dumps(record) + "\n" for record in records))
+    print(f"Source map written to: {map_file_path}")
+
+
+def vm_map_path(vm_file_path: Path) -> Optional[Path]:
+    '''Returns the path of the source map of a .vm file (see Compiler/VMWriter),
+    if it exists.'''
+    map_file_path = vm_file_path.with_suffix(".vm.map")
+    return map_file_path if map_file_path.exists() else None
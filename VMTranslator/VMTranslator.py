@@ -3,47 +3,123 @@
 import argparse
 
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
-from Parser import Parser
+from Parser import parse_file
 from MyTypes import CmdType
 from CodeWriter import CodeWriter
 
+import Idioms
+import Peephole
+import Linker
+import Inliner
+import SourceMap
+import dnchg
+
+# %% vm command processing
+
+def write_command(writer: CodeWriter, cmd_t: CmdType, arg1: str, arg2: int):
+    if cmd_t == CmdType.C_ARITHMETIC:
+        writer.write_arithmetic(arg1)
+    elif (cmd_t == CmdType.C_PUSH) or (cmd_t == CmdType.C_POP):
+        writer.write_push_pop(cmd_t, arg1, arg2)
+    elif cmd_t == CmdType.C_LABEL:
+        writer.write_label(arg1)
+    elif cmd_t == CmdType.C_GOTO:
+        writer.write_goto(arg1)
+    elif cmd_t == CmdType.C_IF:
+        writer.write_if(arg1)
+    elif cmd_t == CmdType.C_FUNCTION:
+        writer.write_function(arg1, arg2)
+    elif cmd_t == CmdType.C_RETURN:
+        writer.write_return()
+    elif cmd_t == CmdType.C_CALL:
+        writer.write_call(arg1, arg2)
+    else:
+        raise Exception(f"Unrecognized command type: [{cmd_t.name}]")
+
+
+def translate_commands(commands, file_name: str, writer: CodeWriter, origins=None):
+    '''Translates in-memory VM commands [(cmd_type, arg1, arg2)] of a .vm file.
+    cmd_type may be any enum sharing the codes of CmdType.
+    With an optimizing writer, the common multi-command idioms are
+        translated as superinstructions (see Idioms).
+    With a source-mapping writer, the code of every command is marked with
+        its index in the source file: origins[i] (by default i) for the
+        i-th command (see SourceMap).'''
+    writer.set_file_name(file_name)
+    if commands and type(commands[0][0]) is not CmdType:
+        to_cmd_type = {cmd_t: CmdType(cmd_t.value) for cmd_t in type(commands[0][0])}
+        commands = [(to_cmd_type[cmd_t], arg1, arg2) for cmd_t, arg1, arg2 in commands]
+    mark = source_marker(file_name, writer, origins)
+    if not writer.optimize and mark is None:
+        for command in commands:
+            write_command(writer, *command)
+        return
+    i = 0
+    while i < len(commands):
+        if mark is not None:
+            mark(i)
+        m = Idioms.match(commands, i, writer) if writer.optimize else None
+        if m is not None:
+            name, n, code = m
+            # the instructions of the unfused commands (for the report)
+            baseline = writer.render(lambda: [write_command(writer, *cmd) for cmd in commands[i:i+n]])
+            writer.write_idiom(name, code, Peephole.count_instructs(baseline))
+            i += n
+            continue
+        write_command(writer, *commands[i])
+        i += 1
+
+
+def source_marker(file_name: str, writer: CodeWriter, origins=None):
+    # returns mark(i), writing the source of the i-th command when it changes
+    # (an inlined copy comes from a single call), or None without source map
+    if not writer.source_map:
+        return None
+    last = [None]
+    def mark(i):
+        origin = origins[i] if origins is not None else i
+        if origin != last[0]:
+            writer.write_source(file_name, origin)
+            last[0] = origin
+    return mark
+
 # %% vm file processing
 
 def process_vm_file(vm_file_path: Path, writer: CodeWriter):
 
     print(f"Parsing [{vm_file_path}]... ", end="")
+    translate_commands(parse_file(vm_file_path), vm_file_path.name, writer)
+    print("done...")
 
-    parser = Parser(vm_file_path)
-    writer.set_file_name(vm_file_path.name)
-
-    while parser.has_more_lines():
-        parser.advance()
-        if not parser.is_curr_cmd_valid():
-            continue
-        cmd_t = parser.command_type()
-        if cmd_t == CmdType.C_ARITHMETIC:
-            writer.write_arithmetic(parser.arg1())
-        elif (cmd_t == CmdType.C_PUSH) or (cmd_t == CmdType.C_POP):
-            writer.write_push_pop(cmd_t, parser.arg1(), parser.arg2())
-        elif cmd_t == CmdType.C_LABEL:
-            writer.write_label(parser.arg1())
-        elif cmd_t == CmdType.C_GOTO:
-            writer.write_goto(parser.arg1())
-        elif cmd_t == CmdType.C_IF:
-            writer.write_if(parser.arg1())
-        elif cmd_t == CmdType.C_FUNCTION:
-            writer.write_function(parser.arg1(), parser.arg2())
-        elif cmd_t == CmdType.C_RETURN:
-            writer.write_return()
-        elif cmd_t == CmdType.C_CALL:
-            writer.write_call(parser.arg1(), parser.arg2())
-        else:
-            raise Exception(f"Unrecognized command type: [{cmd_t.name}]")
-
-    parser.close()
 
-    print("done...")
+def translate_file(file_name: str, commands, optimize: bool, compact: bool,
+                   source_map: bool=False, origins=None):
+    '''Translates the commands of a .vm file on their own (e.g. in a worker
+    process), in the label namespace of the file.
+    Returns the code, and the stats to link it (see CodeWriter.link).'''
+    # the labels only depend on the file, whatever the files translated before
+    dnchg.reset_if_else_ids()
+    writer = CodeWriter(None, optimize, compact, namespace=f"{Path(file_name).stem}.",
+                        bootstrap=False, source_map=source_map)
+    translate_commands(commands, file_name, writer, origins)
+    writer.close()
+    return writer.code, dict(writer.idiom_stats), writer.peephole_stats
+
+
+def translate_in_parallel(files, writer: CodeWriter, jobs: int, origins=None):
+    '''Translates the files {.vm file name: commands} on a pool of processes,
+    and links their code after the bootstrap code of writer, in the order of
+    the file names (so that the output does not depend on the scheduling).'''
+    file_names = sorted(files)
+    n = len(file_names)
+    origins = origins or {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for result in pool.map(translate_file, file_names, [files[name] for name in file_names],
+                               [writer.optimize]*n, [writer.compact]*n, [writer.source_map]*n,
+                               [origins.get(name) for name in file_names]):
+            writer.link(*result)
 
 # %% main
 
@@ -52,24 +128,69 @@ def _main():
     # argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("file")
+    parser.add_argument("--opt", help="Set to run the peephole optimizer", action="store_true")
+    parser.add_argument("--compact", help="Set to share call/return/compare routines", action="store_true")
+    parser.add_argument("--prune", help="Set to drop the functions unreachable from Sys.init", action="store_true")
+    parser.add_argument("--inline", help="Set to inline the leaf functions of at most N commands",
+                        type=int, nargs="?", const=Inliner.MAX_SIZE, default=0, metavar="N")
+    parser.add_argument("--jobs", "-j", help="Number of processes translating the files in parallel",
+                        type=int, default=1)
+    parser.add_argument("--map", help="Set to write the source map of the program to Xxx.map",
+                        action="store_true")
+    parser.add_argument("--no-comments", help="Set to leave no comment in the assembly code",
+                        dest="comments", action="store_false")
     options = parser.parse_args()
 
     # path processing
     input_path = Path(options.file)
     if input_path.is_dir():
-        vm_files = input_path.glob("*.vm")
+        vm_files = list(input_path.glob("*.vm"))
         asm_file_path = (input_path/input_path.name).with_suffix(".asm")
     else:
         vm_files = [input_path]
         asm_file_path = input_path.with_suffix(".asm")
 
-    writer = CodeWriter(asm_file_path)
-
-    for vm_file in vm_files:
-        process_vm_file(vm_file, writer)
+    writer = CodeWriter(asm_file_path, options.opt, options.compact,
+                        source_map=options.map, comments=options.comments)
+
+    if options.prune or options.inline or options.jobs > 1:
+        # link the whole program first, then translate the functions kept
+        files = {vm_file.name: parse_file(vm_file) for vm_file in vm_files}
+        # the index of every command in its source file (for the source map)
+        origins = {name: list(range(len(commands))) for name, commands in files.items()} \
+            if options.map else None
+        reports = []
+        if options.inline:
+            files, inline_report = Inliner.inline(files, options.inline, origins)
+            reports.append(inline_report)
+        if options.prune:
+            files, link_report = Linker.prune(files, origins=origins)
+            reports.append(link_report)
+        if options.jobs > 1:
+            translate_in_parallel(files, writer, options.jobs, origins)
+        else:
+            for file_name, commands in files.items():
+                translate_commands(commands, file_name, writer, origins and origins[file_name])
+        if reports:
+            print("\n".join(reports))
+    else:
+        for vm_file in vm_files:
+            process_vm_file(vm_file, writer)
 
     writer.close()
 
+    if options.map:
+        # the ROM records, then the Jack records of the compiled files
+        records = writer.rom_map
+        for vm_file in vm_files:
+            vm_map_file = SourceMap.vm_map_path(vm_file)
+            if vm_map_file is not None:
+                records += SourceMap.read(vm_map_file)
+        SourceMap.write(asm_file_path.with_suffix(".map"), records)
+
+    if options.opt:
+        print(writer.idiom_report)
+        print(writer.peephole_report)
     print(f"File written to: {asm_file_path}")
 
 # %% run main
@@ -46,17 +46,30 @@ def assign_d2var(var):
         "M=D\n"
     )
 
-def if_else(j_cond, t_part, f_part):
+def reset_if_else_ids(count=0):
+    # the next id is count + 1
+    if_else.count = count
+
+def last_if_else_id():
+    return getattr(if_else, "count", 0)
+
+def next_if_else_id():
     if not hasattr(if_else, "count"):
         if_else.count = 0
     if_else.count += 1  # add attribution to a function
+    return if_else.count
+
+def if_else(j_cond, t_part, f_part, label_id=None):
+    # label_id: the number of the labels (the next one by default)
+    if label_id is None:
+        label_id = next_if_else_id()
     return (
-        f"@__IF_TRUE_{if_else.count}\n" +
+        f"@__IF_TRUE_{label_id}\n" +
         f"D;{j_cond}\n" +
         f_part +
-        f"@__CONTINUE_{if_else.count}\n" +
+        f"@__CONTINUE_{label_id}\n" +
         "0;JMP\n" +
-        f"(__IF_TRUE_{if_else.count})\n" +
+        f"(__IF_TRUE_{label_id})\n" +
         t_part +
-        f"(__CONTINUE_{if_else.count})\n"
+        f"(__CONTINUE_{label_id})\n"
     )
@@ -1,38 +1,225 @@
 """
 Compile .jack file into binary codes.
+By default, the stages Jack -> VM -> ASM -> Hack run in-process and hand
+    their outputs to each other in memory; only the requested artifacts
+    (--emit vm asm hack map) are written to disk.
+The .jack files compiled before with the same options are read back from the
+    build cache (see Compiler/BuildCache, shared with JackCompiler), whose
+    blobs stay in .jackcache; --no-cache compiles them all.
+With --subprocess, the stand-alone tools are run one after another.
 """
 
 # %% import libs
 
 from pathlib import Path
 from argparse import ArgumentParser
+from functools import lru_cache
+from typing import Dict, Iterable
 
+import sys
+import shutil
+import importlib
 import subprocess
 
+# %% software paths
+
+P_HACK = Path(__file__).parent
+
+# %% tool loading
+
+def load_modules(tool_dir: Path, *names):
+    '''Imports the given modules of a tool folder.
+    Note: The tools use flat imports and share module names (e.g. MyTypes,
+          Parser), so each tool's modules are dropped from sys.modules once
+          imported; the returned modules keep their own references.
+    '''
+    sys.path.insert(0, str(tool_dir))
+    try:
+        modules = [importlib.import_module(name) for name in names]
+    finally:
+        sys.path.remove(str(tool_dir))
+        for name, module in [*sys.modules.items()]:
+            if Path(getattr(module, "__file__", None) or "").parent == tool_dir:
+                del sys.modules[name]
+    return modules
+
+
+@lru_cache(maxsize=None)
+def load_tools():
+    compiler, vm_writer, build_cache = load_modules(
+        P_HACK / "Compiler", "CompilationEngine", "VMWriter", "BuildCache")
+    vm_translator, code_writer, linker, inliner, source_map = load_modules(
+        P_HACK / "VMTranslator", "VMTranslator", "CodeWriter", "Linker", "Inliner", "SourceMap")
+    assembler, = load_modules(P_HACK / "HackAssembler", "HackAssembler")
+    return compiler, vm_writer, build_cache, vm_translator, code_writer, linker, inliner, \
+        source_map, assembler
+
+# %% in-process pipeline
+
+def output_paths(f_jack: Path):
+    '''Returns the (.asm, .hack) paths for a .jack file or a folder.'''
+    if f_jack.is_dir():
+        f_asm = f_jack / f"{f_jack.name}.asm"
+    else:
+        f_asm = f_jack.with_suffix(".asm")
+    return f_asm, f_asm.with_suffix(".hack")
+
+
+def build(f_jack: Path, emit: Iterable[str]=("hack",), optimize: bool=False,
+          compact: bool=False, prune: bool=False, inline: int=0,
+          comments: bool=True, cache: bool=True, const_statics: bool=False) -> Dict[str, object]:
+    '''Compiles .jack file(s) into binary codes in-process.
+    Returns the in-memory artifacts:
+        "vm"  : {class name: [(cmd_type, arg1, arg2)]},
+        "asm" : assembly code,
+        "hack": array('H') of binary code,
+        "map" : the source map records, if "map" is in emit (see SourceMap);
+    and writes the ones listed in emit ("vm", "asm", "hack", "map") to disk.
+    With optimize, the constant expressions are folded, and the assembly code
+        goes through the peephole optimizer; with const_statics too, the
+        statics set to a constant by Xxx.init are propagated (see Compiler/Passes).
+    With compact, call/return/eq/gt/lt jump to shared routines.
+    With prune, the functions unreachable from Sys.init are not translated
+        (the "vm" artifact keeps all of them).
+    With inline, the calls to the leaf functions of at most inline commands
+        are replaced by their bodies.
+    Without comments, no comment is left in the assembly code.
+    With cache, the VM code of the .jack files compiled before (with the same
+        options) is read from the build cache, and the new builds are cached.
+    '''
+    compiler, vm_writer, build_cache, vm_translator, code_writer, linker, inliner, \
+        source_map, assembler = load_tools()
+    emit = set(emit)
+    with_map = "map" in emit
+    f_asm, f_hack = output_paths(f_jack)
+    jack_files = [*f_jack.glob("*.jack")] if f_jack.is_dir() else [f_jack]
+    # Jack -> VM
+    vm = {}
+    jack_map = []  # the Jack records of the source map
+    if cache:
+        # the same options as JackCompiler, so that both share the cached builds
+        src_dir = f_jack if f_jack.is_dir() else f_jack.parent
+        cache = build_cache.BuildCache(src_dir, {"xml": False, "opt": optimize, "map": with_map,
+                                                 "const-statics": const_statics})
+    for jack_file in jack_files:
+        vm_file = jack_file.with_suffix(".vm")
+        blobs = cache.load(jack_file) if cache else None
+        if blobs:
+            vm[jack_file.stem] = vm_translator.parse_file(blobs[".vm"])
+            if with_map:
+                jack_map += source_map.read(blobs[".vm.map"])
+            if "vm" in emit:
+                shutil.copyfile(blobs[".vm"], vm_file)
+                print(f"VM file written to [{vm_file}]")
+            continue
+        writer = vm_writer.VMWriter(vm_file if "vm" in emit else None)
+        engine = compiler.CompilationEngine(jack_file, vm_writer=writer, optimize=optimize,
+                                            const_statics=const_statics)
+        engine.compile_class()
+        engine.close()
+        if cache:
+            outputs = {".vm": writer.to_text()}
+            if with_map:
+                outputs[".vm.map"] = writer.map_text(vm_file.name, jack_file.name)
+            cache.store_outputs(jack_file, outputs)
+        vm[jack_file.stem] = writer.commands
+        jack_map += writer.source_map(f"{jack_file.stem}.vm", jack_file.name)
+    if cache:
+        cache.close()
+    # VM -> ASM
+    writer = code_writer.CodeWriter(f_asm if "asm" in emit else None, optimize, compact,
+                                    source_map=with_map, comments=comments)
+    files = {f"{cls_name}.vm": commands for cls_name, commands in vm.items()}
+    # the index of every command in its .vm file (for the source map)
+    origins = {name: list(range(len(commands))) for name, commands in files.items()} \
+        if with_map else None
+    if inline:
+        files, inline_report = inliner.inline(files, inline, origins)
+        print(inline_report)
+    if prune:
+        files, link_report = linker.prune(files, origins=origins)
+        print(link_report)
+    for file_name, commands in files.items():
+        vm_translator.translate_commands(commands, file_name, writer, origins and origins[file_name])
+    writer.close()
+    if optimize:
+        print(writer.idiom_report)
+        print(writer.peephole_report)
+    if "asm" in emit:
+        print(f"File written to: {f_asm}")
+    asm = writer.code
+    # ASM -> Hack
+    hack = assembler.assemble(asm.split("\n"))
+    if "hack" in emit:
+        with open(f_hack, 'w') as f:
+            f.write(assembler.to_text(hack))
+        print(f"File written to: {f_hack}")
+    artifacts = {"vm": vm, "asm": asm, "hack": hack}
+    if with_map:
+        artifacts["map"] = writer.rom_map + jack_map
+        source_map.write(f_asm.with_suffix(".map"), artifacts["map"])
+    return artifacts
+
+# %% subprocess pipeline
+
+def build_with_subprocesses(f_jack: Path, optimize: bool=False, compact: bool=False,
+                            prune: bool=False, inline: int=0, with_map: bool=False,
+                            comments: bool=True, const_statics: bool=False):
+    # software paths
+    compiler = P_HACK / "Compiler/JackCompiler.py"
+    vm_translator = P_HACK / "VMTranslator/VMTranslator.py"
+    assembler = P_HACK / "Assembler/x64/Release/Assembler.exe"
+    # file paths
+    f_vm = f_jack if f_jack.is_dir() else f_jack.with_suffix(".vm")
+    f_asm, _ = output_paths(f_jack)
+    # software calls
+    flags = ["--opt"] if optimize else []
+    flags += ["--map"] if with_map else []
+    compiler_flags = ["--const-statics"] if const_statics else []
+    subprocess.run([sys.executable, compiler, f_jack, *flags, *compiler_flags], check=True)
+    flags += ["--no-comments"] if not comments else []
+    flags += ["--compact"] if compact else []
+    flags += ["--prune"] if prune else []
+    flags += ["--inline", str(inline)] if inline else []
+    subprocess.run([sys.executable, vm_translator, f_vm, *flags], check=True)
+    if assembler.exists():
+        subprocess.run([assembler, f_asm], check=True)
+    else:  # e.g. on Linux
+        subprocess.run([sys.executable, P_HACK / "HackAssembler/HackAssembler.py", f_asm], check=True)
+
 # %% main program
 
 def _main():
     # CLI args
     parser = ArgumentParser()
     parser.add_argument("jack_files", help="Jack file(s) path.", type=str)
+    parser.add_argument("--emit", help="Artifacts written to disk (in-process mode).",
+                        nargs="+", choices=["vm", "asm", "hack", "map"], default=["hack"])
+    parser.add_argument("--subprocess", help="Run the stand-alone tools in subprocesses.",
+                        action="store_true")
+    parser.add_argument("--opt", help="Fold constant expressions, and run the peephole optimizer.",
+                        action="store_true")
+    parser.add_argument("--const-statics", help="With --opt, propagate the constant statics set by "
+                        "Xxx.init (assumes that Xxx.init runs first).", action="store_true")
+    parser.add_argument("--compact", help="Share call/return/compare routines in the assembly code.",
+                        action="store_true")
+    parser.add_argument("--prune", help="Drop the functions unreachable from Sys.init.",
+                        action="store_true")
+    parser.add_argument("--inline", help="Inline the leaf functions of at most N VM commands.",
+                        type=int, nargs="?", const=20, default=0, metavar="N")  # see Inliner.MAX_SIZE
+    parser.add_argument("--no-comments", help="Leave no comment in the assembly code.",
+                        dest="comments", action="store_false")
+    parser.add_argument("--no-cache", help="Compile without the build cache (in-process mode).",
+                        dest="cache", action="store_false")
     args = parser.parse_args()
-    # software paths
-    p_hack = Path(__file__).parent
-    compiler = p_hack / "Compiler/JackCompiler.py"
-    vm_translator = p_hack / "VMTranslator/VMTranslator.py"
-    assembler = p_hack / "Assembler/x64/Release/Assembler.exe"
-    # file paths
+    # build
     f_jack = Path(args.jack_files)
-    if f_jack.is_dir():
-        f_vm = f_jack
-        f_asm = f_jack / f"{f_jack.name}.asm"
+    if args.subprocess:
+        build_with_subprocesses(f_jack, args.opt, args.compact, args.prune, args.inline,
+                                "map" in args.emit, args.comments, args.const_statics)
     else:
-        f_vm = f_jack.with_suffix(".vm")
-        f_asm = f_jack.with_suffix(".asm")
-    # software calls
-    subprocess.run(["python", compiler, f_jack], check=True)
-    subprocess.run(["python", vm_translator, f_vm], check=True)
-    subprocess.run([assembler, f_asm], check=True)
+        build(f_jack, args.emit, args.opt, args.compact, args.prune, args.inline, args.comments,
+              args.cache, args.const_statics)
 
 if __name__ == "__main__":
     _main()
@@ -0,0 +1,270 @@
+"""
+Helpers of the tests: small Jack programs are built with jcc.build (in-process)
+    and run headlessly on the CPU emulator.
+A test program has its own Sys class (without the OS): Sys.init calls
+    Main.main, then loops forever; Main.main writes its results from
+    RAM[RESULTS] on (see run_jack).
+The VM test program (VM_SOURCES) is written the same way, and translated
+    in-process (see run_vm).
+"""
+
+# %% import libs
+
+import sys
+
+from pathlib import Path
+from typing import Dict, List
+
+P_HACK = Path(__file__).parent.parent
+sys.path.insert(0, str(P_HACK))
+
+import jcc
+
+cpu_emulator, intrinsics = jcc.load_modules(P_HACK / "Emulator", "CPUEmulator", "Intrinsics")
+vm_parser, = jcc.load_modules(P_HACK / "VMTranslator", "Parser")
+
+# %% constants
+
+RESULTS = 2030  # the results of a test program, RAM[2030..2039]
+N_RESULTS = 10
+MAX_CYCLES = 1_000_000
+
+SYS_JACK = """
+class Sys {
+    function void init() {
+        do Main.main();
+        while (true) {}
+    }
+}
+"""
+
+# %% building and running
+
+def write_classes(src_dir: Path, classes: Dict[str, str]) -> Path:
+    '''Writes {class name: Jack source} (plus the test Sys class) to src_dir.'''
+    for name, source in {"Sys": SYS_JACK, **classes}.items():
+        (src_dir / f"{name}.jack").write_text(source)
+    return src_dir
+
+
+def run_asm(asm: str, cycles: int=MAX_CYCLES, natives=None):
+    '''Assembles and runs a program; returns the emulator.'''
+    assembler = jcc.load_tools()[-1]
+    symbols = {}
+    rom = assembler.assemble(asm.split("\n"), symbols)
+    emulator = cpu_emulator.CPUEmulator(rom, symbols, natives)
+    emulator.run(cycles)
+    return emulator
+
+
+def run_jack(src_dir: Path, classes: Dict[str, str], cycles: int=MAX_CYCLES, **options) -> List[int]:
+    '''Builds the classes with jcc.build(**options), runs the program, and
+    returns its results (as signed values).'''
+    artifacts = jcc.build(write_classes(src_dir, classes), emit=(), **options)
+    return results(run_asm(artifacts["asm"], cycles))
+
+
+def results(emulator) -> List[int]:
+    '''The results of a test program (as signed values).'''
+    return [emulator.peek(RESULTS + i) for i in range(N_RESULTS)]
+
+
+def main_class(body: str, var_decs: str="") -> str:
+    '''A Main class whose main function runs body, with the Array r at RESULTS.'''
+    return f"""
+class Main {{
+    function void main() {{
+        var Array r;
+        {var_decs}
+        let r = {RESULTS};
+        {body}
+        return;
+    }}
+}}
+"""
+
+# %% VM programs
+
+def vm_files(sources: Dict[str, str]):
+    '''Parses {.vm file name: VM code} into {.vm file name: commands}.'''
+    return {file_name: vm_parser.parse(source.splitlines()) for file_name, source in sources.items()}
+
+
+def translate_vm(files, **options) -> str:
+    '''Translates the .vm files {file name: commands} with a CodeWriter(**options);
+    returns the assembly code.'''
+    vm_translator, code_writer = jcc.load_tools()[3:5]
+    code_writer.dnchg.reset_if_else_ids()
+    writer = code_writer.CodeWriter(None, **options)
+    for file_name, commands in files.items():
+        vm_translator.translate_commands(commands, file_name, writer)
+    writer.close()
+    return writer.code
+
+
+def run_vm(files, cycles: int=MAX_CYCLES, **options) -> List[int]:
+    '''Translates the .vm files (see translate_vm), runs the program, and
+    returns its results (as signed values).'''
+    return results(run_asm(translate_vm(files, **options), cycles))
+
+
+# a program using every kind of VM command, and every idiom of Idioms
+VM_SOURCES = {
+    "Sys.vm": """
+        function Sys.init 0
+        call Main.main 0
+        pop temp 0
+        label HALT
+        goto HALT
+    """,
+    "Main.vm": f"""
+        function Main.main 5
+        // r[0] = Main.fib(10)
+        push constant {RESULTS}
+        push constant 0
+        add
+        push constant 10
+        call Main.fib 1
+        pop temp 0
+        pop pointer 1
+        push temp 0
+        pop that 0
+        // local 1 = 0 + 1 + ... + 9, counting with local 4
+        push constant 10
+        pop temp 1
+        label LOOP
+        push local 4
+        push temp 1
+        lt
+        not
+        if-goto DONE
+        push local 1
+        push local 4
+        add
+        pop local 1
+        push local 4
+        push constant 1
+        add
+        pop local 4
+        goto LOOP
+        label DONE
+        // r[1] = local 1
+        push local 1
+        push constant {RESULTS + 1}
+        pop pointer 1
+        pop that 0
+        // r[2] = 20000 > -20000 (false: x - y overflows)
+        push constant 20000
+        push constant 20000
+        neg
+        gt
+        push constant {RESULTS + 2}
+        pop pointer 1
+        pop that 0
+        // r[3] = Main.max(3, 4)
+        push constant 3
+        push constant 4
+        call Main.max 2
+        push constant {RESULTS + 3}
+        pop pointer 1
+        pop that 0
+        // r[4] = (7 = 7) & (-20 < 20)
+        push constant 7
+        push constant 7
+        eq
+        push constant 20
+        neg
+        push constant 20
+        lt
+        and
+        push constant {RESULTS + 4}
+        pop pointer 1
+        pop that 0
+        // r[5] = Lib.bump(), the second time
+        call Lib.bump 0
+        pop temp 0
+        call Lib.bump 0
+        push constant {RESULTS + 5}
+        pop pointer 1
+        pop that 0
+        // r[6] = the static 0 of Main (not the one of Lib)
+        push constant 100
+        pop static 0
+        push static 0
+        push constant {RESULTS + 6}
+        pop pointer 1
+        pop that 0
+        // r[7] = r[0]
+        push constant {RESULTS}
+        push constant 0
+        add
+        pop pointer 1
+        push that 0
+        push constant {RESULTS + 7}
+        pop pointer 1
+        pop that 0
+        // r[8] = 8, unless ~Main.id(0)
+        push constant 0
+        call Main.id 1
+        not
+        if-goto SKIP
+        push constant 8
+        push constant {RESULTS + 8}
+        pop pointer 1
+        pop that 0
+        label SKIP
+        // r[9] = local 1 - 300
+        push local 1
+        push constant 300
+        sub
+        pop local 1
+        push local 1
+        push constant {RESULTS + 9}
+        pop pointer 1
+        pop that 0
+        push constant 0
+        return
+        function Main.fib 0
+        push argument 0
+        push constant 2
+        lt
+        if-goto BASE
+        push argument 0
+        push constant 1
+        sub
+        call Main.fib 1
+        push argument 0
+        push constant 2
+        sub
+        call Main.fib 1
+        add
+        return
+        label BASE
+        push argument 0
+        return
+        function Main.max 0
+        push argument 0
+        push argument 1
+        call Main.id 1
+        gt
+        if-goto FIRST
+        push argument 1
+        return
+        label FIRST
+        push argument 0
+        return
+        function Main.id 0
+        push argument 0
+        return
+    """,
+    "Lib.vm": """
+        function Lib.bump 0
+        push static 0
+        push constant 1
+        add
+        pop static 0
+        push static 0
+        return
+    """,
+}
+VM_RESULTS = [55, 45, 0, 4, -1, 2, 100, 55, 0, -255]
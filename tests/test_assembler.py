@@ -0,0 +1,32 @@
+# %% import libs
+
+import pytest
+
+from helpers import jcc
+
+assembler = jcc.load_tools()[-1]
+
+# %% assembling
+
+def test_encodes_instructions_and_symbols():
+    asm = """
+    // a comment
+    @2
+    D=A
+    (LOOP)
+    @x       // a variable, at 16
+    M=D+M
+    @LOOP
+    0;JMP
+    """
+    symbols = {}
+    assert list(assembler.assemble(asm.split("\n"), symbols)) == [
+        0x0002, 0xEC10, 0x0010, 0xF088, 0x0002, 0xEA87]
+    assert symbols["LOOP"] == 2 and symbols["x"] == 16
+
+
+@pytest.mark.parametrize("instruct", ["D=Q", "X=D", "D;JXX", "D=M;JMP;JMP"])
+def test_invalid_instruction_names_the_line(instruct):
+    asm = ["// line 1", "@1", "", f"  {instruct}  // line 4"]
+    with pytest.raises(Exception, match=rf"line 4: \[{instruct}\]"):
+        assembler.assemble(asm)
@@ -0,0 +1,42 @@
+# %% import libs
+
+import pytest
+
+from helpers import run_jack, main_class
+
+# %% if/while lowering (with and without --opt)
+
+IF_NONBOOLEAN = main_class("""
+        let i = 3;
+        if (i & 1) { let r[0] = 111; } else { let r[0] = 222; }
+        if (i & 4) { let r[1] = 111; } else { let r[1] = 222; }
+        if (i < 4) { let r[2] = 111; } else { let r[2] = 222; }
+        if (~(i = 3)) { let r[3] = 111; } else { let r[3] = 222; }
+""", "var int i;")
+
+WHILE_NONBOOLEAN = main_class("""
+        let j = 5;
+        let n = 0;
+        while (j) { let j = j - 1; let n = n + 1; }
+        let r[0] = n;
+        let j = 5;
+        let n = 0;
+        while (j > 0) { let j = j - 1; let n = n + 1; }
+        let r[1] = n;
+        let n = 0;
+        while ((n < 3) & (j = 0)) { let n = n + 1; }
+        let r[2] = n;
+""", "var int j, n;")
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_if_takes_any_nonzero_condition_as_true(tmp_path, optimize):
+    results = run_jack(tmp_path, {"Main": IF_NONBOOLEAN}, optimize=optimize)
+    assert results[:4] == [111, 222, 111, 222]
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_while_only_loops_on_true(tmp_path, optimize):
+    # the code of the book exits a loop on any condition but -1
+    results = run_jack(tmp_path, {"Main": WHILE_NONBOOLEAN}, optimize=optimize)
+    assert results[:3] == [0, 5, 3]
@@ -0,0 +1,44 @@
+# %% import libs
+
+import pytest
+
+from helpers import cpu_emulator, run_asm
+
+HALT = "(END)\n@END\n0;JMP\n"
+
+# %% CPU emulator
+
+def test_m_is_addressed_on_15_bits():
+    # A = -1 addresses RAM[32767]
+    emulator = run_asm("A=-1\nM=1\n@32767\nD=M\n@0\nM=D\n" + "A=-1\nD=A\nA=D-1\nM=D\n" + HALT)
+    assert emulator.halted
+    assert emulator.peek(0) == 1
+    assert emulator.peek(32766) == -1
+
+
+@pytest.mark.parametrize("x, jump, taken", [
+    (1, "JGT", True), (0, "JGT", False), (-1, "JLT", True), (0, "JEQ", True),
+    (5, "JNE", True), (0, "JGE", True), (-3, "JLE", True), (-3, "JGE", False),
+])
+def test_jumps(x, jump, taken):
+    emulator = run_asm(f"@{abs(x)}\nD=A\n" + ("D=-D\n" if x < 0 else "")
+                       + f"@TAKEN\nD;{jump}\n@0\nM=0\n@END\n0;JMP\n(TAKEN)\n@0\nM=1\n" + HALT)
+    assert emulator.peek(0) == int(taken)
+
+
+def test_alu_wraps_around():
+    emulator = run_asm("@32767\nD=A\nD=D+1\n@0\nM=D\nD=-D\n@1\nM=D\n" + HALT)
+    assert emulator.peek(0) == -32768
+    assert emulator.peek(1) == -32768
+
+
+def test_cycles_match_single_steps():
+    # a loop summing 1..10, run by blocks and by single instructions
+    asm = ("@10\nD=A\n@i\nM=D\n@sum\nM=0\n(LOOP)\n@i\nD=M\n@STOP\nD;JEQ\n"
+           "@sum\nM=D+M\n@i\nM=M-1\n@LOOP\n0;JMP\n(STOP)\n" + HALT)
+    by_blocks = run_asm(asm)
+    by_steps = run_asm(asm, cycles=0)
+    while not by_steps.halted:
+        by_steps.step()
+    assert by_blocks.cycles == by_steps.cycles
+    assert by_blocks.peek(17) == by_steps.peek(17) == 55  # sum
@@ -0,0 +1,53 @@
+# %% import libs
+
+import itertools
+
+import pytest
+
+from helpers import P_HACK, jcc, run_jack, main_class
+
+folding, = jcc.load_modules(P_HACK / "Compiler", "Folding")
+
+# %% constant folding
+
+VALUES = [0, 1, -1, 2, 100, -100, 20000, -20000, 32767, -32767, -32768]
+PAIRS = [(20000, -20000), (-20000, 20000), (32767, -1), (-32768, 1), (3, 5), (5, 3), (-7, -7)]
+
+
+def jack_int(value: int) -> str:
+    # -32768 has no literal
+    return "(-32767 - 1)" if value == -32768 else f"({value})"
+
+
+def test_folded_compares_match_the_cpu(tmp_path):
+    # computed at run time (x and y in variables), then folded (constants)
+    for x, y in PAIRS:
+        src_dir = tmp_path / f"{x}_{y}".replace("-", "m")
+        src_dir.mkdir()
+        results = run_jack(src_dir, {"Main": main_class(f"""
+            let x = {jack_int(x)}; let y = {jack_int(y)};
+            let r[0] = x < y; let r[1] = x > y; let r[2] = x = y;
+            let r[3] = {jack_int(x)} < {jack_int(y)};
+            let r[4] = {jack_int(x)} > {jack_int(y)};
+            let r[5] = {jack_int(x)} = {jack_int(y)};
+        """, "var int x, y;")}, optimize=True)
+        assert results[0:3] == results[3:6], (x, y)
+
+
+@pytest.mark.parametrize("x, y", list(itertools.product(VALUES, VALUES)))
+def test_fold_compare_is_the_sign_of_the_difference(x, y):
+    word = lambda v: v & 0xFFFF
+    d = folding.signed((x - y) & 0xFFFF)
+    assert folding.fold_binary('<', word(x), word(y)) == (0xFFFF if d < 0 else 0)
+    assert folding.fold_binary('>', word(x), word(y)) == (0xFFFF if d > 0 else 0)
+    assert folding.fold_binary('=', word(x), word(y)) == (0xFFFF if x == y else 0)
+
+
+@pytest.mark.parametrize("x, y", list(itertools.product(VALUES, VALUES)))
+def test_fold_arithmetic_wraps_around(x, y):
+    word = lambda v: v & 0xFFFF
+    assert folding.fold_binary('+', word(x), word(y)) == word(x + y)
+    assert folding.fold_binary('-', word(x), word(y)) == word(x - y)
+    assert folding.fold_binary('*', word(x), word(y)) == word(x * y)
+    assert folding.fold_unary('-', word(x)) == word(-x)
+    assert folding.fold_unary('~', word(x)) == word(~x)
@@ -0,0 +1,117 @@
+# %% import libs
+
+import pytest
+
+from helpers import jcc, run_vm, vm_files, VM_SOURCES, VM_RESULTS
+
+linker, inliner = jcc.load_tools()[5:7]
+vm_emulator, = jcc.load_modules(jcc.P_HACK / "Emulator", "VMEmulator")
+
+# %% inliner
+
+INLINED = {
+    "Main.vm": """
+        function Main.main 0
+        push constant 3
+        push constant 4
+        call Main.max 2
+        call Main.twice 1
+        return
+        function Main.max 0
+        push argument 0
+        push argument 1
+        gt
+        if-goto FIRST
+        push argument 1
+        return
+        label FIRST
+        push argument 0
+        return
+        function Main.twice 1
+        push argument 0
+        pop local 0
+        push local 0
+        push local 0
+        call Main.add 2
+        return
+        function Main.add 0
+        push argument 0
+        push argument 1
+        add
+        push static 0
+        add
+        return
+    """,
+}
+
+
+def calls(commands):
+    return [arg1 for cmd_t, arg1, _ in commands if cmd_t.name == "C_CALL"]
+
+
+def test_inline_replaces_the_calls_to_leaf_functions():
+    inlined, report = inliner.inline(vm_files(INLINED))
+    commands = inlined["Main.vm"]
+    main, max_, twice, add = (body for _, body in linker.split_functions(commands))
+    # Main.twice calls a function, it is not inlined
+    assert calls(main) == ["Main.twice"]
+    assert calls(twice) == []
+    # the labels are renamed, and the statics qualified with their file
+    assert ("C_LABEL", "Main.max$0$FIRST") in [(cmd_t.name, arg1) for cmd_t, arg1, _ in main]
+    assert [arg2 for cmd_t, arg1, arg2 in twice if arg1 == "static"] == [inliner.StaticRef("Main.vm", 0)]
+    assert report.splitlines()[0] == "Inliner: 2 calls to 2 functions inlined"
+
+
+def test_inline_skips_programs_using_the_high_temps():
+    source = INLINED["Main.vm"].replace("pop local 0", "pop temp 2")
+    inlined, report = inliner.inline(vm_files({"Main.vm": source}))
+    assert calls(inlined["Main.vm"]) == ["Main.max", "Main.twice", "Main.add"]
+    assert report == "Inliner: temp 2..7 in use, no call inlined"
+
+
+def test_inlined_return_does_not_jump_to_a_callee_label():
+    # Sys.init stores A.f(0) and A.f(1) at RAM[3000..3001], and returns
+    sources = {
+        "Sys": """
+            function Sys.init 0
+            push constant 0
+            call A.f 1
+            push constant 1
+            call A.f 1
+            push constant 3000
+            pop pointer 1
+            pop that 1
+            pop that 0
+            push constant 0
+            return
+        """,
+        "A": """
+            function A.f 0
+            push argument 0
+            if-goto END
+            push constant 7
+            return
+            label END
+            push constant 9
+            return
+        """,
+    }
+    inlined, _ = inliner.inline(vm_files(sources))
+    assert calls(inlined["Sys"]) == []
+    runs = []
+    for files in (vm_files(sources), inlined):
+        vm = vm_emulator.VMEmulator(files)
+        vm.run(1000)
+        assert vm.halted
+        runs.append((vm.peek(3000), vm.peek(3001), vm.sp))
+    assert runs[0][:2] == (7, 9)
+    assert runs[1] == runs[0]
+
+
+@pytest.mark.parametrize("options", [{}, {"optimize": True}, {"compact": True}])
+def test_inlined_program_runs_the_same(options):
+    inlined, _ = inliner.inline(vm_files(VM_SOURCES))
+    # the leaf functions Main.id and Lib.bump are inlined
+    assert [calls(commands) for commands in inlined.values()] == [
+        ["Main.main"], ["Main.fib", "Main.max", "Main.fib", "Main.fib"], []]
+    assert run_vm(inlined, **options) == VM_RESULTS
@@ -0,0 +1,90 @@
+# %% import libs
+
+import itertools
+import pytest
+
+from helpers import P_HACK, jcc, write_classes, main_class, RESULTS
+
+vm_emulator, = jcc.load_modules(P_HACK / "Emulator", "VMEmulator")
+
+OS_CLASSES = {path.stem: path.read_text() for path in (P_HACK / "OS").glob("*.jack")}
+SCREEN, SCREEN_SIZE = 16384, 8192
+MAX_STEPS = 50_000_000
+
+# %% intrinsics vs the Jack OS
+
+VALUES = [0, 1, -1, 2, 7, -7, 181, 1000, -1000, 20000, -20000, 32767, -32767, "(-32767 - 1)"]
+PAIRS = list(itertools.product(VALUES, VALUES))
+
+
+def calls(function, args_list, fallbacks=()):
+    '''The Jack code writing the results of function(*args) to out[0..],
+    then calling it with the arguments (run last) of the fallback paths.'''
+    lines = [f"let out[{k}] = {function}({', '.join(map(str, args))});"
+             for k, args in enumerate(args_list)]
+    lines += [f"do {function}({', '.join(map(str, args))});" for args in fallbacks]
+    return lines
+
+
+SCREEN_CALLS = [
+    "do Screen.drawPixel(0, 0);", "do Screen.drawPixel(511, 255);", "do Screen.drawPixel(17, 100);",
+    "do Screen.drawLine(3, 5, 90, 5);", "do Screen.drawLine(20, 10, 20, 40);",
+    "do Screen.drawLine(500, 250, 470, 240);", "do Screen.drawLine(7, 9, 12, 40);",
+    "do Screen.drawRectangle(100, 100, 120, 111);", "do Screen.drawRectangle(1, 2, 2, 1);",
+    "do Screen.drawCircle(255, 127, 9);", "do Screen.drawCircle(30, 30, 1);",
+    "do Screen.setColor(false);", "do Screen.drawRectangle(110, 105, 140, 108);",
+    "do Screen.drawLine(0, 127, 40, 127);", "do Screen.drawCircle(255, 127, 5);",
+    "do Screen.drawPixel(255, 127);",
+]
+
+OUTPUT_CALLS = [
+    "do Output.printChar(72);", "do Output.printChar(0);", "do Output.printString(\"Hello, Hack!\");",
+    "do Output.println();", "do Output.moveCursor(22, 60);", "do Output.printString(\"wrapping around\");",
+    "do Output.moveCursor(10, 63);", "do Output.printChar(126);", "do Output.printChar(127);",
+    "do Output.__printChar(65);", "do Output.moveCursor(22, 0);", "do Output.println();",
+    "do Output.printInt(-1234);",
+]
+
+CASES = {
+    "Math.multiply": calls("Math.multiply", PAIRS),
+    "Math.divide (fallback)": calls("Math.divide", [(x, y) for x, y in PAIRS if y != 0], [(5, 0)]),
+    "Math.sqrt (fallback)": calls("Math.sqrt", [(x,) for x in VALUES[:8:2] + [1000, 20000, 32767, 16383, 16384]],
+                       [(-1,)]),
+    "Math.abs": calls("Math.abs", [(x,) for x in VALUES]),
+    "Math.max": calls("Math.max", PAIRS),
+    "Math.min": calls("Math.min", PAIRS),
+    "Memory.peek/poke": ["do Memory.poke(3000, -5);", "let out[0] = Memory.peek(3000);"],
+    "Screen": SCREEN_CALLS + ["do Screen.clearScreen();", "do Screen.drawLine(5, 5, 100, 17);"],
+    "Screen (fallbacks)": SCREEN_CALLS + ["do Screen.drawCircle(10, 10, 11);"],
+    "Screen.drawPixel (fallback)": ["do Screen.drawPixel(100, 100);", "do Screen.drawPixel(512, 0);"],
+    "Screen.drawLine (fallback)": ["do Screen.drawLine(0, 0, 10, 256);"],
+    "Screen.drawRectangle (fallback)": ["do Screen.drawRectangle(-1, 0, 10, 10);"],
+    "Screen.drawCircle (fallback)": ["do Screen.drawCircle(100, 100, 0);"],
+    "Output": OUTPUT_CALLS,
+    "Output.moveCursor (fallback)": OUTPUT_CALLS + ["do Output.moveCursor(23, 0);"],
+}
+
+
+def run(src_dir, lines, natives):
+    main = main_class("\n".join(["let out = Array.new(200);", "let r[0] = out;", *lines, "let r[1] = 1;"]),
+                      "var Array out;")
+    artifacts = jcc.build(write_classes(src_dir, {**OS_CLASSES, "Main": main}), emit=())
+    vm = vm_emulator.VMEmulator(artifacts["vm"], natives=natives)
+    vm.run(MAX_STEPS)
+    out = vm.peek(RESULTS)
+    return ([vm.peek(out + k) for k in range(200)], vm.peek(RESULTS + 1),
+            list(vm.ram[SCREEN:SCREEN + SCREEN_SIZE]))
+
+
+@pytest.fixture(scope="module")
+def src_dir(tmp_path_factory):
+    # the OS classes are compiled once (see the build cache)
+    return tmp_path_factory.mktemp("intrinsics")
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_intrinsics_run_like_the_jack_os(src_dir, case):
+    native = run(src_dir, CASES[case], vm_emulator.INTRINSICS)
+    assert native == run(src_dir, CASES[case], None)
+    # the fallback cases end in Sys.error
+    assert native[1] == (0 if "fallback" in case else 1)
@@ -0,0 +1,111 @@
+# %% import libs
+
+import pytest
+
+from helpers import jcc, run_asm, run_jack, write_classes, main_class, RESULTS, P_HACK
+
+# %% in-process pipeline
+
+def test_build_reuses_the_cached_classes(tmp_path, capsys):
+    src_dir = write_classes(tmp_path, {"Main": main_class("let r[0] = 42;")})
+    first = jcc.build(src_dir, emit=(), optimize=True)
+    assert "Build cache: 0 hit(s), 2 miss(es)" in capsys.readouterr().out
+    second = jcc.build(src_dir, emit=(), optimize=True)
+    assert "Build cache: 2 hit(s), 0 miss(es)" in capsys.readouterr().out
+    assert first["asm"] == second["asm"]
+    # the options are part of the key
+    jcc.build(src_dir, emit=())
+    assert "Build cache: 0 hit(s), 2 miss(es)" in capsys.readouterr().out
+    # an edited class is compiled again
+    write_classes(src_dir, {"Main": main_class("let r[0] = 43;")})
+    third = jcc.build(src_dir, emit=(), optimize=True)
+    assert "Build cache: 1 hit(s), 1 miss(es)" in capsys.readouterr().out
+    assert run_asm(third["asm"]).peek(RESULTS) == 43
+
+
+def test_build_writes_only_the_requested_artifacts(tmp_path):
+    src_dir = write_classes(tmp_path, {"Main": main_class("let r[0] = 42;")})
+    for _ in range(2):  # a cold, then a warm build
+        jcc.build(src_dir, emit=("hack",))
+        assert sorted(path.name for path in src_dir.iterdir()) == \
+            [".jackcache", "Main.jack", "Sys.jack", f"{src_dir.name}.hack"]
+    jcc.build(src_dir, emit=("vm",))
+    assert (src_dir / "Main.vm").read_text().startswith("function Main.main")
+
+
+def test_build_without_cache_writes_nothing(tmp_path):
+    src_dir = write_classes(tmp_path, {"Main": main_class("let r[0] = 42;")})
+    artifacts = jcc.build(src_dir, emit=(), cache=False)
+    assert run_asm(artifacts["asm"]).peek(RESULTS) == 42
+    assert sorted(path.name for path in src_dir.iterdir()) == ["Main.jack", "Sys.jack"]
+
+# %% optimized vs baseline builds
+
+# the OS classes of the test program (with the whole OS, the baseline code
+# does not fit in the 32K words of ROM addressable by an A-instruction)
+OS_CLASSES = {name: (P_HACK / "OS" / f"{name}.jack").read_text()
+              for name in ("Memory", "Math", "Array", "String")}
+
+POINT_JACK = """
+class Point {
+    field int x, y;
+    static int count;
+
+    constructor Point new(int ax, int ay) {
+        let x = ax;
+        let y = ay;
+        let count = count + 1;
+        return this;
+    }
+
+    method int dot(Point other) { return (x * other.getX()) + (y * other.getY()); }
+    method int getX() { return x; }
+    method int getY() { return y; }
+    function int count() { return count; }
+    function int unused() { return Point.count(); }
+}
+"""
+
+MAIN_JACK = main_class("""
+        do Memory.init();
+        do Math.init();
+        let p = Point.new(12, -7);
+        let q = Point.new(-3, 250);
+        let r[0] = p.dot(q);
+        let r[1] = Main.fib(12);
+        let r[2] = Math.sqrt(30000) + (1000 / 7);
+        let r[3] = (32767 + 1) / 2;  // -16383 with Math.divide of the OS
+        let r[4] = Point.count();
+        let s = String.new(8);
+        do s.appendChar(65);
+        do s.appendChar(66);
+        let r[5] = s.length() + s.charAt(1);
+        let i = 0;
+        while (i < 20) {
+            if ((i & 1) = 0) { let r[6] = r[6] + i; } else { let r[7] = r[7] - i; }
+            let i = i + 1;
+        }
+        let r[8] = (-5 < 3) & (20000 > -20000);  // false: x - y overflows
+        let s = "-1234";
+        let r[9] = s.intValue() * 3;
+""", "var Point p, q; var String s; var int i;").replace("""    }
+}""", """    }
+
+    function int fib(int n) {
+        if (n < 2) { return n; }
+        return Main.fib(n - 1) + Main.fib(n - 2);
+    }
+}""")
+
+
+@pytest.mark.parametrize("options", [
+    {"optimize": True},
+    {"compact": True},
+    {"prune": True, "inline": 20},
+    {"optimize": True, "compact": True, "prune": True, "inline": 20, "comments": False},
+])
+def test_optimized_build_runs_like_the_baseline(tmp_path, options):
+    classes = {**OS_CLASSES, "Point": POINT_JACK, "Main": MAIN_JACK}
+    baseline = run_jack(tmp_path, classes)
+    assert baseline == [-1786, 144, 315, -16383, 2, 68, 90, -100, 0, -3702]
+    assert run_jack(tmp_path, classes, **options) == baseline
@@ -0,0 +1,70 @@
+# %% import libs
+
+from helpers import jcc, run_vm, translate_vm, vm_files, VM_SOURCES, VM_RESULTS
+
+linker = jcc.load_tools()[5]
+
+# %% pruning
+
+def function_names(files):
+    return {file_name: [name for name, _ in linker.split_functions(commands)]
+            for file_name, commands in files.items()}
+
+
+LINKED = {
+    "Sys.vm": """
+        function Sys.init 0
+        call Main.main 0
+        label HALT
+        goto HALT
+        function Sys.unused 0
+        call Lib.f 0
+        return
+    """,
+    "Main.vm": """
+        function Main.main 0
+        call Main.f 0
+        return
+        function Main.f 0
+        push constant 1
+        return
+        function Main.g 0
+        call Main.f 0
+        return
+    """,
+    "Lib.vm": """
+        function Lib.f 0
+        push constant 2
+        return
+    """,
+}
+
+
+def test_prune_drops_the_unreachable_functions():
+    files = vm_files(LINKED)
+    origins = {file_name: list(range(len(commands))) for file_name, commands in files.items()}
+    pruned, report = linker.prune(files, origins=origins)
+    assert function_names(pruned) == {"Sys.vm": ["Sys.init"], "Main.vm": ["Main.main", "Main.f"]}
+    assert pruned["Main.vm"] == files["Main.vm"][:6]
+    assert origins == {"Sys.vm": [0, 1, 2, 3], "Main.vm": [0, 1, 2, 3, 4, 5], "Lib.vm": []}
+    assert report.startswith("Linker: 3/6 functions kept, 10/19 VM commands kept")
+
+
+def test_prune_keeps_everything_without_entry_point():
+    files = vm_files({"Main.vm": LINKED["Main.vm"]})
+    pruned, _ = linker.prune(files)
+    assert pruned == files
+
+
+def test_pruned_program_runs_the_same():
+    files = vm_files({**VM_SOURCES, "Dead.vm": """
+        function Dead.f 0
+        push constant 10
+        call Main.fib 1
+        return
+    """})
+    pruned, _ = linker.prune(files)
+    assert "Dead.vm" not in pruned
+    assert {file_name: pruned[file_name] for file_name in VM_SOURCES} == vm_files(VM_SOURCES)
+    assert run_vm(pruned) == VM_RESULTS
+    assert len(translate_vm(pruned)) < len(translate_vm(files))
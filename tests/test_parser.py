@@ -0,0 +1,58 @@
+# %% import libs
+
+import re
+
+import pytest
+
+from helpers import vm_parser as parser, VM_SOURCES
+
+CmdType = parser.CmdType
+
+# %% parsing
+
+def test_decodes_every_command_type():
+    vm_code = """
+    // a comment
+
+    function Main.f 2   // 2 locals
+    push local 1
+    pop static 0
+    add
+    label LOOP
+    goto LOOP
+    if-goto END
+    call Main.g 3
+    return
+    """
+    assert parser.parse(vm_code.splitlines()) == [
+        (CmdType.C_FUNCTION, "Main.f", 2),
+        (CmdType.C_PUSH, "local", 1),
+        (CmdType.C_POP, "static", 0),
+        (CmdType.C_ARITHMETIC, "add", None),
+        (CmdType.C_LABEL, "LOOP", None),
+        (CmdType.C_GOTO, "LOOP", None),
+        (CmdType.C_IF, "END", None),
+        (CmdType.C_CALL, "Main.g", 3),
+        (CmdType.C_RETURN, None, None),
+    ]
+
+
+def test_every_command_type_is_decoded():
+    assert {cmd_t for cmd_t, _ in parser.COMMANDS.values()} == set(CmdType) - {CmdType.C_INVALID}
+
+
+@pytest.mark.parametrize("command", ["jump LOOP", "push local", "push local 1 2", "add 1",
+                                     "return 0", "label", "if-goto A B"])
+def test_invalid_command_names_the_line(command):
+    vm_code = ["// line 1", "push constant 1", "", f"  {command}  // line 4"]
+    with pytest.raises(Exception, match=rf"line 4: \[{re.escape(command)}  // line 4\]"):
+        parser.parse(vm_code)
+
+
+def test_parse_file_parses_the_whole_file(tmp_path):
+    vm_file = tmp_path / "Main.vm"
+    vm_file.write_text(VM_SOURCES["Main.vm"])
+    commands = parser.parse_file(vm_file)
+    assert commands == parser.parse(VM_SOURCES["Main.vm"].splitlines())
+    assert len(commands) == sum(1 for line in VM_SOURCES["Main.vm"].splitlines()
+                                if line.strip() and not line.strip().startswith("//"))
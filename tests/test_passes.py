@@ -0,0 +1,85 @@
+# %% import libs
+
+import pytest
+
+from helpers import jcc, run_jack, main_class, write_classes
+
+# %% optimization passes
+
+STATIC_BEFORE_INIT = """
+class Main {
+    static int k;
+
+    function void init() {
+        let k = 7;
+        return;
+    }
+
+    function int getK() {
+        return k;
+    }
+
+    function void main() {
+        var Array r;
+        let r = 2030;
+        let r[0] = Main.getK();
+        do Main.init();
+        let r[1] = Main.getK();
+        return;
+    }
+}
+"""
+
+CONSTANT_BRANCHES = main_class("""
+        if (false) { let r[0] = 1; } else { let r[0] = 2; }
+        if (2 > 1) { let r[1] = 3; }
+        while (false) { let r[2] = 4; }
+        let r[3] = (1 + 2) + (9 - 2);
+""")
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_static_read_before_init(tmp_path, optimize):
+    # nothing makes Main.init run first
+    results = run_jack(tmp_path, {"Main": STATIC_BEFORE_INIT}, optimize=optimize)
+    assert results[:2] == [0, 7]
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_constant_branches(tmp_path, optimize):
+    results = run_jack(tmp_path, {"Main": CONSTANT_BRANCHES}, optimize=optimize)
+    assert results[:4] == [2, 3, 0, 10]
+
+
+CONST_STATICS = """
+class Main {
+    static int k, n;
+
+    function void init() {
+        let k = 6;
+        let n = 1;
+        return;
+    }
+
+    function void main() {
+        var Array r;
+        do Main.init();
+        let r = 2030;
+        let r[0] = k + 1;
+        let n = n + 1;
+        let r[1] = n;
+        return;
+    }
+}
+"""
+
+
+@pytest.mark.parametrize("const_statics", [False, True])
+def test_const_statics_on_request(tmp_path, const_statics):
+    artifacts = jcc.build(write_classes(tmp_path, {"Main": CONST_STATICS}), emit=(),
+                          optimize=True, const_statics=const_statics)
+    # k is only set by init: k + 1 is folded; n is set again
+    pushes = [arg2 for _, arg1, arg2 in artifacts["vm"]["Main"] if arg1 == "constant"]
+    assert (7 in pushes) == const_statics
+    results = run_jack(tmp_path, {"Main": CONST_STATICS}, optimize=True, const_statics=const_statics)
+    assert results[:2] == [7, 2]
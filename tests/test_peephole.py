@@ -0,0 +1,123 @@
+# %% import libs
+
+import pytest
+
+from array import array
+from collections import Counter
+
+from helpers import jcc, cpu_emulator, run_asm, results, translate_vm, vm_files, VM_SOURCES, VM_RESULTS
+
+peephole, = jcc.load_modules(jcc.P_HACK / "VMTranslator", "Peephole")
+
+# %% rules
+
+PUSH_D = ["@SP", "A=M", "M=D", "@SP", "M=M+1"]
+POP_D = ["@SP", "M=M-1", "@SP", "A=M", "D=M"]
+POP_R13 = ["@R13", "M=D"] + POP_D + ["@R13", "A=M", "M=D"]
+
+# (rule, code before, code after); the snippets end with an A-instruction,
+# since some rules need the A register to be dead after them
+SNIPPETS = [
+    ("push-pop", ["@7", "D=A"] + PUSH_D + POP_D + ["@SP"],
+                 ["@7", "D=A", "@SP"]),
+    ("push-pop-seg", ["@LCL", "A=M+1", "D=M"] + PUSH_D + ["@2", "D=A", "@ARG", "D=D+M"] + POP_R13,
+                     ["@LCL", "A=M+1", "D=M", "@ARG", "A=M+1", "A=A+1", "M=D"]),
+    ("push-pop-seg", ["@LCL", "A=M", "D=M"] + PUSH_D + ["@12", "D=A", "@THAT", "D=D+M"] + POP_R13,
+                     ["@LCL", "A=M", "D=M", "@R15", "M=D", "@12", "D=A", "@THAT", "D=D+M",
+                      "@R13", "M=D", "@R15", "D=M", "@R13", "A=M", "M=D"]),
+    ("temp-fold", ["@5", "D=A", "@R13", "M=D", "@3", "D=A", "@R13", "D=D+M", "A=D", "D=M"] + PUSH_D,
+                  ["@8", "D=M"] + PUSH_D),
+    ("temp-fold", ["@5", "D=A", "@R13", "M=D", "@R13", "D=M+1"] + POP_R13,
+                  POP_D + ["@6", "M=D"]),
+    ("const-d", ["@1", "D=A", "@SP"],
+                ["D=1", "@SP"]),
+    ("sp-dec", ["@SP", "M=M-1", "@SP", "A=M", "D=M"],
+               ["@SP", "AM=M-1", "D=M"]),
+    ("sp-reuse", ["@SP", "AM=M-1", "D=M", "@SP", "A=M-1", "M=D+M"],
+                 ["@SP", "AM=M-1", "D=M", "A=A-1", "M=D+M"]),
+    ("push-inc", ["@9", "D=A"] + PUSH_D + ["@SP"],
+                 ["@9", "D=A", "@SP", "M=M+1", "A=M-1", "M=D", "@SP"]),
+]
+
+
+def rewrite(name, instructs):
+    code, saved = peephole.optimize("\n".join(instructs), [[name]])
+    return code.splitlines(), saved
+
+
+def run(instructs):
+    '''Runs a snippet from a set machine state; returns the state it leaves
+    (D, the pointers, the temps, the stack and the segments), without the
+    scratch registers R13..R15.'''
+    symbols = {}
+    rom = jcc.load_tools()[-1].assemble(instructs, symbols)
+    emulator = cpu_emulator.CPUEmulator(rom, symbols)
+    emulator.ram[0:5] = array('H', [260, 300, 400, 3000, 3010])
+    for address in [*range(5, 13), *range(256, 260), *range(300, 320), *range(400, 420), *range(3000, 3030)]:
+        emulator.ram[address] = address * 7
+    emulator.D = 1234
+    emulator.run(len(rom))
+    ram = emulator.ram
+    return (emulator.D, list(ram[0:13]), list(ram[256:ram[0]]),
+            list(ram[300:320]), list(ram[400:420]), list(ram[3000:3030]))
+
+
+def test_every_rule_has_a_snippet():
+    assert {name for name, _, _ in SNIPPETS} == set(peephole.RULES)
+
+
+@pytest.mark.parametrize("name, before, after", SNIPPETS)
+def test_rule_rewrites_the_snippet(name, before, after):
+    code, saved = rewrite(name, before)
+    assert code == after
+    assert saved == {name: len(before) - len(after)}
+
+
+@pytest.mark.parametrize("name, before, after", SNIPPETS)
+def test_rewritten_snippet_runs_the_same(name, before, after):
+    assert run(after) == run(before)
+
+
+@pytest.mark.parametrize("name, before", [
+    # A is read after the code
+    ("push-pop", ["@7", "D=A"] + PUSH_D + POP_D + ["M=D"]),
+    ("push-inc", PUSH_D + ["M=D"]),
+    ("const-d", ["@1", "D=A", "M=D"]),
+    # a label is a barrier
+    ("sp-dec", ["@SP", "M=M-1", "(L)", "@SP", "A=M"]),
+    # not a segment pointer
+    ("push-pop-seg", PUSH_D + ["@2", "D=A", "@R7", "D=D+M"] + POP_R13),
+])
+def test_rule_keeps_the_code(name, before):
+    code, saved = rewrite(name, before)
+    assert code == before
+    assert not saved
+
+
+def test_comments_are_kept():
+    code, _ = rewrite("sp-dec", ["// pop", "@SP", "M=M-1", "// top", "@SP", "A=M", "D=M"])
+    assert code == ["// pop", "// top", "@SP", "AM=M-1", "D=M"]
+
+# %% passes
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_optimized_program_runs_the_same(compact):
+    code = translate_vm(vm_files(VM_SOURCES), compact=compact)
+    optimized, saved = peephole.optimize(code)
+    assert results(run_asm(optimized)) == results(run_asm(code)) == VM_RESULTS
+    n_before = peephole.count_instructs(code)
+    assert peephole.count_instructs(optimized) == n_before - sum(saved.values()) < n_before
+
+
+def test_optimize_is_a_fixed_point():
+    optimized, _ = peephole.optimize(translate_vm(vm_files(VM_SOURCES)))
+    assert peephole.optimize(optimized) == (optimized, {})
+
+
+def test_report_lists_the_rules_by_savings():
+    saved = Counter({"sp-dec": 30, "const-d": 0, "push-pop": 70})
+    assert peephole.report(1000, saved).splitlines() == [
+        "Peephole: 1000 -> 900 instructions (100 saved, 10.0%)",
+        "    push-pop            70",
+        "    sp-dec              30",
+    ]
@@ -0,0 +1,44 @@
+# %% import libs
+
+import pytest
+
+from helpers import jcc, cpu_emulator, write_classes, P_HACK
+
+profiler, = jcc.load_modules(P_HACK / "Emulator", "Profiler")
+
+# %% calls
+
+# the while loops at the top of the bodies share the address of the entries
+LOOPS_JACK = """
+class Main {
+    function void main() {
+        do Main.spin(5);
+        do Main.spin(3);
+        do Main.halt();
+        return;
+    }
+
+    function int spin(int n) {
+        while (n > 0) { let n = n - 1; }
+        return n;
+    }
+
+    function void halt() {
+        while (true) {}
+        return;
+    }
+}
+"""
+
+
+@pytest.mark.parametrize("options", [{}, {"compact": True}, {"optimize": True}])
+def test_loops_at_function_entries_are_not_calls(tmp_path, options):
+    artifacts = jcc.build(write_classes(tmp_path, {"Main": LOOPS_JACK}), emit=(), **options)
+    symbols = {}
+    rom = jcc.load_tools()[-1].assemble(artifacts["asm"].split("\n"), symbols)
+    prof = profiler.Profiler(cpu_emulator.CPUEmulator(rom, symbols))
+    prof.run(100_000)
+    assert prof.calls == {"Sys.init": 1, "Main.main": 1, "Main.spin": 2, "Main.halt": 1}
+    assert prof.edges == {(profiler.ROOT, "Sys.init"): 1, ("Sys.init", "Main.main"): 1,
+                          ("Main.main", "Main.spin"): 2, ("Main.main", "Main.halt"): 1}
+    assert prof.names == [profiler.ROOT, "Sys.init", "Main.main", "Main.halt"]
@@ -0,0 +1,66 @@
+# %% import libs
+
+import pytest
+
+from helpers import jcc, main_class, write_classes, vm_files, vm_parser, translate_vm, VM_SOURCES
+
+vm_translator, code_writer, source_map, assembler = [jcc.load_tools()[i] for i in (3, 4, 7, 8)]
+
+
+def translate_with_map(files, **options):
+    '''Returns the code, and the "rom" records of the source map.'''
+    code_writer.dnchg.reset_if_else_ids()
+    writer = code_writer.CodeWriter(None, source_map=True, **options)
+    for file_name, commands in files.items():
+        vm_translator.translate_commands(commands, file_name, writer)
+    writer.close()
+    return writer.code, writer.rom_map
+
+# %% rom records
+
+def test_finalize_records_the_first_instruction_of_each_command():
+    commands = [
+        "// function Main.f 0\n(Main.f)\n",
+        "// push constant 1\n@1\nD=A\n",
+        "// label END\n(Main.f$END)\n",
+        "// goto END\n@Main.f$END\n0;JMP\n",
+    ]
+    bootstrap = "// bootstrap\n@256\nD=A\n"
+    code = bootstrap + "".join(source_map.marker("Main.vm", i) + command for i, command in enumerate(commands))
+    final, records = source_map.finalize(code)
+    assert final == bootstrap + "".join(commands)
+    assert records == [
+        {"rom": 0, "vm": None, "cmd": None},
+        {"rom": 2, "vm": "Main.vm", "cmd": 1},
+        {"rom": 4, "vm": "Main.vm", "cmd": 3},
+    ]
+    final, _ = source_map.finalize(code, comments=False)
+    assert final == "@256\nD=A\n(Main.f)\n@1\nD=A\n(Main.f$END)\n@Main.f$END\n0;JMP\n"
+
+
+@pytest.mark.parametrize("options", [{}, {"optimize": True}, {"optimize": True, "compact": True}])
+def test_rom_records_point_to_the_commands(options):
+    files = vm_files(VM_SOURCES)
+    code, records = translate_with_map(files, **options)
+    # the markers leave the code as it is
+    assert code == translate_vm(files, **options)
+    symbols = {}
+    n_rom = len(assembler.assemble(code.splitlines(), symbols))
+    addresses = [record["rom"] for record in records]
+    assert addresses == sorted(set(addresses)) and addresses[0] == 0 and addresses[-1] < n_rom
+    # Main.fib starts with its first command (a function without locals has no code)
+    commands = files["Main.vm"]
+    fib = commands.index((vm_parser.CmdType.C_FUNCTION, "Main.fib", 0))
+    assert {"rom": symbols["Main.fib"], "vm": "Main.vm", "cmd": fib + 1} in records
+
+# %% jack records
+
+def test_build_maps_the_commands_to_the_jack_lines(tmp_path):
+    artifacts = jcc.build(write_classes(tmp_path, {"Main": main_class("let r[0] = 7;")}), emit=("map",))
+    records = source_map.read(tmp_path / f"{tmp_path.name}.map")
+    assert records == artifacts["map"]
+    lines = (tmp_path / "Main.jack").read_text().splitlines()
+    jack_records = [record for record in records if record.get("jack") == "Main.jack"]
+    line = next(i for i, text in enumerate(lines, 1) if "let r[0] = 7;" in text)
+    col = lines[line - 1].index("let") + 1
+    assert [(record["line"], record["col"]) for record in jack_records].count((line, col)) == 1
@@ -0,0 +1,38 @@
+# %% import libs
+
+import pytest
+
+from helpers import jcc
+
+jack_tokenizer, = jcc.load_modules(jcc.P_HACK / "Compiler", "JackTokenizer")
+
+# %% scanning
+
+def tokens(tmp_path, source, chunk_size=None):
+    jack_file = tmp_path / "A.jack"
+    jack_file.write_text(source)
+    if chunk_size is None:
+        return jack_tokenizer.get_tokens(jack_file)
+    lexicon = jack_tokenizer.JackTokenizer.lexicon
+    return [lexicon.lexemes[i] for i, _, _ in
+            jack_tokenizer.stream_tokens(jack_file, lexicon, chunk_size)]
+
+
+@pytest.mark.parametrize("chunk_size", [None, 4, 1 << 16])
+@pytest.mark.parametrize("trailer", ["\n// trailing comment\n", "/* c */", "\n/** doc\n */  \n", ""])
+def test_trailing_comments_are_skipped(tmp_path, chunk_size, trailer):
+    source = 'class A { /* x */ field int i; // y\n }' + trailer
+    assert tokens(tmp_path, source, chunk_size) == ["class", "A", "{", "field", "int", "i", ";", "}"]
+
+
+@pytest.mark.parametrize("chunk_size", [None, 4])
+@pytest.mark.parametrize("source, message", [
+    ('let s = "";', "Empty string constant"),
+    ('let s = "abc;\n', "Unterminated string"),
+    ("let x = 1abc;", r"Unrecognized token: \[1abc\]"),
+    ("let x = 32768;", "out-of-range"),
+    ("let x = 1; /* never closed", "Unterminated comment"),
+])
+def test_invalid_tokens_are_rejected(tmp_path, chunk_size, source, message):
+    with pytest.raises(Exception, match=message):
+        tokens(tmp_path, source, chunk_size)
@@ -0,0 +1,28 @@
+# %% import libs
+
+from helpers import P_HACK, jcc, RESULTS, N_RESULTS, write_classes, run_asm, main_class
+
+vm_emulator, = jcc.load_modules(P_HACK / "Emulator", "VMEmulator")
+
+# %% VM emulator
+
+COMPARES = main_class("""
+        let x = 20000; let y = -20000;
+        let r[0] = x < y; let r[1] = x > y;
+        let r[2] = y < x; let r[3] = y > x;
+        let x = 32767; let y = -1;
+        let r[4] = x < y; let r[5] = x > y;
+        let x = 3; let y = 5;
+        let r[6] = x < y; let r[7] = x > y; let r[8] = x = y;
+        let r[9] = 1;
+""", "var int x, y;")
+
+
+def test_vm_emulator_runs_like_the_translated_code(tmp_path):
+    artifacts = jcc.build(write_classes(tmp_path, {"Main": COMPARES}), emit=())
+    cpu = run_asm(artifacts["asm"])
+    vm = vm_emulator.VMEmulator(artifacts["vm"])
+    vm.run(100_000)
+    results = [vm.peek(RESULTS + i) for i in range(N_RESULTS)]
+    assert results == [cpu.peek(RESULTS + i) for i in range(N_RESULTS)]
+    assert results[6:] == [-1, 0, 0, 1]
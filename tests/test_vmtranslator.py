@@ -0,0 +1,160 @@
+# %% import libs
+
+import sys
+import subprocess
+
+import pytest
+
+from helpers import jcc, run_asm, results, run_vm, translate_vm, vm_files, RESULTS, VM_SOURCES, VM_RESULTS
+
+vm_translator, code_writer = jcc.load_tools()[3:5]
+parser, = jcc.load_modules(jcc.P_HACK / "VMTranslator", "Parser")
+
+
+def translate(vm_code: str, optimize: bool=False, compact: bool=False) -> str:
+    # the code of a single file, without bootstrap
+    code_writer.dnchg.reset_if_else_ids()
+    writer = code_writer.CodeWriter(None, optimize, compact, bootstrap=False)
+    vm_translator.translate_commands(parser.parse(vm_code.splitlines()), "Main.vm", writer)
+    writer.close()
+    return writer.code
+
+# %% code writer
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_render_keeps_the_label_counters(compact):
+    code_writer.dnchg.reset_if_else_ids()
+    writer = code_writer.CodeWriter(None, compact=compact, bootstrap=False)
+    writer.render(lambda: [writer.write_arithmetic("eq"), writer.write_call("Main.f", 0)])
+    writer.write_arithmetic("eq")
+    writer.write_call("Main.f", 0)
+    code_writer.dnchg.reset_if_else_ids()
+    fresh = code_writer.CodeWriter(None, compact=compact, bootstrap=False)
+    fresh.write_arithmetic("eq")
+    fresh.write_call("Main.f", 0)
+    assert writer.f_asm.getvalue() == fresh.f_asm.getvalue()
+
+
+def test_idiom_stats_do_not_change_the_labels():
+    # the fused compare-if is measured unfused (see Idioms), but only the
+    # comparison written takes a label
+    code = translate("""
+        function Main.f 0
+        push argument 0
+        push argument 1
+        lt
+        if-goto SKIP
+        push argument 0
+        push argument 1
+        eq
+        return
+        label SKIP
+        push constant 0
+        return
+    """, optimize=True)
+    assert "(__IF_TRUE_1)" in code
+    assert "__IF_TRUE_2" not in code
+
+# %% code templates
+
+TEMPLATES = [code_writer.arithmetic_code, code_writer.push_pop_code, code_writer.call_frame_code]
+
+
+def test_templates_are_rendered_once():
+    for template in TEMPLATES:
+        template.cache_clear()
+    first = translate_vm(vm_files(VM_SOURCES))
+    sizes = [template.cache_info().currsize for template in TEMPLATES]
+    assert translate_vm(vm_files(VM_SOURCES)) == first
+    # the second translation only reuses the templates
+    assert [template.cache_info().currsize for template in TEMPLATES] == sizes
+    assert all(template.cache_info().hits > 0 for template in TEMPLATES)
+
+
+def test_compare_templates_get_fresh_labels():
+    code = translate("push constant 1\npush constant 2\neq\npush constant 3\neq\n")
+    assert "{n}" not in code
+    assert code.count("(__IF_TRUE_1)") == code.count("(__IF_TRUE_2)") == 1
+
+
+def test_static_templates_are_kept_by_file():
+    code = translate_vm(vm_files({"A.vm": "push static 0", "B.vm": "push static 0"}), bootstrap=False)
+    assert "@A.vm.0" in code.splitlines() and "@B.vm.0" in code.splitlines()
+
+# %% idioms
+
+IDIOMS = vm_translator.Idioms.IDIOMS
+
+
+def test_every_idiom_matches_in_the_program():
+    lines = translate_vm(vm_files(VM_SOURCES), optimize=True).splitlines()
+    assert [name for name in IDIOMS if f"// {name}" not in lines] == []
+
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("name", list(IDIOMS))
+def test_idiom_runs_like_the_unfused_commands(monkeypatch, name, compact):
+    monkeypatch.setattr(vm_translator.Idioms, "IDIOMS", {name: IDIOMS[name]})
+    assert run_vm(vm_files(VM_SOURCES), optimize=True, compact=compact) == VM_RESULTS
+
+# %% compact code
+
+ROUTINES = ["(__CALL)", "(__RETURN)", "(__EQ)", "(__GT)", "(__LT)"]
+
+
+def push_value(value: int) -> str:
+    # the VM code pushing a 16-bit signed value
+    if value == -32768:
+        return "push constant 32767\nneg\npush constant 1\nsub\n"
+    return f"push constant {abs(value)}\n" + ("neg\n" if value < 0 else "")
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_compact_program_runs_the_same(optimize):
+    assert run_vm(vm_files(VM_SOURCES), optimize=optimize, compact=True) == VM_RESULTS
+
+
+def test_compact_code_shares_the_routines():
+    inline = translate_vm(vm_files(VM_SOURCES))
+    compact = translate_vm(vm_files(VM_SOURCES), compact=True)
+    lines = compact.splitlines()
+    assert [lines.count(label) for label in ROUTINES] == [1] * len(ROUTINES)
+    assert not any(label in inline.splitlines() for label in ROUTINES)
+    assert len(lines) < len(inline.splitlines())
+
+
+@pytest.mark.parametrize("x, y", [(0, 0), (3, 5), (5, 3), (-7, -7), (20000, -20000),
+                                  (-20000, 20000), (32767, -32768), (-32768, 1)])
+def test_compact_compares_like_the_inline_code(x, y):
+    sys_vm = "function Sys.init 0\n"
+    for i, cmd in enumerate(["eq", "gt", "lt"]):
+        sys_vm += push_value(x) + push_value(y) + f"{cmd}\n"
+        sys_vm += f"push constant {RESULTS + i}\npop pointer 1\npop that 0\n"
+    sys_vm += "label HALT\ngoto HALT\n"
+    files = vm_files({"Sys.vm": sys_vm})
+    assert run_vm(files, compact=True) == run_vm(files)
+
+# %% parallel translation
+
+def translate_folder(src_dir, *flags) -> str:
+    # runs VMTranslator.py (the worker processes import it as a script)
+    subprocess.run([sys.executable, jcc.P_HACK / "VMTranslator" / "VMTranslator.py", src_dir, *flags],
+                   check=True, capture_output=True)
+    return (src_dir / f"{src_dir.name}.asm").read_text()
+
+
+@pytest.mark.parametrize("flags", [[], ["--opt"], ["--opt", "--compact"]])
+def test_parallel_translation_is_deterministic(tmp_path, flags):
+    src_dir = tmp_path / "Prog"
+    src_dir.mkdir()
+    for file_name, source in VM_SOURCES.items():
+        (src_dir / file_name).write_text(source)
+    code = translate_folder(src_dir, *flags, "--jobs", "3")
+    assert translate_folder(src_dir, *flags, "--jobs", "2") == code
+    assert results(run_asm(code)) == VM_RESULTS
+    # the files are linked in the order of their names
+    lines = code.splitlines()
+    assert lines.index("(Lib.bump)") < lines.index("(Main.main)") < lines.index("(Sys.init)")
+    # the labels of the files translated apart do not collide
+    labels = [line for line in lines if line.startswith("(")]
+    assert len(set(labels)) == len(labels)